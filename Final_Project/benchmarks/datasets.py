@@ -0,0 +1,55 @@
+import os
+
+import db
+from benchmarks import synthetic
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def dataset_name(coins, years, freq, seed):
+    return f"{coins}c_{years}y_{freq}_s{seed}"
+
+
+def dataset_path(coins, years, freq, seed):
+    return os.path.join(DATA_DIR, dataset_name(coins, years, freq, seed) + ".db")
+
+
+# =====================================================
+# BUILD
+# =====================================================
+def build(coins, years, freq="hourly", seed=42):
+    path = dataset_path(coins, years, freq, seed)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    # get_db() reads db.DB_PATH on every call, so point it at the build file
+    # for the duration of the build
+    run_path, db.DB_PATH = db.DB_PATH, tmp_path
+    try:
+        write_dataset(coins, years, freq, seed)
+    finally:
+        db.DB_PATH = run_path
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_dataset(coins, years, freq, seed):
+    # Benchmarks keep every step in prices (HOURLY bars at "hourly") next
+    # to the daily closes
+    paths = synthetic.generate(coins, 365 * years, freq, seed)
+    synthetic.write_db(paths, history_freq="native")
+
+    # Fold the WAL back into the main file so the .db can be copied alone
+    conn = db.get_db()
+    conn.execute("PRAGMA journal_mode=DELETE;")
+    conn.close()
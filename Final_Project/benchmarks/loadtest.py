@@ -0,0 +1,297 @@
+"""Replay a dashboard traffic mix against the full Flask + Dash app.
+
+    # everything offline: stub upstream + app on :5000 + load
+    python benchmarks/loadtest.py --spawn --users 50 --duration 120
+
+    # against an app you started yourself (pointed at the stub or not)
+    python benchmarks/loadtest.py --target http://127.0.0.1:5000 --users 20
+
+--spawn starts benchmarks/stub_upstream.py and the app (gunicorn when it is
+installed, else the threaded dev server) on a scratch database, waits for
+the startup history seed to finish, then runs the mix. Each virtual user
+behaves like a browser tab: it keeps ETags and delta versions between
+polls and waits --think-ms between actions. Results per scenario (count,
+errors, p50/p95/p99, throughput) are printed and written as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, UTC
+from threading import Lock, Thread
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.run import dash_payload
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+COINS = [
+    "bitcoin", "ethereum", "solana", "cardano", "dogecoin",
+    "ripple", "litecoin", "polkadot", "tron", "chainlink"
+]
+RISK_WINDOWS = [7, 30, 90, 365]
+
+# Relative weights, roughly what the milestone pages generate while open
+SCENARIOS = {
+    "market_poll": 30,
+    "market_delta": 15,
+    "history": 12,
+    "history_delta": 5,
+    "risk_metrics": 12,
+    "risk_latest": 10,
+    "dash3_update": 8,
+    "dash4_update": 5,
+    "page_load": 3,
+}
+
+APP_PORT = 5000   # mil3/mil4 call back into the API on this port
+STUB_PORT = 8900
+READY_TIMEOUT = 300
+
+
+# =====================================================
+# VIRTUAL USER
+# =====================================================
+class User:
+    def __init__(self, target):
+        self.target = target
+        self.http = requests.Session()
+        self.etags = {}
+        self.market_version = 0
+        self.history_version = 0
+
+    def get(self, path, conditional=False):
+        headers = {}
+        if conditional and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        r = self.http.get(self.target + path, headers=headers, timeout=30)
+        if conditional and r.headers.get("ETag"):
+            self.etags[path] = r.headers["ETag"]
+        return r
+
+    def market_poll(self):
+        return self.get("/api/crypto", conditional=True)
+
+    def market_delta(self):
+        r = self.get(f"/api/crypto?since={self.market_version}")
+        if r.ok:
+            self.market_version = r.json().get("version") or self.market_version
+        return r
+
+    def history(self):
+        coins = ",".join(random.sample(COINS, random.randint(1, 4)))
+        return self.get(f"/api/history?coins={coins}&days={random.choice([7, 7, 30, 90])}", conditional=True)
+
+    def history_delta(self):
+        coins = ",".join(random.sample(COINS, random.randint(1, 4)))
+        r = self.get(f"/api/history?coins={coins}&since={self.history_version}")
+        if r.ok:
+            self.history_version = r.json().get("version") or self.history_version
+        return r
+
+    def risk_metrics(self):
+        return self.get(f"/api/risk-metrics?days={random.choice(RISK_WINDOWS)}", conditional=True)
+
+    def risk_latest(self):
+        return self.get(f"/api/risk-metrics-latest?days={random.choice(RISK_WINDOWS)}", conditional=True)
+
+    def dash3_update(self):
+        end = datetime.now(UTC).date()
+        start = end - timedelta(days=random.choice([30, 90, 180]))
+        return self.http.post(self.target + "/dash3/_dash-update-component", json=dash_payload(
+            [("price-vol", "figure"), ("risk-return", "figure"), ("kpi-row", "children")],
+            [
+                ("coin-select", "value", random.sample(COINS, random.randint(2, 6))),
+                ("date-range", "start_date", str(start)),
+                ("date-range", "end_date", str(end))
+            ]
+        ), timeout=60)
+
+    def dash4_update(self):
+        outputs = [("high-risk", "children"), ("medium-risk", "children"), ("low-risk", "children"),
+                   ("total-assets", "children"), ("avg-vol", "children"), ("risk-dist", "children"),
+                   ("risk-pie", "figure"), ("last-update", "children")]
+        return self.http.post(self.target + "/dash4/_dash-update-component", json=dash_payload(
+            outputs,
+            [
+                ("btn-refresh", "n_clicks", random.randint(0, 5)),
+                ("coin-select", "value", random.sample(COINS, random.randint(2, 8)))
+            ]
+        ), timeout=60)
+
+    def page_load(self):
+        return self.get(random.choice(["/milestone1", "/milestone3", "/milestone4"]))
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, scenario, elapsed, status):
+        with self.lock:
+            self.latencies[scenario].append(elapsed)
+            self.statuses[scenario][str(status)] += 1
+            if status == "error" or int(status) >= 500:
+                self.errors[scenario] += 1
+
+    def summary(self, wall):
+        def pct(samples, q):
+            return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+
+        out = {}
+        for scenario, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            out[scenario] = {
+                "count": len(samples),
+                "errors": self.errors[scenario],
+                "rps": round(len(samples) / wall, 2),
+                "p50_ms": round(statistics.median(samples) * 1000, 2),
+                "p95_ms": round(pct(samples, 0.95), 2),
+                "p99_ms": round(pct(samples, 0.99), 2),
+                "statuses": dict(self.statuses[scenario])
+            }
+        return out
+
+
+def user_loop(target, deadline, think_ms, recorder):
+    user = User(target)
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[n] for n in names]
+    while time.monotonic() < deadline:
+        scenario = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            status = getattr(user, scenario)().status_code
+        except requests.RequestException:
+            status = "error"
+        recorder.record(scenario, time.perf_counter() - start, status)
+        time.sleep(random.expovariate(1000 / think_ms) if think_ms else 0)
+
+
+def run_load(target, users, duration, think_ms, ramp):
+    recorder = Recorder()
+    deadline = time.monotonic() + duration + ramp
+    threads = []
+    started = time.monotonic()
+    for i in range(users):
+        t = Thread(target=user_loop, args=(target, deadline, think_ms, recorder), daemon=True)
+        t.start()
+        threads.append(t)
+        if ramp:
+            time.sleep(ramp / users)
+    for t in threads:
+        t.join()
+    return recorder.summary(time.monotonic() - started)
+
+
+# =====================================================
+# SPAWNED ENVIRONMENT
+# =====================================================
+def wait_until(url, timeout, ok=lambda r: r.ok):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if ok(requests.get(url, timeout=5)):
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def spawn(args, scratch):
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_upstream.py"),
+        "--port", str(STUB_PORT), "--latency-ms", str(args.stub_latency_ms),
+        "--error-rate", str(args.stub_error_rate), "--rate-limit-rate", str(args.stub_429_rate)
+    ], cwd=PROJECT_DIR)
+
+    env = {
+        **os.environ,
+        "COINGECKO_BASE_URL": f"http://127.0.0.1:{STUB_PORT}/api/v3",
+        "CVARA_DB_DIR": scratch,
+        "CVARA_DB_PATH": os.path.join(scratch, "cvara.db"),
+        "CVARA_CACHE_DB": os.path.join(scratch, "shared_cache.db"),
+        "CVARA_CUBE_DIR": os.path.join(scratch, "cube"),
+    }
+    if shutil.which("gunicorn"):
+        cmd = ["gunicorn", "-w", str(args.workers), "-k", "gthread", "--threads", "16",
+               "-b", f"127.0.0.1:{APP_PORT}", "app:app"]
+    else:
+        cmd = [sys.executable, "-c",
+               "import app; app.kick_off_startup_tasks(); "
+               f"app.app.run(port={APP_PORT}, threaded=True, use_reloader=False)"]
+    server = subprocess.Popen(cmd, cwd=PROJECT_DIR, env=env)
+    return [stub, server]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default=f"http://127.0.0.1:{APP_PORT}")
+    parser.add_argument("--spawn", action="store_true", help="start stub upstream + app on a scratch DB")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers with --spawn")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of steady load")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds to start all users")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between actions")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stub-latency-ms", type=float, default=50)
+    parser.add_argument("--stub-error-rate", type=float, default=0)
+    parser.add_argument("--stub-429-rate", type=float, default=0)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    processes = []
+    scratch = tempfile.mkdtemp(prefix="cvara-load-") if args.spawn else None
+    try:
+        if args.spawn:
+            processes = spawn(args, scratch)
+            # Risk metrics answer 200 once the startup history seed is in
+            if not wait_until(f"{args.target}/api/risk-metrics?days=30", READY_TIMEOUT):
+                print("App did not become ready", file=sys.stderr)
+                return 1
+
+        print(f"Running {args.users} users for {args.duration:.0f}s against {args.target}", file=sys.stderr)
+        results = run_load(args.target, args.users, args.duration, args.think_ms, args.ramp)
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.wait(timeout=30)
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    for scenario, r in results.items():
+        print(f"{scenario:<15} n={r['count']:<6} err={r['errors']:<4} {r['rps']:7.2f} rps  "
+              f"p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f} ms")
+
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", "load-" + datetime.now(UTC).strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"config": vars(args), "scenarios": results}, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""Benchmarks for the risk, DB and dashboard hot paths.
+
+    python benchmarks/run.py                           # quick matrix
+    python benchmarks/run.py --full                    # 10/100/1000 coins x 1/5 years
+    python benchmarks/run.py --sizes 100x1 --repeat 10 --output base.json
+    python benchmarks/run.py --compare base.json       # exit 1 on regression
+    python benchmarks/run.py --diff base.json new.json # compare two saved runs
+
+Each dataset runs in its own process against a copy of a cached synthetic
+database (benchmarks/data/), so runs never touch database/cvara.db and
+results from different runs are comparable.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, UTC
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+QUICK_SIZES = ["10x1", "100x1"]
+FULL_SIZES = ["10x1", "10x5", "100x1", "100x5", "1000x1", "1000x5"]
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+RISK_WINDOWS = [7, 30, 90, 365]
+
+REGRESSION_THRESHOLD = 0.20   # median slower by more than 20% ...
+REGRESSION_MIN_DELTA = 0.002  # ... and by more than 2 ms (timer noise)
+
+
+# =====================================================
+# TIMING
+# =====================================================
+def time_call(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "mean": statistics.fmean(samples)
+    }
+
+
+def dash_payload(outputs, inputs):
+    # Body of a Dash multi-output callback request (_dash-update-component)
+    return {
+        "output": ".." + "...".join(f"{o}.{p}" for o, p in outputs) + "..",
+        "outputs": [{"id": o, "property": p} for o, p in outputs],
+        "inputs": [{"id": i, "property": p, "value": v} for i, p, v in inputs],
+        "changedPropIds": []
+    }
+
+
+def dash_request(client, prefix, outputs, inputs):
+    r = client.post(f"{prefix}_dash-update-component", json=dash_payload(outputs, inputs))
+    if r.status_code != 200:
+        raise RuntimeError(f"{prefix} callback returned {r.status_code}")
+
+
+# =====================================================
+# WORKER (one dataset, own process)
+# =====================================================
+def run_dataset(coins, years, freq, seed, repeat):
+    import pandas as pd
+
+    import app as app_module
+    import db
+    import mil3_dash
+    import price_cube
+    import reports
+    import return_stats
+    import rolling_risk
+    import universe
+
+    # Schema only: no startup seeding / ingestion threads, no network
+    db.create_tables()
+    app_module.db_initialized = True
+    app_module.ADMIN_TOKEN = "bench"
+    client = app_module.app.test_client()
+
+    results = {}
+
+    def bench(name, fn, n=repeat):
+        results[name] = time_call(fn, n)
+        print(f"  {name:<40} {results[name]['median'] * 1000:9.2f} ms", file=sys.stderr)
+
+    # Returns and window statistics are computed inside SQLite
+    for days in RISK_WINDOWS:
+        bench(f"load_price_from_db[{days}]", lambda d=days: app_module.load_price_from_db("bitcoin", d))
+    for days in RISK_WINDOWS:
+        bench(f"return_stats.summarize[{days}]", lambda d=days: return_stats.summarize(universe.page_ids(), d))
+    for days in (30, 365):
+        bench(f"compute_risk_payload[{days}]", lambda d=days: app_module.compute_risk_payload(d))
+
+    # Dashboard reads below slice the price cube, as in the app
+    bench("price_cube.rebuild", price_cube.rebuild, max(1, repeat // 5))
+
+    bench(
+        "POST /api/risk-metrics-batch",
+        lambda: client.post("/api/risk-metrics-batch", headers={"X-Admin-Token": "bench"}),
+        max(1, repeat // 5)
+    )
+    for days in (30, 365):
+        bench(
+            f"GET /api/risk-metrics-latest[{days}]",
+            lambda d=days: client.get(f"/api/risk-metrics-latest?days={d}")
+        )
+    bench("rolling_risk.rebuild", rolling_risk.rebuild, max(1, repeat // 5))
+    bench("GET /api/risk-history[365]", lambda: client.get("/api/risk-history?days=365"))
+
+    end = pd.Timestamp.today()
+    start = end - pd.Timedelta(days=30)
+    bench("mil3.load_price_series_db[30d]", lambda: mil3_dash.load_price_series_db("bitcoin", start, end))
+    bench("dash3 update_dashboard[10 coins]", lambda: dash_request(
+        client, "/dash3/",
+        [("price-vol", "figure"), ("risk-return", "figure"), ("kpi-row", "children")],
+        [
+            ("coin-select", "value", universe.page_ids(1, 10)),
+            ("date-range", "start_date", str(start.date())),
+            ("date-range", "end_date", str(end.date()))
+        ]
+    ))
+
+    os.makedirs(reports.REPORT_DIR, exist_ok=True)
+    coin_ids = universe.page_ids()
+    snapshots = reports.latest_runs(reports.REPORT_WINDOWS, coin_ids)
+    for fmt in reports.REPORT_FORMATS:
+        job = {
+            "job_id": f"bench{fmt}",
+            "format": fmt,
+            "coins": coin_ids,
+            "snapshots": {str(k): v for k, v in snapshots.items()}
+        }
+        bench(f"dash4 report build[{fmt}]", lambda j=job: reports.build_report(j), max(1, repeat // 5))
+
+    return results
+
+
+def worker_main(args):
+    from benchmarks import datasets
+
+    source = datasets.build(args.coins, args.years, args.freq, args.seed)
+    scratch = os.environ["CVARA_DB_DIR"]
+    shutil.copyfile(source, os.environ["CVARA_DB_PATH"])
+    print(f"{datasets.dataset_name(args.coins, args.years, args.freq, args.seed)} ({scratch})", file=sys.stderr)
+
+    results = run_dataset(args.coins, args.years, args.freq, args.seed, args.repeat)
+    print(json.dumps(results))
+
+
+def spawn_dataset(size, args):
+    coins, years = (int(x) for x in size.lower().split("x"))
+    with tempfile.TemporaryDirectory(prefix="cvara-bench-") as scratch:
+        env = {
+            **os.environ,
+            "CVARA_DB_DIR": scratch,
+            "CVARA_DB_PATH": os.path.join(scratch, "cvara.db"),
+            "CVARA_CACHE_DB": os.path.join(scratch, "shared_cache.db"),
+            "CVARA_CUBE_DIR": os.path.join(scratch, "cube"),
+            "PYTHONPATH": PROJECT_DIR + os.pathsep + os.environ.get("PYTHONPATH", "")
+        }
+        cmd = [
+            sys.executable, "-m", "benchmarks.run", "--worker",
+            "--coins", str(coins), "--years", str(years),
+            "--freq", args.freq, "--seed", str(args.seed), "--repeat", str(args.repeat)
+        ]
+        out = subprocess.run(cmd, env=env, cwd=PROJECT_DIR, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# =====================================================
+# COMPARISON
+# =====================================================
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD, min_delta=REGRESSION_MIN_DELTA):
+    rows = []
+    for dataset, benches in current["results"].items():
+        for name, stats in benches.items():
+            old = baseline["results"].get(dataset, {}).get(name)
+            if old is None:
+                continue
+            ratio = stats["median"] / old["median"] if old["median"] else float("inf")
+            regressed = ratio > 1 + threshold and stats["median"] - old["median"] > min_delta
+            rows.append({
+                "dataset": dataset,
+                "benchmark": name,
+                "baseline_ms": old["median"] * 1000,
+                "current_ms": stats["median"] * 1000,
+                "ratio": ratio,
+                "regressed": regressed
+            })
+    return rows
+
+
+def print_comparison(rows):
+    for r in rows:
+        flag = "REGRESSION" if r["regressed"] else ""
+        print(
+            f"{r['dataset']:<22} {r['benchmark']:<40} "
+            f"{r['baseline_ms']:9.2f} -> {r['current_ms']:9.2f} ms  x{r['ratio']:.2f}  {flag}"
+        )
+    regressions = [r for r in rows if r["regressed"]]
+    print(f"\n{len(rows)} compared, {len(regressions)} regression(s)")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# =====================================================
+# MAIN
+# =====================================================
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", help="comma separated COINSxYEARS, e.g. 10x1,100x5")
+    parser.add_argument("--full", action="store_true", help="run the full 10/100/1000 x 1/5 matrix")
+    parser.add_argument("--freq", default="hourly", choices=["hourly", "daily"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved run")
+    parser.add_argument("--diff", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two saved runs")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--coins", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--years", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return 0
+
+    if args.diff:
+        with open(args.diff[0]) as f:
+            baseline = json.load(f)
+        with open(args.diff[1]) as f:
+            current = json.load(f)
+        return 1 if print_comparison(compare(baseline, current, args.threshold)) else 0
+
+    sizes = FULL_SIZES if args.full else (args.sizes.split(",") if args.sizes else QUICK_SIZES)
+    run = {
+        "meta": {
+            "created_at": datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "freq": args.freq,
+            "seed": args.seed,
+            "repeat": args.repeat
+        },
+        "results": {}
+    }
+    for size in sizes:
+        run["results"][size] = spawn_dataset(size, args)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.now(UTC).strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if print_comparison(compare(baseline, run, args.threshold)) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+"""Local stand-in for the CoinGecko and Binance endpoints the project calls.
+
+    python benchmarks/stub_upstream.py --port 8900 --coins 100 --latency-ms 80 \\
+        --error-rate 0.02 --rate-limit-rate 0.05
+
+    COINGECKO_BASE_URL=http://127.0.0.1:8900/api/v3 python app.py
+    BINANCE_BASE_URL=http://127.0.0.1:8900/api/v3 python ../M1_project/generate_processed_data.py
+
+Serves /coins/markets, /coins/{id}/market_chart, /coins/{id}/ohlc,
+/simple/price (CoinGecko)
+and /klines (Binance) from deterministic synthetic prices, or from recorded
+JSON responses in --fixtures DIR (coins_markets.json, market_chart_<id>.json,
+ohlc_<id>.json, simple_price.json, klines_<SYMBOL>.json). Latency, 5xx and 429 injection
+can be changed while running: POST /__stub/config {"error_rate": 0.5}.
+GET /__stub/stats returns request counts per endpoint and status.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from threading import Lock
+
+from flask import Flask, jsonify, request
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+KNOWN_COINS = [
+    ("bitcoin", "btc", "Bitcoin", 60000),
+    ("ethereum", "eth", "Ethereum", 3000),
+    ("solana", "sol", "Solana", 150),
+    ("cardano", "ada", "Cardano", 0.45),
+    ("dogecoin", "doge", "Dogecoin", 0.12),
+    ("ripple", "xrp", "XRP", 0.55),
+    ("litecoin", "ltc", "Litecoin", 80),
+    ("polkadot", "dot", "Polkadot", 6.5),
+    ("tron", "trx", "TRON", 0.12),
+    ("chainlink", "link", "Chainlink", 14),
+]
+MINUTE_MS = 60 * 1000
+DAY_MS = 24 * 60 * MINUTE_MS
+EPOCH_DAY = 18628   # 2021-01-01; synthetic history starts here
+
+config = {
+    "latency_ms": 0.0,       # mean added latency
+    "jitter_ms": 0.0,        # +/- uniform jitter on top
+    "error_rate": 0.0,       # fraction answered with 500
+    "rate_limit_rate": 0.0,  # fraction answered with 429
+    "rate_limit_rpm": 0,     # token bucket; 0 disables
+    "seed": 7,
+    "fixtures": None
+}
+stats = Counter()
+stats_lock = Lock()
+bucket = {"tokens": 0.0, "updated": time.monotonic()}
+bucket_lock = Lock()
+
+universe = []
+by_id = {}
+by_symbol = {}
+_levels = {}
+levels_lock = Lock()
+
+
+# =====================================================
+# SYNTHETIC PRICES
+# =====================================================
+# Price at any instant is a pure function of (seed, coin, time), so every
+# stub process serves the same history and "now" keeps moving.
+def coin_seed(coin_id):
+    digest = hashlib.sha1(f"{config['seed']}:{coin_id}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def build_universe(n):
+    universe.clear()
+    for i in range(n):
+        if i < len(KNOWN_COINS):
+            coin_id, symbol, name, base = KNOWN_COINS[i]
+        else:
+            coin_id, symbol, name = f"synthetic-{i:05d}", f"s{i:05d}", f"Synthetic {i}"
+            base = 10 ** random.Random(coin_seed(coin_id)).uniform(-3, 4)
+        rng = random.Random(coin_seed(coin_id))
+        universe.append({
+            "id": coin_id,
+            "symbol": symbol,
+            "name": name,
+            "base": base,
+            "vol": rng.uniform(0.4, 1.2),   # annualised
+            "supply": rng.uniform(1e7, 1e11) / base if base else 1e9,
+            "rank": i + 1
+        })
+    by_id.clear()
+    by_id.update({c["id"]: c for c in universe})
+    by_symbol.clear()
+    by_symbol.update({(c["symbol"].upper() + "USDT"): c for c in universe})
+
+
+def noise(coin, n):
+    # Deterministic N(0,1) draw for (coin, n) via Box-Muller on a hash
+    h = hashlib.blake2b(f"{config['seed']}:{coin['id']}:{n}".encode(), digest_size=8).digest()
+    u1 = (int.from_bytes(h[:4], "big") + 1) / 2 ** 32
+    u2 = int.from_bytes(h[4:], "big") / 2 ** 32
+    return math.sqrt(-2 * math.log(u1)) * math.cos(2 * math.pi * u2)
+
+
+def daily_level(coin, day):
+    # Cumulative log-return walk from EPOCH_DAY, extended lazily per coin
+    with levels_lock:
+        levels = _levels.setdefault(coin["id"], [0.0])
+        sigma = coin["vol"] / math.sqrt(365)
+        while len(levels) <= day - EPOCH_DAY:
+            levels.append(levels[-1] + noise(coin, -len(levels)) * sigma)
+        return levels[max(day - EPOCH_DAY, 0)]
+
+
+def price_at(coin, ts_ms):
+    # Interpolate between daily anchors plus a small per-minute wiggle, so a
+    # day's price agrees whichever granularity asks for it
+    day, offset = divmod(ts_ms, DAY_MS)
+    l0, l1 = daily_level(coin, day), daily_level(coin, day + 1)
+    wiggle = noise(coin, ts_ms // MINUTE_MS) * coin["vol"] / math.sqrt(365) * 0.05
+    return round(coin["base"] * math.exp(l0 + (l1 - l0) * offset / DAY_MS + wiggle), 8)
+
+
+def series(coin, days, step_ms):
+    now = int(time.time() * 1000)
+    start = now - int(days * DAY_MS)
+    points = [[t, price_at(coin, t)] for t in range(start - start % step_ms + step_ms, now, step_ms)]
+    points.append([now, price_at(coin, now)])
+    return points
+
+
+def chart_step(days):
+    # Same automatic granularity as CoinGecko's market_chart
+    if days <= 1:
+        return 5 * MINUTE_MS
+    if days <= 90:
+        return 60 * MINUTE_MS
+    return DAY_MS
+
+
+def market_row(coin):
+    now = int(time.time() * 1000)
+    price = price_at(coin, now)
+    prev = price_at(coin, now - DAY_MS)
+    return {
+        "id": coin["id"],
+        "symbol": coin["symbol"],
+        "name": coin["name"],
+        "current_price": price,
+        "market_cap": round(price * coin["supply"], 2),
+        "market_cap_rank": coin["rank"],
+        "total_volume": round(price * coin["supply"] * 0.03, 2),
+        "price_change_percentage_24h": round((price / prev - 1) * 100, 4),
+        "last_updated": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(now / 1000))
+    }
+
+
+# =====================================================
+# FAULT INJECTION
+# =====================================================
+def rate_limited():
+    rpm = config["rate_limit_rpm"]
+    if rpm > 0:
+        with bucket_lock:
+            now = time.monotonic()
+            bucket["tokens"] = min(rpm, bucket["tokens"] + (now - bucket["updated"]) * rpm / 60)
+            bucket["updated"] = now
+            if bucket["tokens"] < 1:
+                return True
+            bucket["tokens"] -= 1
+    return random.random() < config["rate_limit_rate"]
+
+
+def load_fixture(name):
+    if not config["fixtures"]:
+        return None
+    path = os.path.join(config["fixtures"], os.path.basename(name))
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+app = Flask(__name__)
+
+
+@app.before_request
+def inject_faults():
+    if request.path.startswith("/__stub"):
+        return None
+
+    delay = config["latency_ms"] + random.uniform(-1, 1) * config["jitter_ms"]
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+    if rate_limited():
+        resp = jsonify({"status": {"error_code": 429, "error_message": "Rate limit exceeded (stub)"}})
+        resp.status_code = 429
+        resp.headers["Retry-After"] = "60"
+        return resp
+    if random.random() < config["error_rate"]:
+        return jsonify({"error": "injected failure"}), 500
+    return None
+
+
+@app.after_request
+def count(resp):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    with stats_lock:
+        stats[f"{endpoint} {resp.status_code}"] += 1
+    return resp
+
+
+# =====================================================
+# COINGECKO
+# =====================================================
+@app.route("/api/v3/coins/markets")
+def coins_markets():
+    ids = [i for i in request.args.get("ids", "").split(",") if i]
+    rows = load_fixture("coins_markets.json")
+    if rows is not None:
+        rows = [r for r in rows if r["id"] in ids] if ids else rows
+    else:
+        coins = [by_id[i] for i in ids if i in by_id] if ids else universe
+        rows = [market_row(c) for c in coins]
+
+    if request.args.get("order", "market_cap_desc") == "market_cap_desc":
+        rows = sorted(rows, key=lambda r: r.get("market_cap") or 0, reverse=True)
+
+    per_page = min(int(request.args.get("per_page", 100)), 250)
+    page = max(int(request.args.get("page", 1)), 1)
+    return jsonify(rows[(page - 1) * per_page: page * per_page])
+
+
+@app.route("/api/v3/coins/<coin_id>/market_chart")
+def market_chart(coin_id):
+    recorded = load_fixture(f"market_chart_{coin_id}.json")
+    if recorded is not None:
+        return jsonify(recorded)
+
+    coin = by_id.get(coin_id)
+    if coin is None:
+        return jsonify({"error": "coin not found"}), 404
+
+    raw_days = request.args.get("days", "1")
+    days = 3650 if raw_days == "max" else float(raw_days)
+    prices = series(coin, days, chart_step(days))
+    return jsonify({
+        "prices": prices,
+        "market_caps": [[t, round(p * coin["supply"], 2)] for t, p in prices],
+        "total_volumes": [[t, round(p * coin["supply"] * 0.03, 2)] for t, p in prices]
+    })
+
+
+def ohlc_step(days):
+    # CoinGecko's candle size for /ohlc
+    if days <= 2:
+        return 30 * MINUTE_MS
+    if days <= 30:
+        return 240 * MINUTE_MS
+    return 4 * DAY_MS
+
+
+@app.route("/api/v3/coins/<coin_id>/ohlc")
+def ohlc(coin_id):
+    recorded = load_fixture(f"ohlc_{coin_id}.json")
+    if recorded is not None:
+        return jsonify(recorded)
+
+    coin = by_id.get(coin_id)
+    if coin is None:
+        return jsonify({"error": "coin not found"}), 404
+
+    raw_days = request.args.get("days", "1")
+    days = 3650 if raw_days == "max" else float(raw_days)
+    step = ohlc_step(days)
+    now = int(time.time() * 1000)
+    # Candles are stamped with their close time, the last one still open
+    close_time = now - now % step + step
+    rows = []
+    for t in range(close_time - int(days * DAY_MS) // step * step, close_time + 1, step):
+        o, c = price_at(coin, t - step), price_at(coin, min(t, now))
+        spread = abs(noise(coin, t // MINUTE_MS + 2)) * coin["vol"] * 0.01
+        rows.append([t, round(o, 8), round(max(o, c) * (1 + spread), 8),
+                     round(min(o, c) * (1 - spread), 8), round(c, 8)])
+    return jsonify(rows)
+
+
+@app.route("/api/v3/simple/price")
+def simple_price():
+    recorded = load_fixture("simple_price.json")
+    if recorded is not None:
+        return jsonify(recorded)
+
+    currencies = [c for c in request.args.get("vs_currencies", "usd").split(",") if c]
+    with_change = request.args.get("include_24hr_change") == "true"
+    out = {}
+    for coin_id in request.args.get("ids", "").split(","):
+        coin = by_id.get(coin_id)
+        if coin is None:
+            continue
+        row = market_row(coin)
+        out[coin_id] = {}
+        for cur in currencies:
+            out[coin_id][cur] = row["current_price"]
+            if with_change:
+                out[coin_id][f"{cur}_24h_change"] = row["price_change_percentage_24h"]
+    return jsonify(out)
+
+
+# =====================================================
+# BINANCE
+# =====================================================
+KLINE_MS = {"1m": MINUTE_MS, "5m": 5 * MINUTE_MS, "15m": 15 * MINUTE_MS,
+            "1h": 60 * MINUTE_MS, "4h": 240 * MINUTE_MS, "1d": DAY_MS}
+
+
+@app.route("/api/v3/klines")
+def klines():
+    symbol = request.args.get("symbol", "").upper()
+    recorded = load_fixture(f"klines_{symbol}.json")
+    if recorded is not None:
+        return jsonify(recorded)
+
+    coin = by_symbol.get(symbol)
+    step = KLINE_MS.get(request.args.get("interval", "1d"))
+    if coin is None or step is None:
+        return jsonify({"code": -1121, "msg": "Invalid symbol."}), 400
+
+    limit = min(int(request.args.get("limit", 500)), 1000)
+    now = int(time.time() * 1000)
+    last_open = now - now % step
+    rows = []
+    for i in range(limit - 1, -1, -1):
+        open_time = last_open - i * step
+        close_time = open_time + step - 1
+        o, c = price_at(coin, open_time), price_at(coin, min(close_time, now))
+        spread = abs(noise(coin, open_time // MINUTE_MS + 1)) * coin["vol"] * 0.01
+        high, low = max(o, c) * (1 + spread), min(o, c) * (1 - spread)
+        volume = round(coin["supply"] * 0.001 * (1 + abs(noise(coin, open_time))), 4)
+        rows.append([
+            open_time, f"{o:.8f}", f"{high:.8f}", f"{low:.8f}", f"{c:.8f}", f"{volume:.4f}",
+            close_time, f"{volume * c:.4f}", 1000, f"{volume / 2:.4f}", f"{volume * c / 2:.4f}", "0"
+        ])
+    return jsonify(rows)
+
+
+# =====================================================
+# CONTROL
+# =====================================================
+@app.route("/__stub/config", methods=["GET", "POST"])
+def stub_config():
+    if request.method == "POST":
+        for key, value in (request.get_json(silent=True) or {}).items():
+            if key in ("latency_ms", "jitter_ms", "error_rate", "rate_limit_rate"):
+                config[key] = float(value)
+            elif key == "rate_limit_rpm":
+                config[key] = int(value)
+    return jsonify(config)
+
+
+@app.route("/__stub/stats", methods=["GET", "DELETE"])
+def stub_stats():
+    with stats_lock:
+        if request.method == "DELETE":
+            stats.clear()
+        return jsonify(dict(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--coins", type=int, default=len(KNOWN_COINS))
+    parser.add_argument("--seed", type=int, default=config["seed"])
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rpm", type=int, default=0)
+    parser.add_argument("--fixtures", help="directory of recorded JSON responses")
+    args = parser.parse_args()
+
+    config.update(
+        seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        rate_limit_rpm=args.rate_limit_rpm, fixtures=args.fixtures
+    )
+    bucket["tokens"] = args.rate_limit_rpm
+    build_universe(args.coins)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Seeded synthetic market data for scale testing.
+
+    python benchmarks/synthetic.py --coins 500 --days 1825 --freq hourly --seed 1 \\
+        --db /tmp/scale.db --processed-csv /tmp/crypto_processed.csv \\
+        --yfinance-csv /tmp/crypto_data.csv
+
+Prices follow a one-factor correlated jump-diffusion: every coin loads on a
+common market shock, per-coin variance follows GARCH(1,1) (volatility
+clustering) and Poisson jumps add fat tails. The same seed and arguments
+always give the same paths, so benchmark runs stay comparable.
+
+Outputs: prices (daily closes, plus every intraday step with
+--history-freq native) + market_snapshot (intraday points of the last
+SNAPSHOT_DAYS) via bulk inserts, the M1_project
+crypto_processed.csv shape and the Task_3 yfinance crypto_data.csv shape.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import db
+import universe
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+KNOWN_COINS = [
+    ("bitcoin", "BTC", "Bitcoin"), ("ethereum", "ETH", "Ethereum"),
+    ("solana", "SOL", "Solana"), ("cardano", "ADA", "Cardano"),
+    ("dogecoin", "DOGE", "Dogecoin"), ("ripple", "XRP", "XRP"),
+    ("litecoin", "LTC", "Litecoin"), ("polkadot", "DOT", "Polkadot"),
+    ("tron", "TRX", "TRON"), ("chainlink", "LINK", "Chainlink"),
+]
+STEPS_PER_DAY = {"daily": 1, "hourly": 24, "5min": 288}
+
+GARCH_ALPHA = 0.08        # reaction to the last shock
+GARCH_BETA = 0.90         # persistence; alpha + beta < 1
+JUMPS_PER_YEAR = 6
+JUMP_MEAN = -0.01         # log jump size
+JUMP_STD = 0.08
+SNAPSHOT_DAYS = 30        # market_snapshot retention used by the app
+INSERT_BATCH = 50000
+
+
+# =====================================================
+# PATHS
+# =====================================================
+def coin_universe(n):
+    coins = list(KNOWN_COINS[:n])
+    coins += [(f"synthetic-{i:05d}", f"S{i:05d}", f"Synthetic {i}") for i in range(len(coins), n)]
+    return coins
+
+
+def generate(n_coins, days, freq="daily", seed=42, end=None):
+    steps_per_day = STEPS_PER_DAY[freq]
+    n_steps = days * steps_per_day
+    steps_per_year = 365 * steps_per_day
+    dt = 1 / steps_per_year
+    rng = np.random.default_rng(seed)
+
+    ann_vol = rng.uniform(0.45, 1.3, n_coins)
+    drift = rng.uniform(-0.1, 0.5, n_coins)
+    loading = rng.uniform(0.45, 0.9, n_coins)         # correlation with the market
+    start_price = 10 ** rng.uniform(-3, 4.7, n_coins)
+    if n_coins:
+        start_price[0] = 30000                        # keep "bitcoin" in a familiar range
+
+    # GARCH(1,1) with unconditional variance = target per-step variance
+    long_var = ann_vol ** 2 * dt
+    omega = long_var * (1 - GARCH_ALPHA - GARCH_BETA)
+    var = long_var.copy()
+    idio = np.sqrt(1 - loading ** 2)
+    jump_p = JUMPS_PER_YEAR * dt
+
+    log_price = np.log(start_price)
+    close = np.empty((n_steps, n_coins))
+    for t in range(n_steps):
+        z = loading * rng.standard_normal() + idio * rng.standard_normal(n_coins)
+        shock = np.sqrt(var) * z
+        jumps = np.where(rng.random(n_coins) < jump_p, rng.normal(JUMP_MEAN, JUMP_STD, n_coins), 0.0)
+        log_price += (drift - ann_vol ** 2 / 2) * dt + shock + jumps
+        close[t] = log_price
+        var = omega + GARCH_ALPHA * shock ** 2 + GARCH_BETA * var
+    np.exp(close, out=close)
+
+    step = timedelta(days=1) / steps_per_day
+    end = end or datetime.now(UTC).replace(minute=0, second=0, microsecond=0)
+    if freq == "daily":
+        end = end.replace(hour=0)
+    index = pd.DatetimeIndex([end - step * (n_steps - 1 - i) for i in range(n_steps)])
+
+    coins = coin_universe(n_coins)
+    return {
+        "coins": coins,
+        "index": index,
+        "close": close,
+        "freq": freq,
+        "seed": seed,
+        "ann_vol": ann_vol
+    }
+
+
+def ohlcv(paths, coin):
+    # Bars around the close path: open = previous close, wicks scale with
+    # the bar's own move, volume grows with absolute return
+    close = paths["close"][:, coin]
+    rng = np.random.default_rng([paths["seed"], coin])
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    move = np.abs(np.log(close / open_))
+    wick = np.abs(rng.normal(0, 0.5, len(close))) * (move + 0.002)
+    high = np.maximum(open_, close) * np.exp(wick)
+    low = np.minimum(open_, close) * np.exp(-wick)
+    volume = close * 1e6 * np.exp(rng.normal(0, 0.4, len(close))) * (1 + 20 * move)
+    return pd.DataFrame(
+        {"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume.round()},
+        index=paths["index"]
+    )
+
+
+def daily_closes(paths):
+    frame = pd.DataFrame(paths["close"], index=paths["index"])
+    return frame.groupby(frame.index.normalize()).last()
+
+
+# =====================================================
+# SQLITE
+# =====================================================
+def write_db(paths, history_freq="daily", snapshot_days=SNAPSHOT_DAYS):
+    # Bulk load into db.DB_PATH. Daily closes always go in as DAILY bars;
+    # history_freq="native" also stores every intraday step (HOURLY bars at
+    # "hourly") for storage scale tests.
+    db.create_tables()
+    conn = db.get_db()
+    conn.execute("PRAGMA synchronous=OFF;")
+    cur = conn.cursor()
+
+    # Coins become the tracked universe, ranked in generation order
+    updated_at = int(time.time() * 1000)
+    ids = universe.upsert(cur, [
+        {"id": coin_id, "symbol": symbol, "name": name, "market_cap_rank": rank}
+        for rank, (coin_id, symbol, name) in enumerate(paths["coins"], start=1)
+    ], updated_at)
+
+    tiers = [(db.DAILY, daily_closes(paths))]
+    if history_freq == "native" and paths["freq"] != "daily":
+        # 5min steps are stored at their own granularity
+        step = db.DAILY // STEPS_PER_DAY[paths["freq"]]
+        tiers.append((step, pd.DataFrame(paths["close"], index=paths["index"])))
+
+    for granularity, history in tiers:
+        stamps = history.index.as_unit("s").asi8.tolist()
+        values = history.to_numpy()
+        for j, (coin_id, _, _) in enumerate(paths["coins"]):
+            cid = ids[coin_id]
+            rows = [(cid, granularity, ts, float(p), updated_at) for ts, p in zip(stamps, values[:, j])]
+            for i in range(0, len(rows), INSERT_BATCH):
+                cur.executemany(
+                    "INSERT INTO prices (coin_id, granularity, ts, price, updated_at) VALUES (?,?,?,?,?)",
+                    rows[i:i + INSERT_BATCH]
+                )
+
+    # Intraday tail -> market_snapshot, as the ingestion loop would have left it
+    index = paths["index"]
+    recent = index >= index[-1] - pd.Timedelta(days=snapshot_days)
+    per_day = STEPS_PER_DAY[paths["freq"]]
+    fetched = index[recent].strftime("%Y-%m-%d %H:%M:%S").tolist()
+    first = int(np.argmax(recent))
+    for j, (coin_id, _, _) in enumerate(paths["coins"]):
+        bars = ohlcv(paths, j)
+        close = paths["close"][:, j]
+        rows = []
+        for k, fetched_at in enumerate(fetched):
+            t = first + k
+            prev = close[max(t - per_day, 0)]
+            rows.append((
+                ids[coin_id], fetched_at, float(close[t]),
+                round(float(close[t] / prev - 1) * 100, 2),
+                float(bars["Volume"].iat[t])
+            ))
+        cur.executemany(
+            "INSERT INTO market_snapshot (coin_id, fetched_at, price, change_24h, volume) VALUES (?,?,?,?,?)",
+            rows
+        )
+
+    conn.commit()
+    conn.close()
+
+
+# =====================================================
+# CSV SHAPES
+# =====================================================
+def write_processed_csv(paths, path):
+    # M1_project/crypto_processed.csv, computed like generate_processed_data.py
+    closes = daily_closes(paths)
+    frames = []
+    for j, (_, _, name) in enumerate(paths["coins"]):
+        close = closes[j].to_numpy()
+        returns = np.diff(np.log(close))
+        volatility = pd.Series(returns).rolling(7).std()
+        sharpe = returns.mean() / (returns.std() + 1e-9)
+        frames.append(pd.DataFrame({
+            "Date": closes.index[1:].strftime("%Y-%m-%d %H:%M:%S"),
+            "Crypto": name,
+            "Close": close[1:],
+            "Returns": returns,
+            "Volatility": volatility.to_numpy(),
+            "Sharpe_Ratio": sharpe
+        }))
+    pd.concat(frames, ignore_index=True).to_csv(path, index=False)
+
+
+def write_yfinance_csv(paths, path, coins=None):
+    # Task_3/crypto_data.csv: yfinance download() layout with the three
+    # header rows (Price / Ticker / Date)
+    coins = coins if coins is not None else [0]
+    fields = ["Close", "High", "Low", "Open", "Volume"]
+    bars = {}
+    for j in coins:
+        daily = ohlcv(paths, j).resample("1D").agg(
+            {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+        )
+        bars[f"{paths['coins'][j][1]}-USD"] = daily
+
+    tickers = list(bars)
+    columns = [(field, ticker) for field in fields for ticker in tickers]
+    index = next(iter(bars.values())).index
+    with open(path, "w", newline="") as f:
+        f.write("Price," + ",".join(field for field, _ in columns) + "\n")
+        f.write("Ticker," + ",".join(ticker for _, ticker in columns) + "\n")
+        f.write("Date" + "," * len(columns) + "\n")
+        for i, ts in enumerate(index):
+            values = [
+                str(int(bars[ticker][field].iat[i])) if field == "Volume" else repr(float(bars[ticker][field].iat[i]))
+                for field, ticker in columns
+            ]
+            f.write(ts.strftime("%Y-%m-%d") + "," + ",".join(values) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--coins", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--freq", default="hourly", choices=list(STEPS_PER_DAY))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="SQLite file to (create and) bulk load")
+    parser.add_argument("--history-freq", default="daily", choices=["daily", "native"])
+    parser.add_argument("--processed-csv", help="write the M1_project crypto_processed.csv shape")
+    parser.add_argument("--yfinance-csv", help="write the Task_3 crypto_data.csv shape")
+    parser.add_argument("--tickers", type=int, default=1, help="coins in the yfinance CSV")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    paths = generate(args.coins, args.days, args.freq, args.seed)
+    print(f"Generated {args.coins} coins x {len(paths['index'])} steps "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    if args.db:
+        db.DB_PATH = os.path.abspath(args.db)
+        write_db(paths, args.history_freq)
+        print(f"Loaded {args.db}", file=sys.stderr)
+    if args.processed_csv:
+        write_processed_csv(paths, args.processed_csv)
+        print(f"Wrote {args.processed_csv}", file=sys.stderr)
+    if args.yfinance_csv:
+        write_yfinance_csv(paths, args.yfinance_csv, list(range(min(args.tickers, args.coins))))
+        print(f"Wrote {args.yfinance_csv}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
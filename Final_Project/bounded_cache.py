@@ -0,0 +1,121 @@
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import metrics
+
+
+# =====================================================
+# SIZE ESTIMATION
+# =====================================================
+# Rough but cheap: pandas/numpy report their buffers, containers are walked
+# one level per nesting, everything else falls back to sys.getsizeof.
+def estimate_size(value, depth=4):
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+
+    size = sys.getsizeof(value)
+    if depth <= 0:
+        return size
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, depth - 1) + estimate_size(v, depth - 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(v, depth - 1) for v in value)
+    return size
+
+
+# =====================================================
+# LRU / TTL CACHE
+# =====================================================
+# Every in-process cache goes through this, so memory use is bounded both
+# by entry count and by estimated bytes, and each one shows up in /metrics
+# and the /api/admin/memory report.
+_caches = {}
+_caches_lock = Lock()
+
+
+class BoundedCache:
+    def __init__(self, name, max_entries=128, max_bytes=16 * 1024 * 1024, ttl=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = OrderedDict()   # key -> (value, size, expires_at)
+        self.bytes = 0
+        with _caches_lock:
+            _caches[name] = self
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self.remove(key)
+                entry = None
+            if entry is None:
+                metrics.record_cache(self.name, False)
+                return default
+            self.entries.move_to_end(key)
+        metrics.record_cache(self.name, True)
+        return entry[0]
+
+    def set(self, key, value, ttl=None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # Would evict everything else and still not fit
+            self.pop(key)
+            return False
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (value, size, expires_at)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                metrics.cache_evictions.inc(cache=self.name)
+            self.report()
+        return True
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+                self.report()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.report()
+
+    def remove(self, key):
+        # Caller holds self.lock
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def report(self):
+        metrics.cache_entries.set(len(self.entries), cache=self.name)
+        metrics.cache_bytes.set(self.bytes, cache=self.name)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "name": self.name,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl
+            }
+
+
+def cache_stats():
+    with _caches_lock:
+        caches = list(_caches.values())
+    return [cache.stats() for cache in caches]
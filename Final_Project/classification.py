@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Risk tiers are assigned once per risk run, on the writer, right after its
+# rows are saved: every coin of the run goes into
+# risk_classification_snapshot in one INSERT ... SELECT and its
+# risk_metrics_latest row gets the tier, so dashboards and reports only
+# read them. Two threshold policies:
+#   fixed     annualized volatility >= 70 % is High, >= 35 % Medium
+#   quantile  the run's own 66th / 33rd volatility percentiles (the
+#             milestone 4 Streamlit app's rule), so tiers stay relative
+# Quantiles are only taken over a complete universe run: a page run (or a
+# batch not yet published) is a partial set, so it gets the fixed cut-offs.
+RISK_POLICY = os.environ.get("CVARA_RISK_POLICY", "fixed")
+POLICIES = ("fixed", "quantile")
+FIXED_THRESHOLDS = (70, 35)         # (high, medium) volatility %
+QUANTILE_THRESHOLDS = (0.66, 0.33)
+TIERS = ("High", "Medium", "Low")
+
+TIER_CASE = """
+CASE
+    WHEN volatility IS NULL THEN NULL
+    WHEN volatility >= :high THEN 'High'
+    WHEN volatility >= :medium THEN 'Medium'
+    ELSE 'Low'
+END
+"""
+
+
+def thresholds(volatilities, policy=RISK_POLICY):
+    # (high, medium) volatility cut-offs; None when a quantile policy has
+    # nothing to rank
+    if policy not in POLICIES:
+        raise ValueError(f"risk policy must be one of {POLICIES}, got {policy!r}")
+    if policy == "fixed":
+        return FIXED_THRESHOLDS
+    values = np.asarray([v for v in volatilities if v is not None], dtype=float)
+    if not len(values):
+        return None
+    return tuple(float(np.quantile(values, q)) for q in QUANTILE_THRESHOLDS)
+
+
+def tier(volatility, cuts):
+    # TIER_CASE for one value
+    if volatility is None:
+        return None
+    if volatility >= cuts[0]:
+        return "High"
+    return "Medium" if volatility >= cuts[1] else "Low"
+
+
+# =====================================================
+# WRITES (run on the db_writer thread)
+# =====================================================
+def classify_run(cur, days, run_id, policy=RISK_POLICY):
+    # Tiers for every coin of one risk run (risk_runs.run_id); rerunning
+    # replaces them. Returns the rows written.
+    cur.execute("SELECT scope FROM risk_runs WHERE run_id=?", (run_id,))
+    row = cur.fetchone()
+    if policy == "quantile" and (row is None or row[0] != "universe"):
+        policy = "fixed"
+    cur.execute(
+        "SELECT volatility FROM risk_metrics_snapshot WHERE days=? AND run_id=?",
+        (days, run_id)
+    )
+    cuts = thresholds([r[0] for r in cur.fetchall()], policy)
+    if cuts is None:
+        return 0
+    params = {"days": days, "run_id": run_id, "high": cuts[0], "medium": cuts[1], "policy": policy}
+
+    cur.execute(
+        "DELETE FROM risk_classification_snapshot WHERE days=:days AND run_id=:run_id",
+        params
+    )
+    cur.execute(f"""
+    INSERT INTO risk_classification_snapshot (
+        coin_id, days, run_id, computed_at, volatility, sharpe, beta, var, risk, policy
+    )
+    SELECT coin_id, days, run_id, computed_at, volatility, sharpe, beta, var, {TIER_CASE}, :policy
+    FROM risk_metrics_snapshot
+    WHERE days=:days AND run_id=:run_id
+    """, params)
+    count = cur.rowcount
+    cur.execute(f"""
+    UPDATE risk_metrics_latest SET risk = {TIER_CASE}
+    WHERE days=:days AND run_id=:run_id
+    """, params)
+    return count
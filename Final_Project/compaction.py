@@ -0,0 +1,132 @@
+import os
+from datetime import datetime, timedelta, UTC
+
+from db import DAILY, HOURLY, bar_ts
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Raw market polls stay in market_snapshot for SNAPSHOT_RAW_DAYS, then are
+# folded into market_snapshot_rollup: one HOURLY and one DAILY row per coin
+# (min / max / last price, last 24h change, mean volume) before the raw
+# rows go. Hourly rollups are kept SNAPSHOT_HOURLY_DAYS, daily ones for
+# good. Risk runs (risk_runs, their rows in risk_metrics_snapshot and
+# tiers in risk_classification_snapshot) are kept RISK_SNAPSHOT_DAYS, never
+# the latest run of each scope of a window (the published universe run,
+# the default view's page run, a batch in progress). Everything runs off the request path
+# (app.compaction_loop), COMPACTION_CHUNK rows per transaction so the
+# writer thread is never held long.
+SNAPSHOT_RAW_DAYS = int(os.environ.get("CVARA_SNAPSHOT_RAW_DAYS", 30))
+SNAPSHOT_HOURLY_DAYS = 365
+RISK_SNAPSHOT_DAYS = 30
+RUN_TABLES = ("risk_metrics_snapshot", "risk_classification_snapshot")
+COMPACTION_CHUNK = 2000        # rows per transaction (~40 ms of writer time)
+COMPACTION_INTERVAL = 900       # seconds between runs (one worker holds the lease)
+COMPACTION_PAUSE = 0.05         # seconds between chunks, lets ingestion writes in
+
+# Folds raw rows (id <= :upper, older than :cutoff) into one bucket per
+# coin; a bucket split across chunks or runs is merged, not replaced
+ROLLUP_SNAPSHOTS = """
+INSERT INTO market_snapshot_rollup (
+    coin_id, granularity, ts, min_price, max_price, last_price, last_change_24h,
+    last_at, mean_volume, samples, volume_samples
+)
+SELECT
+    coin_id, :granularity, bucket,
+    MIN(price), MAX(price), MAX(last_price), MAX(last_change), MAX(fetched_at),
+    AVG(volume), COUNT(*), COUNT(volume)
+FROM (
+    SELECT coin_id, price, volume, fetched_at,
+           CAST(strftime('%s', fetched_at) AS INTEGER) / :granularity * :granularity AS bucket,
+           LAST_VALUE(price) OVER w AS last_price,
+           LAST_VALUE(change_24h) OVER w AS last_change
+    FROM market_snapshot
+    WHERE id <= :upper AND fetched_at < :cutoff
+    WINDOW w AS (
+        PARTITION BY coin_id, CAST(strftime('%s', fetched_at) AS INTEGER) / :granularity
+        ORDER BY id ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+    )
+)
+GROUP BY coin_id, bucket
+ON CONFLICT (coin_id, granularity, ts) DO UPDATE SET
+    min_price = min(coalesce(min_price, excluded.min_price), coalesce(excluded.min_price, min_price)),
+    max_price = max(coalesce(max_price, excluded.max_price), coalesce(excluded.max_price, max_price)),
+    last_price = CASE WHEN excluded.last_at >= last_at THEN excluded.last_price ELSE last_price END,
+    last_change_24h = CASE WHEN excluded.last_at >= last_at THEN excluded.last_change_24h ELSE last_change_24h END,
+    last_at = max(last_at, excluded.last_at),
+    mean_volume = coalesce(
+        (coalesce(mean_volume * volume_samples, 0) + coalesce(excluded.mean_volume * excluded.volume_samples, 0))
+        / NULLIF(volume_samples + excluded.volume_samples, 0),
+        mean_volume
+    ),
+    samples = samples + excluded.samples,
+    volume_samples = volume_samples + excluded.volume_samples
+"""
+
+
+def cutoff(days):
+    return (datetime.now(UTC) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# =====================================================
+# WRITES (run on the db_writer thread, one chunk per job)
+# =====================================================
+def chunk_upper(cur, table, limit):
+    # Largest id among the oldest `limit` rows: a rowid walk from the start
+    # of the table, never a scan of it
+    cur.execute(f"SELECT MAX(id) FROM (SELECT id FROM {table} ORDER BY id LIMIT ?)", (limit,))
+    return cur.fetchone()[0]
+
+def compact_snapshots(cur, cutoff_dt, limit=COMPACTION_CHUNK):
+    # Oldest `limit` raw rows before cutoff_dt -> rollups, then deleted.
+    # ids grow with fetched_at, so once the oldest row is recent enough
+    # nothing is left. Returns the rows removed (0 = done).
+    cur.execute("SELECT fetched_at FROM market_snapshot ORDER BY id LIMIT 1")
+    row = cur.fetchone()
+    if row is None or row[0] >= cutoff_dt:
+        return 0
+    upper = chunk_upper(cur, "market_snapshot", limit)
+    for granularity in (HOURLY, DAILY):
+        cur.execute(ROLLUP_SNAPSHOTS, {"granularity": granularity, "upper": upper, "cutoff": cutoff_dt})
+    cur.execute(
+        "DELETE FROM market_snapshot WHERE id <= ? AND fetched_at < ?",
+        (upper, cutoff_dt)
+    )
+    return cur.rowcount
+
+def prune_hourly_rollups(cur, epoch):
+    cur.execute(f"""
+    DELETE FROM market_snapshot_rollup
+    WHERE coin_id IN (SELECT coin_id FROM coins)
+    AND granularity = {HOURLY} AND ts < ?
+    """, (bar_ts(epoch - SNAPSHOT_HOURLY_DAYS * DAILY),))
+    return cur.rowcount
+
+def prune_runs(cur, table, cutoff_dt, limit=COMPACTION_CHUNK):
+    # Oldest `limit` deletable rows of a RUN_TABLES table, by rowid; kept
+    # runs stay whatever their age (reports and the latest view read them)
+    # and are skipped rather than ending the chunk. 0 = nothing left.
+    cur.execute(f"""
+    DELETE FROM {table} WHERE id IN (
+        SELECT id FROM {table} t
+        WHERE computed_at < ?
+        AND run_id NOT IN (
+            SELECT MAX(run_id) FROM risk_runs r
+            WHERE r.days = t.days
+            GROUP BY r.scope
+        )
+        ORDER BY id
+        LIMIT ?
+    )
+    """, (cutoff_dt, limit))
+    return cur.rowcount
+
+def prune_risk_runs(cur, cutoff_dt):
+    # The run registry (a few rows per window a day), same age rule
+    cur.execute("""
+    DELETE FROM risk_runs
+    WHERE computed_at < ?
+    AND run_id NOT IN (SELECT MAX(run_id) FROM risk_runs GROUP BY days, scope)
+    """, (cutoff_dt,))
+    return cur.rowcount
@@ -1,22 +1,277 @@
 import sqlite3
 import os
+import time
+from datetime import datetime, UTC
+from collections import Counter
+from threading import local
+
+import metrics
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_DIR = os.path.join(BASE_DIR, "database")
-DB_PATH = os.path.join(DB_DIR, "cvara.db")
+# Both overridable so benchmarks / load tests can run against scratch data
+DB_DIR = os.environ.get("CVARA_DB_DIR", os.path.join(BASE_DIR, "database"))
+DB_PATH = os.environ.get("CVARA_DB_PATH", os.path.join(DB_DIR, "cvara.db"))
 
+QUERY_OPS = ("select", "insert", "update", "delete")
+SLOW_QUERY_MS = float(os.environ.get("CVARA_SLOW_QUERY_MS", 100))
+N_PLUS_ONE_THRESHOLD = 5   # same statement this many times in one request
+QUERY_LOG_REFRESH = 5      # seconds between re-reading the runtime switch
+
+# Slow-query / N+1 logging switch. Starts from CVARA_QUERY_LOG and can be
+# flipped at runtime (/api/admin/query-log); the setting lives in
+# shared_cache so every worker picks it up. shared_cache imports this
+# module, hence the lazy imports below.
+query_log = {
+    "enabled": os.environ.get("CVARA_QUERY_LOG") == "1",
+    "slow_ms": SLOW_QUERY_MS,
+    "checked": 0
+}
+
+# Per-request counters; only the thread serving a request counts, so
+# statements run by the writer thread on its behalf are not included.
+_request_stats = local()
+
+def refresh_query_log():
+    now = time.time()
+    if now - query_log["checked"] < QUERY_LOG_REFRESH:
+        return
+    query_log["checked"] = now
+    try:
+        import shared_cache
+        settings = shared_cache.get("query-log")
+    except Exception:
+        return
+    if settings:
+        query_log["enabled"] = settings["enabled"]
+        query_log["slow_ms"] = settings["slow_ms"]
+
+def set_query_log(enabled, slow_ms=None):
+    import shared_cache
+    settings = {
+        "enabled": bool(enabled),
+        "slow_ms": float(slow_ms) if slow_ms is not None else query_log["slow_ms"]
+    }
+    shared_cache.set("query-log", settings)
+    query_log.update(settings, checked=time.time())
+    return settings
+
+def begin_request_stats():
+    _request_stats.active = True
+    _request_stats.queries = 0
+    _request_stats.elapsed = 0.0
+    _request_stats.statements = Counter()
+
+def end_request_stats(label):
+    if not getattr(_request_stats, "active", False):
+        return None
+    _request_stats.active = False
+    stats = {
+        "queries": _request_stats.queries,
+        "elapsed_ms": round(_request_stats.elapsed * 1000, 2)
+    }
+    if query_log["enabled"]:
+        for sql, count in _request_stats.statements.most_common():
+            if count < N_PLUS_ONE_THRESHOLD:
+                break
+            print(f"N+1 suspected in {label}: {count}x {sql}")
+    return stats
+
+def query_op(sql):
+    words = sql.split(None, 1)
+    op = words[0].lower() if words else ""
+    return op if op in QUERY_OPS else "other"
+
+def explain(conn, sql, parameters):
+    # Plain sqlite3.Cursor so the EXPLAIN itself isn't timed or counted
+    try:
+        cur = sqlite3.Cursor(conn)
+        cur.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[3] for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+
+def record_query(conn, sql, parameters, elapsed):
+    op = query_op(sql)
+    metrics.db_queries.inc(op=op)
+    metrics.db_latency.observe(elapsed, op=op)
+
+    if getattr(_request_stats, "active", False):
+        _request_stats.queries += 1
+        _request_stats.elapsed += elapsed
+        _request_stats.statements[" ".join(sql.split())] += 1
+
+    if query_log["enabled"] and elapsed * 1000 >= query_log["slow_ms"]:
+        print(f"Slow query ({elapsed * 1000:.1f} ms): {' '.join(sql.split())}")
+        if op != "other" and parameters is not None:
+            for step in explain(conn, sql, parameters):
+                print(f"    plan: {step}")
+
+# Connections from get_db() hand out TimedCursor, so every statement
+# (including pandas.read_sql, which goes through cursor()) is timed.
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(self.connection, sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(self.connection, sql, None, time.perf_counter() - start)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
 def get_db():
-    os.makedirs(DB_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10)
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10, factory=TimedConnection)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA busy_timeout = 5000;")
     conn.row_factory = sqlite3.Row
     return conn
+
+def add_column_if_missing(cur, table, column, decl):
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in [r[1] for r in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+# =====================================================
+# TIME KEYS
+# =====================================================
+DAILY = 86400
+HOURLY = 3600
+
+def bar_ts(epoch, granularity=DAILY):
+    # Start of the bar containing epoch (seconds, UTC)
+    return int(epoch) // granularity * granularity
+
+def day_ts(date_str):
+    # "YYYY-MM-DD" (or a longer timestamp string) -> epoch of that UTC day
+    return bar_ts(datetime.strptime(date_str[:10], "%Y-%m-%d").replace(tzinfo=UTC).timestamp())
+
+def migrate_price_history(cur):
+    # Pre-prices databases: copy the rowid table over, then drop it so the
+    # view can take its name. Date strings with a time part were hourly
+    # points; the first row stored for a bar wins, as before.
+    cur.execute("SELECT type FROM sqlite_master WHERE name='price_history'")
+    row = cur.fetchone()
+    if not row or row[0] != "table":
+        return
+    add_column_if_missing(cur, "price_history", "updated_at", "INTEGER NOT NULL DEFAULT 0")
+    cur.execute(f"""
+    INSERT OR IGNORE INTO prices (coin_id, granularity, ts, price, updated_at)
+    SELECT coin_id, granularity, CAST(strftime('%s', date) AS INTEGER) / granularity * granularity,
+           price, updated_at
+    FROM (
+        SELECT id, coin_id, date, price, updated_at,
+               CASE WHEN length(date) > 10 THEN {HOURLY} ELSE {DAILY} END AS granularity
+        FROM price_history
+    )
+    WHERE coin_id IS NOT NULL AND strftime('%s', date) IS NOT NULL
+    ORDER BY id
+    """)
+    print(f"Migrated {cur.rowcount} price_history rows into prices")
+    cur.execute("DROP TABLE price_history")
+
+def migrate_risk_runs(cur, table):
+    # Rows saved before risk_runs: one run per (days, computed_at), which is
+    # how they were read then; a coin written twice into one keeps its last row
+    add_column_if_missing(cur, table, "run_id", "INTEGER")
+    cur.execute(f"SELECT 1 FROM {table} WHERE run_id IS NULL LIMIT 1")
+    if not cur.fetchone():
+        return
+    cur.execute(f"""
+    INSERT INTO risk_runs (days, computed_at)
+    SELECT DISTINCT days, computed_at FROM {table} t
+    WHERE run_id IS NULL AND days IS NOT NULL AND computed_at IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM risk_runs r WHERE r.days = t.days AND r.computed_at = t.computed_at
+    )
+    ORDER BY computed_at
+    """)
+    cur.execute(f"""
+    UPDATE {table} SET run_id = (
+        SELECT MIN(run_id) FROM risk_runs r
+        WHERE r.days = {table}.days AND r.computed_at = {table}.computed_at
+    )
+    WHERE run_id IS NULL
+    """)
+    cur.execute(f"""
+    DELETE FROM {table} WHERE id NOT IN (
+        SELECT MAX(id) FROM {table} GROUP BY days, run_id, coin_id
+    )
+    """)
+
+def migrate_run_scope(cur):
+    # Runs from before scope: more coins than a page means a batch over
+    # the universe. risk_metrics_latest then held whichever run touched a
+    # coin last, so it is seeded again from universe runs only.
+    import universe
+    cur.execute("""
+    UPDATE risk_runs SET scope = CASE
+        WHEN (
+            SELECT COUNT(*) FROM risk_metrics_snapshot s
+            WHERE s.days = risk_runs.days AND s.run_id = risk_runs.run_id
+        ) > ? THEN 'universe'
+        ELSE 'page'
+    END
+    WHERE scope IS NULL
+    """, (universe.PAGE_SIZE,))
+    if cur.rowcount:
+        cur.execute("DELETE FROM risk_metrics_latest")
+
+def seed_risk_latest(cur):
+    # Databases from before risk_metrics_latest: start it from the latest
+    # universe run of each window. Rows from before run ids get theirs.
+    cur.execute("""
+    UPDATE risk_metrics_latest SET run_id = (
+        SELECT MIN(run_id) FROM risk_runs r
+        WHERE r.days = risk_metrics_latest.days AND r.computed_at = risk_metrics_latest.computed_at
+    )
+    WHERE run_id IS NULL
+    """)
+    cur.execute("SELECT 1 FROM risk_metrics_latest LIMIT 1")
+    if cur.fetchone():
+        return
+    cur.execute("""
+    INSERT OR IGNORE INTO risk_metrics_latest (days, coin_id, run_id, computed_at, volatility, sharpe, beta, var, risk)
+    SELECT r.days, r.coin_id, r.run_id, r.computed_at, r.volatility, r.sharpe, r.beta, r.var, k.risk
+    FROM risk_metrics_snapshot r
+    JOIN (
+        SELECT days, MAX(run_id) AS run_id FROM risk_runs WHERE scope = 'universe' GROUP BY days
+    ) l ON l.days = r.days AND l.run_id = r.run_id
+    LEFT JOIN risk_classification_snapshot k
+        ON k.days = r.days AND k.run_id = r.run_id AND k.coin_id = r.coin_id
+    WHERE r.coin_id IS NOT NULL
+    """)
 
 def create_tables():
-    conn = get_db()
-    cur = conn.cursor()
+    # Workers starting together on an old file would both run the same
+    # migrations: one at a time, each in a single transaction, so the
+    # next one re-reads the schema and finds nothing left to do
+    import shared_cache
+    with shared_cache.lock("schema-migrate", ttl=600, wait=600):
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            create_schema(cur)
+            conn.commit()
+        finally:
+            conn.close()
 
+def create_schema(cur):
     # USER TABLE
     cur.execute("""
     CREATE TABLE IF NOT EXISTS user (
@@ -36,15 +291,81 @@ def create_tables():
     )
     """)
 
-    # PRICE HISTORY
+    # Coin universe (universe.py): top-N by market cap, refreshed by market
+    # ingestion. tracked=0 keeps rows of coins that dropped out of the top N
+    # so their history / snapshots still join.
+    add_column_if_missing(cur, "coins", "name", "TEXT COLLATE NOCASE")
+    add_column_if_missing(cur, "coins", "market_cap_rank", "INTEGER")
+    add_column_if_missing(cur, "coins", "market_cap", "REAL")
+    add_column_if_missing(cur, "coins", "tracked", "INTEGER NOT NULL DEFAULT 0")
+    add_column_if_missing(cur, "coins", "updated_at", "INTEGER NOT NULL DEFAULT 0")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_coins_tracked_rank
+    ON coins (tracked, market_cap_rank)
+    """)
+    # Prefix search for the async dropdowns (coin_name has its UNIQUE index)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_coins_symbol ON coins (symbol)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_coins_name ON coins (name)")
+
+    # PRICES
+    # Clustered on (coin_id, granularity, ts): one coin's series at one
+    # granularity is a single contiguous B-tree range, and a bar can only be
+    # stored once. ts is the UTC epoch second the bar starts at, granularity
+    # its length in seconds (DAILY / HOURLY). price is the bar's close;
+    # HOURLY bars are the raw tier, DAILY bars their rollups (price_tiers.py).
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS price_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        coin_id INTEGER,
-        date TEXT,
+    CREATE TABLE IF NOT EXISTS prices (
+        coin_id INTEGER NOT NULL,
+        granularity INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
         price REAL,
+        volume REAL,
+        vwap REAL,
+        rv REAL,
+        rv_span INTEGER,
+        updated_at INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (coin_id, granularity, ts),
         FOREIGN KEY (coin_id) REFERENCES coins (coin_id)
-    )
+    ) WITHOUT ROWID
+    """)
+    for column in ("open", "high", "low", "volume", "vwap", "rv"):
+        add_column_if_missing(cur, "prices", column, "REAL")
+    add_column_if_missing(cur, "prices", "rv_span", "INTEGER")
+    # updated_at (epoch ms of the last write) drives delta sync
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_prices_updated_at
+    ON prices (updated_at)
+    """)
+
+    # PRICE HISTORY: the old rowid table, now a read-only view of the daily
+    # bars so existing queries keep working
+    migrate_price_history(cur)
+    cur.execute(f"""
+    CREATE VIEW IF NOT EXISTS price_history AS
+    SELECT coin_id, date(ts, 'unixepoch') AS date, price, updated_at
+    FROM prices
+    WHERE granularity = {DAILY}
+    """)
+
+    # OHLCV: daily range bars for the volatility estimators (ohlcv.py),
+    # from CoinGecko's OHLC candles or imported yfinance CSVs
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ohlcv (
+        coin_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume REAL,
+        source TEXT,
+        updated_at INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (coin_id, ts),
+        FOREIGN KEY (coin_id) REFERENCES coins (coin_id)
+    ) WITHOUT ROWID
     """)
 
     # MARKET SNAPSHOT (current metrics)
@@ -60,12 +381,48 @@ def create_tables():
     )
     """)
 
+    # Compacted market snapshots (compaction.py): HOURLY / DAILY buckets
+    # of polls older than the raw retention
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS market_snapshot_rollup (
+        coin_id INTEGER NOT NULL,
+        granularity INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        min_price REAL,
+        max_price REAL,
+        last_price REAL,
+        last_change_24h REAL,
+        last_at TEXT,
+        mean_volume REAL,
+        samples INTEGER NOT NULL DEFAULT 0,
+        volume_samples INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (coin_id, granularity, ts),
+        FOREIGN KEY (coin_id) REFERENCES coins (coin_id)
+    ) WITHOUT ROWID
+    """)
+
+    # One row per risk run. Its run_id keys the run's rows in every risk
+    # table: computed_at has one-second resolution, so two runs can share it.
+    # scope is what the run covers: 'page' (the default view, rank page 1),
+    # 'partial' (a batch still saving pages, or one that died) or
+    # 'universe' (a batch that saved every page).
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS risk_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        days INTEGER NOT NULL,
+        computed_at TEXT NOT NULL,
+        scope TEXT
+    )
+    """)
+    add_column_if_missing(cur, "risk_runs", "scope", "TEXT")
+
     # RISK METRICS SNAPSHOT (milestone 2)
     cur.execute("""
     CREATE TABLE IF NOT EXISTS risk_metrics_snapshot (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         coin_id INTEGER,
         days INTEGER,
+        run_id INTEGER,
         computed_at TEXT,
         volatility REAL,
         sharpe REAL,
@@ -74,6 +431,38 @@ def create_tables():
         FOREIGN KEY (coin_id) REFERENCES coins (coin_id)
     )
     """)
+    migrate_risk_runs(cur, "risk_metrics_snapshot")
+    cur.execute("DROP INDEX IF EXISTS idx_risk_metrics_snapshot_days")
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_risk_metrics_snapshot_run
+    ON risk_metrics_snapshot (days, run_id, coin_id)
+    """)
+
+    # The newest universe run of each window, copied in once its batch
+    # completes; /api/risk-metrics-latest reads this instead of the growing
+    # history
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS risk_metrics_latest (
+        days INTEGER NOT NULL,
+        coin_id INTEGER NOT NULL,
+        run_id INTEGER,
+        computed_at TEXT NOT NULL,
+        volatility REAL,
+        sharpe REAL,
+        beta REAL,
+        var REAL,
+        risk TEXT,
+        PRIMARY KEY (days, coin_id),
+        FOREIGN KEY (coin_id) REFERENCES coins (coin_id)
+    ) WITHOUT ROWID
+    """)
+    add_column_if_missing(cur, "risk_metrics_latest", "risk", "TEXT")
+    add_column_if_missing(cur, "risk_metrics_latest", "run_id", "INTEGER")
+    cur.execute("DROP INDEX IF EXISTS idx_risk_metrics_latest_computed")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_risk_metrics_latest_run
+    ON risk_metrics_latest (days, run_id)
+    """)
 
     # DASHBOARD TIMESERIES SNAPSHOT (milestone 3)
     cur.execute("""
@@ -97,16 +486,25 @@ def create_tables():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         coin_id INTEGER,
         days INTEGER,
+        run_id INTEGER,
         computed_at TEXT,
         volatility REAL,
         sharpe REAL,
         beta REAL,
         var REAL,
         risk TEXT,
+        policy TEXT,
         FOREIGN KEY (coin_id) REFERENCES coins (coin_id)
     )
     """)
-    
-
-    conn.commit()
-    conn.close()
+    add_column_if_missing(cur, "risk_classification_snapshot", "policy", "TEXT")
+    migrate_risk_runs(cur, "risk_classification_snapshot")
+    cur.execute("DROP INDEX IF EXISTS idx_risk_classification_snapshot_days")
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_risk_classification_snapshot_run
+    ON risk_classification_snapshot (days, run_id, coin_id)
+    """)
+
+    # Runs and the latest table once every risk table has its run ids
+    migrate_run_scope(cur)
+    seed_risk_latest(cur)
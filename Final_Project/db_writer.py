@@ -0,0 +1,141 @@
+import queue
+import time
+from concurrent.futures import Future
+from threading import Lock, Thread
+
+from db import get_db
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+WRITER_BATCH_MAX = 64       # jobs folded into one transaction
+WRITER_BATCH_WAIT = 0.005   # seconds to wait for more jobs to join a batch
+WRITER_CONNECT_RETRY = 0.5  # first wait after a failed connect, doubled up to
+WRITER_CONNECT_MAX = 30     # this many seconds
+
+
+# =====================================================
+# SINGLE WRITER
+# =====================================================
+# All SQLite writes go through one thread that owns one connection. Callers
+# submit a function taking a cursor and get a Future back; queued jobs are
+# committed together (group commit), each inside its own SAVEPOINT so one
+# failing job doesn't roll back the others. Jobs must only touch the DB:
+# network calls happen before submit, never inside the writer.
+class DBWriter:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.lock = Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def submit(self, fn, *args):
+        self.start()
+        future = Future()
+        self.jobs.put((fn, args, future))
+        return future
+
+    def write(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def next_batch(self):
+        batch = [self.jobs.get()]
+        deadline = time.monotonic() + WRITER_BATCH_WAIT
+        while len(batch) < WRITER_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.jobs.get(timeout=remaining) if remaining > 0 else self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def connect(self):
+        # Retries until the DB opens; jobs queued meanwhile fail with the
+        # error instead of waiting on a writer that has no connection
+        delay = WRITER_CONNECT_RETRY
+        while True:
+            try:
+                conn = get_db()
+                conn.isolation_level = None   # BEGIN / COMMIT are issued explicitly
+                return conn
+            except Exception as e:
+                print("DB writer connect error:", e)
+                self.fail_pending(e)
+                time.sleep(delay)
+                delay = min(delay * 2, WRITER_CONNECT_MAX)
+
+    def fail_pending(self, error):
+        while True:
+            try:
+                _, _, future = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def run(self):
+        conn = self.connect()
+        while True:
+            batch = self.next_batch()
+            try:
+                self.execute_batch(conn, batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                conn = self.reset(conn)
+
+    def reset(self, conn):
+        # A failed batch may leave BEGIN IMMEDIATE open (holding the write
+        # lock): roll it back, or start over on a new connection
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return conn
+        except Exception as e:
+            print("DB writer rollback error:", e)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        return self.connect()
+
+    def execute_batch(self, conn, batch):
+        cur = conn.cursor()
+        results = []
+
+        cur.execute("BEGIN IMMEDIATE")
+        for fn, args, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            cur.execute("SAVEPOINT job")
+            try:
+                results.append((future, fn(cur, *args), None))
+                cur.execute("RELEASE job")
+            except Exception as e:
+                try:
+                    cur.execute("ROLLBACK TO job")
+                    cur.execute("RELEASE job")
+                except Exception:
+                    # The savepoint went with the transaction: the whole
+                    # batch fails and run() resets the connection
+                    raise e
+                results.append((future, None, e))
+
+        cur.execute("COMMIT")
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+db_writer = DBWriter()
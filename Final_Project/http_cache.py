@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import json
+from datetime import datetime, UTC
+
+from flask import request, Response
+
+# Optional speedups: orjson for serialization, brotli for compression.
+# Both fall back to the standard library when not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+# =====================================================
+# SERIALIZATION
+# =====================================================
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":"), default=float).encode("utf-8")
+
+
+# =====================================================
+# VALIDATORS
+# =====================================================
+def make_etag(version):
+    key = f"{request.path}?{request.query_string.decode()}|{version}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def to_http_date(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, UTC)
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=UTC)
+    return value
+
+
+def not_modified(version, last_modified=None):
+    # Cheap pre-check so routes can skip building the payload entirely
+    etag = make_etag(version)
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        return finalize(Response(status=304), etag, last_modified)
+    if not request.if_none_match and last_modified is not None and request.if_modified_since:
+        modified = to_http_date(last_modified).replace(microsecond=0)
+        if modified <= request.if_modified_since:
+            return finalize(Response(status=304), etag, last_modified)
+    return None
+
+
+def finalize(resp, etag, last_modified=None):
+    # Weak tag: the same data version may be sent gzip, br or identity
+    resp.set_etag(etag, weak=True)
+    if last_modified is not None:
+        resp.last_modified = to_http_date(last_modified)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+# =====================================================
+# RESPONSES
+# =====================================================
+def compress(body):
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if accepted["gzip"]:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def json_response(payload, version=None, last_modified=None, status=200):
+    body = None
+    if version is None:
+        body = dumps(payload)
+        version = hashlib.sha1(body).hexdigest()
+
+    if status == 200:
+        cached = not_modified(version, last_modified)
+        if cached is not None:
+            return cached
+
+    if body is None:
+        body = dumps(payload)
+    return body_response(body, version, last_modified, status)
+
+
+def body_response(body, version, last_modified=None, status=200):
+    # Already serialized JSON (e.g. a cached blob); only compression is left
+    body, encoding = compress(body)
+    resp = Response(body, status=status, mimetype="application/json")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    return finalize(resp, make_etag(version), last_modified)
@@ -0,0 +1,314 @@
+import math
+import time
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, Thread
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Latency buckets (seconds) shared by every histogram unless overridden
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_FLUSH_INTERVAL = 10   # seconds between per-worker snapshot uploads
+METRICS_WORKER_TTL = 3600     # a dead worker's last snapshot is dropped after this
+
+_registry = {}
+_registry_lock = Lock()
+_flusher_started = False
+
+
+# =====================================================
+# METRIC TYPES
+# =====================================================
+# Samples are keyed by the tuple of label values, in the order the labels
+# were declared. Everything lives in process memory; see WORKER MERGE for
+# how gunicorn workers end up in one /metrics response.
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.lock = Lock()
+        self.samples = {}
+        with _registry_lock:
+            _registry[name] = self
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "kind": self.kind,
+                "help": self.help,
+                "labels": list(self.labels),
+                "samples": [[list(k), self.export(v)] for k, v in self.samples.items()]
+            }
+
+    def export(self, value):
+        return value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.samples[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                # [per-bucket counts..., sum, count]; cumulated at render time
+                sample = self.samples[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[i] += 1
+                    break
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def export(self, value):
+        return list(value)
+
+    def snapshot(self):
+        snap = super().snapshot()
+        snap["buckets"] = list(self.buckets)
+        return snap
+
+
+# =====================================================
+# APPLICATION METRICS
+# =====================================================
+http_requests = Counter(
+    "cvara_http_requests_total", "HTTP requests handled",
+    ("method", "route", "status"))
+http_latency = Histogram(
+    "cvara_http_request_duration_seconds", "HTTP request latency",
+    ("method", "route"))
+
+upstream_requests = Counter(
+    "cvara_upstream_requests_total", "Upstream API calls by result",
+    ("service", "endpoint", "status"))
+upstream_latency = Histogram(
+    "cvara_upstream_request_duration_seconds", "Upstream API call latency",
+    ("service", "endpoint"))
+circuit_state = Gauge(
+    "cvara_upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ("service",))
+
+db_queries = Counter(
+    "cvara_db_queries_total", "SQLite statements executed",
+    ("op",))
+db_latency = Histogram(
+    "cvara_db_query_duration_seconds", "SQLite statement latency",
+    ("op",))
+db_queries_per_request = Histogram(
+    "cvara_db_queries_per_request", "SQLite statements issued per HTTP request",
+    ("route",), buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250, 500))
+
+cache_requests = Counter(
+    "cvara_cache_requests_total", "Cache lookups by result",
+    ("cache", "result"))
+cache_evictions = Counter(
+    "cvara_cache_evictions_total", "Entries evicted from bounded in-process caches",
+    ("cache",))
+cache_entries = Gauge(
+    "cvara_cache_entries", "Entries held by bounded in-process caches",
+    ("cache",))
+cache_bytes = Gauge(
+    "cvara_cache_bytes", "Estimated bytes held by bounded in-process caches",
+    ("cache",))
+
+dash_latency = Histogram(
+    "cvara_dash_callback_duration_seconds", "Dash callback latency",
+    ("callback",))
+dash_errors = Counter(
+    "cvara_dash_callback_errors_total", "Dash callbacks that raised",
+    ("callback",))
+
+ingest_latency = Histogram(
+    "cvara_market_ingest_duration_seconds", "Market ingestion (fetch + store) latency")
+ingest_errors = Counter(
+    "cvara_market_ingest_errors_total", "Failed market ingestion attempts")
+ingest_lag = Gauge(
+    "cvara_market_ingest_lag_seconds", "Age of the newest ingested market data")
+
+
+def record_cache(cache, hit):
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def timed_callback(name):
+    # Wraps a Dash callback; PreventUpdate and friends still propagate
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if type(e).__name__ != "PreventUpdate":
+                    dash_errors.inc(callback=name)
+                raise
+            finally:
+                dash_latency.observe(time.perf_counter() - start, callback=name)
+        return wrapper
+    return decorator
+
+
+# =====================================================
+# WORKER MERGE
+# =====================================================
+# Each gunicorn worker uploads its snapshot to shared_cache; /metrics merges
+# them so a scrape sees the whole deployment no matter which worker answers.
+# Counters and histograms are summed, gauges report the worst (max) worker.
+# shared_cache is imported lazily: db.py imports this module.
+def snapshot():
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name: m.snapshot() for m in metrics}
+
+
+def flush():
+    import shared_cache
+    shared_cache.set(f"metrics:{shared_cache.owner_id()}", snapshot(), METRICS_WORKER_TTL)
+
+
+def flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            print("Metrics flush error:", e)
+
+
+def start_flusher():
+    global _flusher_started
+    with _registry_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+    Thread(target=flush_loop, daemon=True).start()
+
+
+def merge(snapshots):
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for key, value in metric["samples"]:
+                key = tuple(key)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif metric["kind"] == "histogram":
+                    target["samples"][key] = [a + b for a, b in zip(current, value)]
+                elif metric["kind"] == "gauge":
+                    target["samples"][key] = max(current, value)
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def collect():
+    import shared_cache
+    own = snapshot()
+    shared_cache.set(f"metrics:{shared_cache.owner_id()}", own, METRICS_WORKER_TTL)
+    others = [
+        snap for key, snap in shared_cache.get_prefix("metrics:").items()
+        if key != f"metrics:{shared_cache.owner_id()}"
+    ]
+    return merge([own] + others)
+
+
+# =====================================================
+# EXPOSITION
+# =====================================================
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{escape_label(v)}"' for n, v in pairs) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labels = metric["labels"]
+        for key, value in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{format_labels(labels, key)} {format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, key, ('le', format_value(float(bound))))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels, key, ('le', '+Inf'))} {value[-1]}")
+            lines.append(f"{name}_sum{format_labels(labels, key)} {format_value(float(value[-2]))}")
+            lines.append(f"{name}_count{format_labels(labels, key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def histogram_quantile(metric, q):
+    # Upper bound of the bucket holding the q-th observation, over all labels
+    if not metric or not metric["samples"]:
+        return None
+    totals = [sum(col) for col in zip(*metric["samples"].values())]
+    count = totals[-1]
+    if not count:
+        return None
+    rank = q * count
+    cumulative = 0
+    for bound, n in zip(metric["buckets"], totals):
+        cumulative += n
+        if cumulative >= rank:
+            return bound
+    return math.inf
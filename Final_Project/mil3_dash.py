@@ -3,26 +3,19 @@ import requests
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State
 import os
 
-from db import get_db
+from db import get_db, DAILY, day_ts
+import metrics
+import universe
+import price_cube
 
 
 FLASK_URL = "http://127.0.0.1:5000"
 
-COIN_MAP = {
-    "BITC": "Bitcoin",
-    "ETHE": "Ethereum",
-    "SOLA": "Solana",
-    "CARD": "Cardano",
-    "DOGE": "Dogecoin",
-    "RIPP": "Ripple",
-    "LITE": "Litecoin",
-    "POLK": "Polkadot",
-    "TRON": "Tron",
-    "CHAI": "Chainlink"
-}
+# Dropdown values are coin ids from the universe (universe.py)
+MAX_SELECTED = 25
 GLASS_STYLE = {
                     "background": "rgba(255,255,255,0.06)",
                     "backdropFilter": "blur(18px)",
@@ -35,29 +28,34 @@ GLASS_STYLE = {
 DATA_DIR = "data"
 
 def load_price_series_db(coin, start_date, end_date, window=14):
-    conn = get_db()
-
-    q = """
-    SELECT date, price FROM price_history
-    WHERE coin_id = (
-        SELECT coin_id FROM coins WHERE coin_name=?
-    )
-    AND date BETWEEN ? AND ?
-    ORDER BY date
-    """
-
-    start_str = pd.to_datetime(start_date).strftime("%Y-%m-%d")
-    end_str = pd.to_datetime(end_date).strftime("%Y-%m-%d")
-
-    df = pd.read_sql(q, conn, params=(coin, start_str, end_str))
-    conn.close()
+    start_ts = day_ts(pd.to_datetime(start_date).strftime("%Y-%m-%d"))
+    end_ts = day_ts(pd.to_datetime(end_date).strftime("%Y-%m-%d"))
+
+    # Memory-mapped price cube first (no SQL, no parsing)
+    cached = price_cube.series(coin, start_ts, end_ts)
+    if cached is not None:
+        dates, closes = cached
+        df = pd.DataFrame({"price": closes}, index=pd.Index(dates, name="date"))
+    else:
+        # One contiguous primary-key range: (coin_id, DAILY, start..end)
+        q = """
+        SELECT ts, price FROM prices
+        WHERE coin_id = (
+            SELECT coin_id FROM coins WHERE coin_name=?
+        )
+        AND granularity = ?
+        AND ts BETWEEN ? AND ?
+        ORDER BY ts
+        """
+        conn = get_db()
+        df = pd.read_sql(q, conn, params=(coin, DAILY, start_ts, end_ts))
+        conn.close()
+        df["date"] = pd.to_datetime(df.pop("ts"), unit="s")
+        df = df.set_index("date")
 
     if df.empty:
         return df
 
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.set_index("date")
-
     df["returns"] = df["price"].pct_change()
     df["volatility"] = (
         df["returns"].rolling(window=window).std()
@@ -145,12 +143,11 @@ def init_dash(flask_app):
 
                     dcc.Dropdown(
                         id="coin-select",
-                        options=[
-                            {"label": v, "value": k}
-                            for k, v in COIN_MAP.items()
-                        ],
-                        value=["BITC","ETHE", "SOLA", "CARD", "DOGE"],
+                        options=universe.default_options(),
+                        value=list(universe.DEFAULT_SELECTION),
                         multi=True,
+                        searchable=True,
+                        placeholder="Search coins by name or symbol",
                         clearable=False,
                         style={
                             "width": "600px",
@@ -219,6 +216,15 @@ def init_dash(flask_app):
         ]
     )
 
+    # ================= COIN SEARCH =================
+    @dash_app.callback(
+        Output("coin-select", "options"),
+        Input("coin-select", "search_value"),
+        State("coin-select", "value")
+    )
+    def coin_options(search_value, selected):
+        return universe.dropdown_options(search_value, selected)
+
     # ================= CALLBACK =================
     @dash_app.callback(
         Output("price-vol", "figure"),
@@ -230,6 +236,7 @@ def init_dash(flask_app):
         Input("date-range", "end_date"),
         
     )
+    @metrics.timed_callback("dash3.update_dashboard")
     def update_dashboard(selected_coins, start_date, end_date):
 
         start = pd.to_datetime(start_date)
@@ -241,14 +248,16 @@ def init_dash(flask_app):
         # btc_df = load_price_series("bitcoin", start, end, window=14)
         btc_df = load_price_series_db("bitcoin", start, end)
 
-        btc_returns = btc_df["returns"]
+        btc_returns = btc_df["returns"] if not btc_df.empty else pd.Series(dtype=float)
+        coins = universe.lookup((selected_coins or [])[:MAX_SELECTED])
 
 
         vols, sharpes, betas = [], [], []
 
-        for coin_code in selected_coins:
-            coin_name = COIN_MAP[coin_code]
-            coin_id = coin_name.lower()
+        for coin_id in (selected_coins or [])[:MAX_SELECTED]:
+            if coin_id not in coins:
+                continue
+            coin_name = coins[coin_id]["name"]
 
             # df = load_price_series(coin_id, start, end, window=14)
             df = load_price_series_db(coin_id, start, end)
@@ -282,11 +291,12 @@ def init_dash(flask_app):
             sharpe = (avg_return - 0.04) / vol_decimal if vol_decimal else 0
 
 
-            # ✅ Correct Beta
+            # ✅ Correct Beta (on the dates both coins have)
+            both = pd.concat([df["returns"], btc_returns], axis=1, join="inner")
             beta = (
-                np.cov(df["returns"], btc_returns)[0][1] /
-                np.var(btc_returns)
-            ) if np.var(btc_returns) else 0
+                np.cov(both.iloc[:, 0], both.iloc[:, 1])[0][1] /
+                np.var(both.iloc[:, 1])
+            ) if len(both) > 1 and np.var(both.iloc[:, 1]) else 0
             
 
 
@@ -1,17 +1,24 @@
 import dash
-from dash import html, dcc, Input, Output, ctx, no_update
+from dash import html, dcc, Input, Output, State, ctx, no_update
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import pandas as pd
 import requests
 from datetime import datetime
-import io
 
-from reportlab.platypus import SimpleDocTemplate, Table
-from reportlab.lib.pagesizes import A4
+import classification
+import reports
+import metrics
+import universe
+from bounded_cache import BoundedCache
 
 # ================= CONFIG =================
-API_URL = "http://127.0.0.1:5000/api/risk-metrics"
+# Latest metrics with their precomputed tiers (classification.py); the
+# dashboard only groups coins by the "risk" the server assigned. Until a
+# saved run covers the selection (fresh database) the metrics are computed
+# live instead and tiered here.
+API_URL = "http://127.0.0.1:5000/api/risk-metrics-latest"
+LIVE_API_URL = "http://127.0.0.1:5000/api/risk-metrics"
 
 COLORS = {
     "high": "#dc2626",
@@ -27,41 +34,51 @@ GLASS = {
     "boxShadow": "0 8px 30px rgba(0,0,0,0.4)"
 }
 
-# ---------------- COIN CODE MAPS (for robust matching) ----------------
-CODE_TO_ID = {
-    "BITC": "bitcoin",
-    "ETHE": "ethereum",
-    "SOLA": "solana",
-    "CARD": "cardano",
-    "DOGE": "dogecoin",
-    "XRPE": "ripple",
-    "DOTE": "polkadot",
-    "LTCE": "litecoin",
-    "LINKE": "chainlink",
-    "TRXE": "tron"
-}
-CODE_TO_SYMBOL = {
-    "BITC": "BTC",
-    "ETHE": "ETH",
-    "SOLA": "SOL",
-    "CARD": "ADA",
-    "DOGE": "DOGE",
-    "XRPE": "XRP",
-    "DOTE": "DOT",
-    "LTCE": "LTC",
-    "LINKE": "LINK",
-    "TRXE": "TRX"
-}
-# reverse maps
-NAME_TO_CODE = {v: k for k, v in CODE_TO_ID.items()}
-SYMBOL_TO_CODE = {v: k for k, v in CODE_TO_SYMBOL.items()}
+# Dropdown values are coin ids from the universe (universe.py)
+MAX_SELECTED = 50
 
 # ================= FETCH DATA =================
-def fetch_data(days=30):
+# Last good response per (endpoint, window, selection); revalidated with
+# If-None-Match so an unchanged risk payload comes back as an empty 304.
+# Only the selected coins are requested, never the whole universe.
+_fetch_cache = BoundedCache("dash4_risk", max_entries=8, max_bytes=2 * 1024 * 1024, ttl=3600)
+
+def fetch_body(url, days, coins):
+    key = (url, days, coins)
+    cached = _fetch_cache.get(key)
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
+    r = requests.get(
+        url,
+        params={"days": days, "coins": ",".join(coins), "per_page": MAX_SELECTED},
+        headers=headers,
+        timeout=10
+    )
+    if r.status_code == 304 and cached:
+        return cached["body"]
+    r.raise_for_status()
+    body = r.json()
+    if r.headers.get("ETag"):
+        _fetch_cache.set(key, {"etag": r.headers["ETag"], "body": body})
+    return body
+
+def fetch_data(days=30, coins=()):
+    # Coins that left the universe are dropped, not sent: one of them
+    # would fail the whole request
+    known = universe.known(coins)
+    coins = tuple(sorted(coin for coin in coins if coin in known))
+    if not coins:
+        return pd.DataFrame()
     try:
-        r = requests.get(f"{API_URL}?days={days}", timeout=10)
-        r.raise_for_status()
-        return pd.DataFrame(r.json()["table"])
+        body = fetch_body(API_URL, days, coins)
+        if body["computed_at"] is not None:
+            return pd.DataFrame(body["table"])
+        # No saved run covers them: a selection is a partial set, so it
+        # gets the fixed cut-offs, as a partial run does on the server
+        table = fetch_body(LIVE_API_URL, days, coins)["table"]
+        cuts = classification.thresholds([], "fixed")
+        return pd.DataFrame([
+            dict(row, risk=classification.tier(row["volatility"], cuts)) for row in table
+        ])
     except:
         return pd.DataFrame()
 
@@ -91,20 +108,11 @@ def init_dash(flask_app):
         children=[
             dcc.Dropdown(
                 id="coin-select",
-                options=[
-                    {"label": "Bitcoin (BTC)", "value": "BITC"},
-                    {"label": "Ethereum (ETH)", "value": "ETHE"},
-                    {"label": "Solana (SOL)", "value": "SOLA"},
-                    {"label": "Cardano (ADA)", "value": "CARD"},
-                    {"label": "Dogecoin (DOGE)", "value": "DOGE"},
-                    {"label": "Ripple (XRP)", "value": "XRPE"},
-                    {"label": "Polkadot (DOT)", "value": "DOTE"},
-                    {"label": "Litecoin (LTC)", "value": "LTCE"},
-                    {"label": "Chainlink (LINK)", "value": "LINKE"},
-                    {"label": "Tron (TRX)", "value": "TRXE"},
-                ],
-                value=["BITC", "ETHE", "SOLA", "CARD", "DOGE"],
+                options=universe.default_options(),
+                value=list(universe.DEFAULT_SELECTION),
                 multi=True,
+                searchable=True,
+                placeholder="Search coins by name or symbol",
                 clearable=False,
                 style={
                             "background": "rgba(255,255,255,0.08)",
@@ -124,6 +132,7 @@ def init_dash(flask_app):
                 dbc.Col(dbc.Button("⬇ CSV", id="btn-csv", color="secondary"), width="auto"),
                 dbc.Col(dbc.Button("⬇ PDF", id="btn-pdf", color="secondary"), width="auto"),
                 dbc.Col(html.Span(html.Small(id="last-update")), style={"marginLeft": "20px"}),
+                dbc.Col(html.Span(html.Small(id="report-status")), width="auto"),
             ]),
 
             html.Br(),
@@ -160,9 +169,20 @@ def init_dash(flask_app):
             ]),
 
             dcc.Download(id="download-csv"),
-            dcc.Download(id="download-pdf")
+            dcc.Download(id="download-pdf"),
+            dcc.Store(id="report-job"),
+            dcc.Interval(id="report-poll", interval=1000, disabled=True)
         ])
 
+    # ================= COIN SEARCH =================
+    @app.callback(
+        Output("coin-select", "options"),
+        Input("coin-select", "search_value"),
+        State("coin-select", "value")
+    )
+    def coin_options(search_value, selected):
+        return universe.dropdown_options(search_value, selected)
+
     # ================= CALLBACK =================
     @app.callback(
         [
@@ -175,69 +195,15 @@ def init_dash(flask_app):
             Output("risk-pie", "figure"),
             Output("last-update", "children"),
             # Output("status-text", "children"),
-            Output("download-csv", "data"),
-            Output("download-pdf", "data"),
         ],
         [
             Input("btn-refresh", "n_clicks"),
-            Input("btn-csv", "n_clicks"),
-            Input("btn-pdf", "n_clicks"),
             Input("coin-select", "value")
         ]
     )
-    def update_dashboard(_, n_csv, n_pdf, coins):
+    @metrics.timed_callback("dash4.update_dashboard")
+    def update_dashboard(_, coins):
 
-        df = fetch_data()
-        now = datetime.now().strftime("%H:%M:%S")
-
-        if df.empty or not coins:
-            return (
-                risk_card("High Risk", pd.DataFrame(), COLORS["high"]),
-                risk_card("Medium Risk", pd.DataFrame(), COLORS["medium"]),
-                risk_card("Low Risk", pd.DataFrame(), COLORS["low"]),
-                "-", "-", "-",
-                go.Figure(),
-                f"Last update: {now}",
-                # "🟡 No data",
-                no_update,
-                no_update
-            )
-
-        # ---------------- Normalize coin identifiers so filtering works ----------------
-        # Create a normalized code column (e.g., "BITC", "ETHE", ...)
-        df["coin_str"] = df["coin"].astype(str)
-        # try mapping by full name (e.g., "bitcoin") -> code
-        df["coin_code"] = df["coin_str"].str.lower().map(NAME_TO_CODE)
-        # if not matched, try mapping by symbol (e.g., "BTC") -> code
-        unmatched = df["coin_code"].isna()
-        if unmatched.any():
-            df.loc[unmatched, "coin_code"] = df.loc[unmatched, "coin_str"].str.upper().map(SYMBOL_TO_CODE)
-        # fallback: if still NaN, use uppercased original (so if API already provides codes it still works)
-        df["coin_code"] = df["coin_code"].fillna(df["coin_str"].str.upper())
-
-        # Filter using dropdown values (which are codes like "BITC", "ETHE", ...)
-        df = df[df["coin_code"].isin(coins)]
-
-        # use coin_code for display in cards
-        df["coin_display"] = df["coin_code"]
-
-        if df.empty:
-            return (
-                risk_card("High Risk", pd.DataFrame(), COLORS["high"]),
-                risk_card("Medium Risk", pd.DataFrame(), COLORS["medium"]),
-                risk_card("Low Risk", pd.DataFrame(), COLORS["low"]),
-                "-", "-", "-",
-                go.Figure(),
-                f"Last update: {now}",
-                no_update,
-                no_update
-            )
-
-        high = df[df.volatility >= 70]
-        medium = df[(df.volatility >= 35) & (df.volatility < 70)]
-        low = df[df.volatility < 35]
-
-        # when building cards, use coin_display field
         # ================= CARD UI =================
         def risk_card(title, df_part, color):
             if df_part.empty:
@@ -290,6 +256,39 @@ def init_dash(flask_app):
                 style={**GLASS, "padding": "14px"},
             )
 
+        coins = (coins or [])[:MAX_SELECTED]
+        df = fetch_data(coins=coins) if coins else pd.DataFrame()
+        now = datetime.now().strftime("%H:%M:%S")
+
+        if df.empty or not coins:
+            return (
+                risk_card("High Risk", pd.DataFrame(), COLORS["high"]),
+                risk_card("Medium Risk", pd.DataFrame(), COLORS["medium"]),
+                risk_card("Low Risk", pd.DataFrame(), COLORS["low"]),
+                "-", "-", "-",
+                go.Figure(),
+                f"Last update: {now}",
+                # "🟡 No data",
+            )
+
+        # The API already answered for the selected coins only; cards show symbols
+        df = df[df["coin_name"].isin(coins)].copy()
+        df["coin_display"] = df["coin"]
+
+        if df.empty:
+            return (
+                risk_card("High Risk", pd.DataFrame(), COLORS["high"]),
+                risk_card("Medium Risk", pd.DataFrame(), COLORS["medium"]),
+                risk_card("Low Risk", pd.DataFrame(), COLORS["low"]),
+                "-", "-", "-",
+                go.Figure(),
+                f"Last update: {now}",
+            )
+
+        high = df[df.risk == "High"]
+        medium = df[df.risk == "Medium"]
+        low = df[df.risk == "Low"]
+
         fig = go.Figure(go.Pie(
             labels=["High", "Medium", "Low"],
             values=[len(high), len(medium), len(low)],
@@ -304,76 +303,6 @@ def init_dash(flask_app):
         )
 
 
-      # ---------------- prepare CLEAN report (ONLY REQUIRED COLUMNS) ----------------
-
-        df_report = df.copy()
-
-        # Risk classification
-        df_report["risk"] = df_report["volatility"].apply(
-            lambda v: "High" if v >= 70 else ("Medium" if v >= 35 else "Low")
-        )
-
-        # Coin Name mapping (code → full name)
-        CODE_TO_NAME = {
-            "BITC": "Bitcoin",
-            "ETHE": "Ethereum",
-            "SOLA": "Solana",
-            "CARD": "Cardano",
-            "DOGE": "Dogecoin",
-            "XRPE": "Ripple",
-            "DOTE": "Polkadot",
-            "LTCE": "Litecoin",
-            "LINKE": "Chainlink",
-            "TRXE": "Tron"
-        }
-
-        # Coin Symbol (BTC, ETH, SOL...)
-        df_report["coin_symbol"] = df_report["coin_code"].map(CODE_TO_SYMBOL)
-
-        # Coin Name
-        df_report["coin_name"] = df_report["coin_code"].map(CODE_TO_NAME)
-
-
-        # 🔥 FINAL REPORT (ONLY REQUIRED COLUMNS)
-        df_report = df_report[
-            [
-                "coin_symbol",     # Coin
-                "coin_name",     # Coin Name
-                "volatility",    # Volatility
-                "beta",          # Beta
-                "sharpe",        # Sharpe Ratio
-                "var",           # Value at Risk
-                "risk"           # Risk Classification
-            ]
-        ]
-
-        # Optional rounding (looks professional)
-        df_report["volatility"] = df_report["volatility"].round(2)
-        df_report["beta"] = df_report["beta"].round(2)
-        df_report["sharpe"] = df_report["sharpe"].round(2)
-        df_report["var"] = df_report["var"].round(2)
-
-
-        csv_out = pdf_out = no_update
-
-        if ctx.triggered_id == "btn-csv":
-            csv_out = dcc.send_data_frame(
-                df_report.to_csv,
-                "milestone4_risk_report.csv",
-                index=False
-            )
-
-        if ctx.triggered_id == "btn-pdf":
-            buffer = io.BytesIO()
-            pdf_doc = SimpleDocTemplate(buffer, pagesize=A4)
-            table_data = [df_report.columns.tolist()] + df_report.values.tolist()
-            pdf_doc.build([Table(table_data)])
-            buffer.seek(0)
-            pdf_out = dcc.send_bytes(
-                buffer.getvalue(),
-                "milestone4_risk_report.pdf"
-            )
-
         return (
             risk_card("🔴 High Risk", high, COLORS["high"]),
             risk_card("🟡 Medium Risk", medium, COLORS["medium"]),
@@ -384,8 +313,58 @@ def init_dash(flask_app):
             fig,
             f"Last update: {now}",
             # "🟢 Connected to Milestone-3 API",
-            csv_out,
-            pdf_out
+        )
+
+    # ================= REPORT DOWNLOADS =================
+    # Reports are built by the background report queue; the buttons only
+    # submit a job and the interval polls it until the artifact is ready.
+    @app.callback(
+        [
+            Output("report-job", "data"),
+            Output("report-poll", "disabled"),
+            Output("report-status", "children"),
+            Output("download-csv", "data"),
+            Output("download-pdf", "data"),
+        ],
+        [
+            Input("btn-csv", "n_clicks"),
+            Input("btn-pdf", "n_clicks"),
+            Input("report-poll", "n_intervals")
+        ],
+        [
+            State("coin-select", "value"),
+            State("report-job", "data")
+        ],
+        prevent_initial_call=True
+    )
+    @metrics.timed_callback("dash4.report_download")
+    def report_download(n_csv, n_pdf, _, coins, job):
+
+        if ctx.triggered_id in ("btn-csv", "btn-pdf"):
+            fmt = "csv" if ctx.triggered_id == "btn-csv" else "pdf"
+            coin_ids = sorted(universe.known((coins or [])[:MAX_SELECTED]))
+            job = reports.submit_report(coin_ids, reports.REPORT_WINDOWS, fmt)
+            return job, False, f"Building {fmt.upper()} report…", no_update, no_update
+
+        if not job:
+            return no_update, True, no_update, no_update, no_update
+
+        status = reports.job_status(job["job_id"])
+        if not status or status["status"] == "failed":
+            error = status["error"] if status else "unknown job"
+            return None, True, f"Report failed: {error}", no_update, no_update
+        if status["status"] != "done":
+            return no_update, False, no_update, no_update, no_update
+
+        fmt = status["format"]
+        download = dcc.send_file(
+            reports.artifact_path(job["job_id"], fmt),
+            filename=f"milestone4_risk_report.{fmt}"
+        )
+        return (
+            None, True, "Report ready",
+            download if fmt == "csv" else no_update,
+            download if fmt == "pdf" else no_update
         )
 
     return app
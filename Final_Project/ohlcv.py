@@ -0,0 +1,203 @@
+"""Daily OHLCV bars and range-based volatility estimators.
+
+    # import yfinance exports (Task_3 download() layout names its tickers;
+    # Task_1 Ticker.history() files need --coin)
+    python ohlcv.py ../Task_3/crypto_data.csv
+    python ohlcv.py ../Task_1/crypto_prices1.csv --coin bitcoin
+
+In the running app, bars come from CoinGecko's /coins/{id}/ohlc candles
+(app.refresh_ohlcv, run by app.ohlcv_loop), aggregated to UTC days.
+"""
+import argparse
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import db
+from db import get_db, DAILY, bar_ts
+import universe
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+OHLC_DAYS = 30                  # widest range CoinGecko still answers in 4h candles
+OHLC_REFRESH_TTL = 6 * 3600     # one /ohlc call per coin per this, across workers
+OHLC_LOOP_INTERVAL = 600        # seconds between passes over the universe
+MIN_BARS = 5                    # fewer bars in the window -> no estimate
+ESTIMATORS = ("parkinson", "garman_klass", "yang_zhang")
+FIELDS = ("open", "high", "low", "close")
+
+UPSERT_BAR = """
+INSERT INTO ohlcv (coin_id, ts, open, high, low, close, volume, source, updated_at)
+VALUES (?,?,?,?,?,?,?,?,?)
+ON CONFLICT (coin_id, ts) DO UPDATE SET
+    open = excluded.open,
+    high = excluded.high,
+    low = excluded.low,
+    close = excluded.close,
+    volume = coalesce(excluded.volume, volume),
+    source = excluded.source,
+    updated_at = excluded.updated_at
+"""
+
+
+# =====================================================
+# INGESTION
+# =====================================================
+def candles_to_daily(candles):
+    # CoinGecko candles are [close_ms, open, high, low, close]; a candle
+    # belongs to the UTC day its close falls in (a 00:00 close ends the
+    # previous day). The first day is cut by the range start, so dropped;
+    # the last one (today) is stored but left out of the estimates.
+    frame = pd.DataFrame(candles or [], columns=["ts", *FIELDS]).dropna()
+    if frame.empty:
+        return []
+    frame["day"] = (frame["ts"] // 1000 - 1) // DAILY * DAILY
+    daily = frame.sort_values("ts").groupby("day").agg(
+        open=("open", "first"), high=("high", "max"), low=("low", "min"), close=("close", "last")
+    ).iloc[1:]
+    return [(int(r.Index), r.open, r.high, r.low, r.close, None) for r in daily.itertuples()]
+
+def read_yfinance_csv(path):
+    # {ticker: bars} from a download() export (Price / Ticker / Date header
+    # rows), {None: bars} from a Ticker.history() export
+    with open(path) as f:
+        multi = f.readline().startswith("Price,")
+    if multi:
+        frame = pd.read_csv(path, header=[0, 1], skiprows=[2], index_col=0)
+        return {
+            ticker: csv_bars(frame.xs(ticker, axis=1, level=1))
+            for ticker in frame.columns.get_level_values(1).unique()
+        }
+    return {None: csv_bars(pd.read_csv(path, index_col="Date"))}
+
+def csv_bars(frame):
+    frame = frame.rename(columns=str.lower)
+    frame = frame[[*FIELDS, "volume"]].apply(pd.to_numeric, errors="coerce").dropna(subset=list(FIELDS))
+    days = pd.to_datetime(frame.index, utc=True).as_unit("s").asi8 // DAILY * DAILY
+    return [
+        (int(day), r.open, r.high, r.low, r.close, None if np.isnan(r.volume) else r.volume)
+        for day, r in zip(days, frame.itertuples())
+    ]
+
+def ticker_coin(ticker):
+    # "BTC-USD" -> best ranked coin with that symbol
+    rows = universe.query("""
+    SELECT coin_name FROM coins WHERE symbol = ?
+    ORDER BY tracked DESC, market_cap_rank
+    LIMIT 1
+    """, (ticker.split("-")[0].upper(),))
+    return rows[0]["coin_name"] if rows else None
+
+def store_bars(cur, coin_id, bars, source, stamp):
+    # bars: [(day_ts, open, high, low, close, volume)], one executemany
+    cur.executemany(UPSERT_BAR, [(coin_id, *bar, source, stamp) for bar in bars])
+    return len(bars)
+
+def import_csv(path, coin=None):
+    db.create_tables()
+    stamp = int(time.time() * 1000)
+    loaded = {}
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        for ticker, bars in read_yfinance_csv(path).items():
+            name = coin or (ticker_coin(ticker) if ticker else None)
+            ids = universe.coin_ids(cur, [name]) if name else {}
+            if name not in ids:
+                print(f"Skipped {ticker or path}: no coin (pass --coin)", file=sys.stderr)
+                continue
+            loaded[name] = store_bars(cur, ids[name], bars, "csv", stamp)
+        conn.commit()
+    finally:
+        conn.close()
+    return loaded
+
+
+# =====================================================
+# ESTIMATORS
+# =====================================================
+def load_bars(coins, days):
+    # {field: coins x days float array}, NaN where a day has no bar. The
+    # window ends with yesterday's bar: today's is still filling in, and
+    # its narrower range would pull every estimator down.
+    end = bar_ts(time.time()) - DAILY
+    columns = list(range(end - (days - 1) * DAILY, end + DAILY, DAILY))
+    frames = []
+    conn = get_db()
+    try:
+        for chunk in universe.chunks(list(coins)):
+            frames.append(pd.read_sql(f"""
+            SELECT c.coin_name, o.ts, o.open, o.high, o.low, o.close
+            FROM coins c
+            JOIN ohlcv o ON o.coin_id = c.coin_id
+            WHERE c.coin_name IN ({",".join("?" * len(chunk))})
+            AND o.ts >= ?
+            """, conn, params=(*chunk, columns[0])))
+    finally:
+        conn.close()
+    frame = pd.concat(frames) if frames else pd.DataFrame(columns=["coin_name", "ts", *FIELDS])
+    return {
+        field: frame.pivot(index="coin_name", columns="ts", values=field)
+        .reindex(index=list(coins), columns=columns).to_numpy(dtype=float)
+        for field in FIELDS
+    }
+
+def range_volatility(bars):
+    # Annualized % volatility per row (coin) for each estimator, all coins
+    # at once. Parkinson uses the high-low range, Garman-Klass adds the
+    # open-close move, Yang-Zhang combines the overnight (open vs previous
+    # close), open-close and Rogers-Satchell variances.
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        o, h, l, c = (np.log(bars[field]) for field in FIELDS)
+        hl, co = h - l, c - o
+        n = np.sum(~np.isnan(hl), axis=1)
+
+        parkinson = np.nanmean(hl ** 2, axis=1) / (4 * np.log(2))
+        garman_klass = np.nanmean(0.5 * hl ** 2 - (2 * np.log(2) - 1) * co ** 2, axis=1)
+        overnight = o[:, 1:] - c[:, :-1]
+        rogers_satchell = (h - c) * (h - o) + (l - c) * (l - o)
+        k = 0.34 / (1.34 + (n + 1) / (n - 1))
+        yang_zhang = (
+            np.nanvar(overnight, axis=1, ddof=1)
+            + k * np.nanvar(co, axis=1, ddof=1)
+            + (1 - k) * np.nanmean(rogers_satchell, axis=1)
+        )
+
+        out = {}
+        for name, variance in zip(ESTIMATORS, (parkinson, garman_klass, yang_zhang)):
+            vol = np.sqrt(np.clip(variance, 0, None) * 365) * 100
+            out[name] = np.where(n >= MIN_BARS, vol, np.nan)
+    return out
+
+def estimate(coins, days):
+    # {coin: {"parkinson", "garman_klass", "yang_zhang"}} for coins with
+    # at least MIN_BARS daily bars in the window
+    coins = list(dict.fromkeys(coins))
+    if not coins:
+        return {}
+    vols = range_volatility(load_bars(coins, days))
+    return {
+        coin: {name: float(vols[name][i]) for name in ESTIMATORS}
+        for i, coin in enumerate(coins)
+        if not np.isnan(vols["parkinson"][i])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv", nargs="+", help="yfinance CSV export(s)")
+    parser.add_argument("--coin", help="coin id for files without a ticker header (Ticker.history())")
+    args = parser.parse_args()
+    for path in args.csv:
+        for coin, count in import_csv(path, args.coin).items():
+            print(f"{path}: {count} bars -> {coin}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import json
+import os
+import time
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from db import get_db, DB_DIR, DAILY, bar_ts
+import shared_cache
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Daily closes of every coin as one date-aligned float64 array on disk
+# (CUBE_DIR/prices-<version>.f64, days x coin slots, NaN = no bar) plus
+# index.json (start day, shape, coin -> slot). Every worker maps it with
+# np.memmap, so they all read the same page cache instead of building
+# their own DataFrames. Rows are days, so a new day is an append and
+# today's row is updated in place; one coin's series is a strided view.
+# Only sync() writes, under a cross-worker lock.
+CUBE_DIR = os.environ.get("CVARA_CUBE_DIR", os.path.join(DB_DIR, "cube"))
+INDEX_PATH = os.path.join(CUBE_DIR, "index.json")
+SPARE_SLOTS = 64            # room for coins joining the universe before a rebuild
+SYNC_OVERLAP_MS = 60000     # re-read writes this recent; stamps are taken before commit
+RELOAD_CHECK = 1.0          # seconds between index.json stat() calls per process
+
+_state = {"mtime": None, "checked": 0.0, "cube": None}
+_state_lock = Lock()
+
+
+# =====================================================
+# READS
+# =====================================================
+def read_index():
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def open_cube(index, mode="r"):
+    return np.memmap(
+        os.path.join(CUBE_DIR, index["file"]), dtype=np.float64, mode=mode,
+        shape=(index["days"], index["slots"])
+    )
+
+def current():
+    # This process's mapping, reopened when index.json changes; None when
+    # no cube has been built yet (callers fall back to SQL)
+    now = time.monotonic()
+    with _state_lock:
+        if now - _state["checked"] < RELOAD_CHECK:
+            return _state["cube"]
+        _state["checked"] = now
+        try:
+            mtime = os.stat(INDEX_PATH).st_mtime_ns
+        except FileNotFoundError:
+            _state.update(mtime=None, cube=None)
+            return None
+        if mtime != _state["mtime"]:
+            index = read_index()
+            cube = None
+            if index and index["days"]:
+                cube = {
+                    "index": index,
+                    "data": open_cube(index),
+                    "slots": {coin: i for i, coin in enumerate(index["coins"])}
+                }
+            _state.update(mtime=mtime, cube=cube)
+        return _state["cube"]
+
+def day_labels(start, first, count):
+    return pd.to_datetime(start + (first + np.arange(count)) * DAILY, unit="s").strftime("%Y-%m-%d")
+
+def series(coin, start_ts, end_ts):
+    # (dates, closes) of one coin between two days, a strided view into the
+    # map; None when the coin or the cube is missing
+    cube = current()
+    if cube is None or coin not in cube["slots"]:
+        return None
+    index = cube["index"]
+    first = max((start_ts - index["start"]) // DAILY, 0)
+    last = min((end_ts - index["start"]) // DAILY + 1, index["days"])
+    if last <= first:
+        return pd.DatetimeIndex([]), np.empty(0)
+    column = cube["data"][first:last, cube["slots"][coin]]
+    present = ~np.isnan(column)
+    dates = pd.to_datetime(index["start"] + (first + np.arange(last - first)) * DAILY, unit="s")
+    return dates[present], column[present]
+
+
+# =====================================================
+# WRITES
+# =====================================================
+def write_index(index):
+    tmp = INDEX_PATH + f".{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, INDEX_PATH)
+
+def changed_bars(since):
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+        SELECT c.coin_name, p.ts, p.price, p.updated_at
+        FROM prices p
+        JOIN coins c ON p.coin_id = c.coin_id
+        WHERE p.granularity = {DAILY} AND p.updated_at >= ?
+        """, (since,))
+        return cur.fetchall()
+    finally:
+        conn.close()
+
+def rebuild():
+    # Whole cube from the daily tier into a new file; readers switch over
+    # when index.json is replaced, old mappings stay valid until closed
+    rows = changed_bars(-1)
+    if not rows:
+        return None
+    frame = pd.DataFrame([tuple(r) for r in rows], columns=["coin", "ts", "price", "updated_at"])
+    coins = sorted(frame["coin"].unique())
+    start = int(frame["ts"].min())
+    days = (max(int(frame["ts"].max()), bar_ts(time.time())) - start) // DAILY + 1
+    slots = len(coins) + SPARE_SLOTS
+
+    version = int(time.time() * 1000)
+    index = {
+        "version": version,
+        "file": f"prices-{version}.f64",
+        "start": start,
+        "days": days,
+        "slots": slots,
+        "coins": coins,
+        "synced_at": int(frame["updated_at"].max())
+    }
+    os.makedirs(CUBE_DIR, exist_ok=True)
+    data = open_cube(index, "w+")
+    data[:] = np.nan
+    slot = {coin: i for i, coin in enumerate(coins)}
+    data[(frame["ts"].to_numpy() - start) // DAILY, frame["coin"].map(slot).to_numpy()] = frame["price"].to_numpy()
+    data.flush()
+    del data
+
+    old = read_index()
+    write_index(index)
+    if old and old["file"] != index["file"]:
+        try:
+            os.remove(os.path.join(CUBE_DIR, old["file"]))
+        except OSError:
+            pass
+    return index
+
+def apply(index, rows):
+    # Changed bars into the existing file: new coins take spare slots, new
+    # days are appended. False when only a rebuild can take them.
+    coins = list(index["coins"])
+    slot = {coin: i for i, coin in enumerate(coins)}
+    for r in rows:
+        if r["coin_name"] not in slot:
+            slot[r["coin_name"]] = len(coins)
+            coins.append(r["coin_name"])
+    if len(coins) > index["slots"] or min(r["ts"] for r in rows) < index["start"]:
+        return False
+
+    days = max(index["days"], (max(r["ts"] for r in rows) - index["start"]) // DAILY + 1)
+    if days > index["days"]:
+        with open(os.path.join(CUBE_DIR, index["file"]), "ab") as f:
+            f.write(np.full((days - index["days"], index["slots"]), np.nan).tobytes())
+
+    updated = dict(index, days=days, coins=coins)
+    data = open_cube(updated, "r+")
+    data[
+        np.array([(r["ts"] - index["start"]) // DAILY for r in rows]),
+        np.array([slot[r["coin_name"]] for r in rows])
+    ] = np.array([np.nan if r["price"] is None else r["price"] for r in rows])
+    data.flush()
+    del data
+
+    updated["synced_at"] = max(index["synced_at"], max(r["updated_at"] for r in rows))
+    if updated != index:
+        write_index(updated)
+    return True
+
+def sync():
+    # Bring the cube up to date with the daily tier: only bars written
+    # since the last sync are read (idx_prices_updated_at), so a market
+    # poll costs one row per coin
+    with shared_cache.lock("price-cube", ttl=120, wait=60):
+        index = read_index()
+        if index is None or not os.path.exists(os.path.join(CUBE_DIR, index["file"])):
+            return rebuild()
+        rows = changed_bars(index["synced_at"] - SYNC_OVERLAP_MS)
+        if rows and not apply(index, rows):
+            return rebuild()
+        return index
@@ -0,0 +1,239 @@
+import os
+
+import numpy as np
+
+from db import get_db, DAILY, HOURLY, bar_ts
+import universe
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# prices holds two tiers. Raw intraday points (market polls, CoinGecko's
+# 5-min / hourly chart points) are folded into HOURLY OHLC bars and kept
+# for INTRADAY_RETENTION_DAYS. DAILY bars are rolled up from them on every
+# ingest (open, high, low, close, volume, VWAP, realized variance) and
+# outlive the raw tier;
+# days that only came from CoinGecko's daily series exist as DAILY bars
+# alone. Risk reads the daily tier, intraday charts the hourly one.
+INTRADAY_RETENTION_DAYS = int(os.environ.get("CVARA_INTRADAY_RETENTION_DAYS", 90))
+INTRADAY_MAX_SPACING = 2 * HOURLY   # wider point spacing = a daily series
+INTRADAY_CHART_DAYS = 90            # longest market_chart range that comes back hourly
+HOURS_PER_YEAR = 24 * 365
+MIN_REALIZED_HOURS = 24             # below this realized vol is just noise
+
+# One market poll: widen the hour's range, move its close
+UPSERT_TICK = f"""
+INSERT INTO prices (coin_id, granularity, ts, open, high, low, price, volume, updated_at)
+VALUES (?, {HOURLY}, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (coin_id, granularity, ts) DO UPDATE SET
+    high = max(coalesce(high, excluded.high), excluded.high),
+    low = min(coalesce(low, excluded.low), excluded.low),
+    price = excluded.price,
+    volume = coalesce(excluded.volume, volume),
+    updated_at = excluded.updated_at
+WHERE price IS NOT excluded.price OR volume IS NOT coalesce(excluded.volume, volume)
+"""
+
+# Backfilled bars never overwrite what is already stored
+INSERT_BAR = """
+INSERT OR IGNORE INTO prices (coin_id, granularity, ts, open, high, low, price, volume, updated_at)
+VALUES (?,?,?,?,?,?,?,?,?)
+"""
+
+# One (coin, day) daily bar from its hourly bars, a single primary key
+# range. VWAP uses the typical price (h + l + c) / 3 of each hour; rv is
+# the sum of squared hour-to-hour returns and rv_span the seconds they
+# cover, so realized volatility over any window is a sum of daily rows.
+ROLLUP_SELECT = f"""
+INSERT INTO prices (coin_id, granularity, ts, open, high, low, price, volume, vwap, rv, rv_span, updated_at)
+SELECT
+    coin_id, {DAILY}, :day,
+    (SELECT coalesce(open, price) FROM prices
+     WHERE coin_id = :coin AND granularity = {HOURLY} AND ts >= :day AND ts < :day + {DAILY}
+     ORDER BY ts LIMIT 1),
+    MAX(coalesce(high, price)),
+    MIN(coalesce(low, price)),
+    (SELECT price FROM prices
+     WHERE coin_id = :coin AND granularity = {HOURLY} AND ts >= :day AND ts < :day + {DAILY}
+     ORDER BY ts DESC LIMIT 1),
+    SUM(volume),
+    coalesce(
+        SUM((coalesce(high, price) + coalesce(low, price) + price) / 3 * volume) / NULLIF(SUM(volume), 0),
+        AVG(price)
+    ),
+    SUM(r * r),
+    SUM(dt),
+    :stamp
+FROM (
+    SELECT coin_id, high, low, price, volume,
+           price / LAG(price) OVER w - 1 AS r,
+           ts - LAG(ts) OVER w AS dt
+    FROM prices
+    WHERE coin_id = :coin AND granularity = {HOURLY} AND ts >= :day AND ts < :day + {DAILY}
+    WINDOW w AS (ORDER BY ts)
+)
+GROUP BY coin_id
+"""
+
+# updated_at only moves when the bar changed, so delta sync stays quiet
+ROLLUP_DAY = ROLLUP_SELECT + """
+ON CONFLICT (coin_id, granularity, ts) DO UPDATE SET
+    open = excluded.open,
+    high = excluded.high,
+    low = excluded.low,
+    price = excluded.price,
+    volume = excluded.volume,
+    vwap = excluded.vwap,
+    rv = excluded.rv,
+    rv_span = excluded.rv_span,
+    updated_at = excluded.updated_at
+WHERE price IS NOT excluded.price OR high IS NOT excluded.high
+    OR low IS NOT excluded.low OR volume IS NOT excluded.volume
+    OR rv IS NOT excluded.rv OR rv_span IS NOT excluded.rv_span
+"""
+
+# A backfill starting mid-day only covers part of its first day: fill
+# that day if it has no bar yet, never replace a complete one
+ROLLUP_MISSING_DAY = ROLLUP_SELECT + """
+ON CONFLICT (coin_id, granularity, ts) DO NOTHING
+"""
+
+
+# =====================================================
+# WRITES (run on the db_writer thread)
+# =====================================================
+def bar_volume(volume_24h, granularity):
+    # CoinGecko volumes are rolling 24h totals; spread over the bar length
+    return volume_24h * granularity / DAILY if volume_24h is not None else None
+
+def roll_up(cur, keys, stamp, sql=ROLLUP_DAY):
+    # keys: {(coin_id, day_ts)} whose hourly bars changed
+    cur.executemany(sql, [
+        {"coin": coin_id, "day": day, "stamp": stamp} for coin_id, day in keys
+    ])
+
+def store_ticks(cur, rows, epoch, stamp):
+    # rows: [(coin_id, price, volume_24h)] from one market poll at epoch
+    rows = [row for row in rows if row[1] is not None]
+    hour = bar_ts(epoch, HOURLY)
+    cur.executemany(UPSERT_TICK, [
+        (coin_id, hour, price, price, price, price, bar_volume(volume, HOURLY), stamp)
+        for coin_id, price, volume in rows
+    ])
+    day = bar_ts(epoch)
+    roll_up(cur, {(coin_id, day) for coin_id, _, _ in rows}, stamp)
+
+def store_points(cur, coin_id, prices, volumes=None, stamp=0):
+    # CoinGecko market_chart [ms, value] pairs -> bars. Intraday series
+    # (ranges up to 90 days) become HOURLY bars plus rollups of the days
+    # they touch; daily series become DAILY bars.
+    prices = [(ts, price) for ts, price in prices or [] if price is not None]
+    if not prices:
+        return 0
+    spacing = (prices[-1][0] - prices[0][0]) / 1000 / max(len(prices) - 1, 1)
+    granularity = HOURLY if spacing <= INTRADAY_MAX_SPACING else DAILY
+    weights = dict(map(tuple, volumes or []))
+
+    bars = {}
+    for ts, price in prices:
+        epoch = ts / 1000
+        if granularity == DAILY:
+            # A daily sample taken at 00:00 UTC is the previous day's close
+            epoch -= 1
+        key = bar_ts(epoch, granularity)
+        volume = bar_volume(weights.get(ts), granularity)
+        bar = bars.get(key)
+        if bar is None:
+            bars[key] = [price, price, price, price, volume]
+        else:
+            bar[1] = max(bar[1], price)
+            bar[2] = min(bar[2], price)
+            bar[3] = price
+            bar[4] = volume if volume is not None else bar[4]
+
+    cur.executemany(INSERT_BAR, [
+        (coin_id, granularity, ts, *bar, stamp) for ts, bar in bars.items()
+    ])
+    if granularity == HOURLY:
+        first = min(bars)
+        days = {bar_ts(ts) for ts in bars}
+        if first > bar_ts(first):
+            days.discard(bar_ts(first))
+            roll_up(cur, {(coin_id, bar_ts(first))}, stamp, ROLLUP_MISSING_DAY)
+        roll_up(cur, {(coin_id, day) for day in days}, stamp)
+    return len(bars)
+
+def backfill_realized(cur, stamp):
+    # Daily bars rolled up before rv existed, re-rolled once from the
+    # hourly bars still kept
+    cur.execute(f"""
+    SELECT DISTINCT h.coin_id, h.ts / {DAILY} * {DAILY}
+    FROM prices h
+    JOIN prices d ON d.coin_id = h.coin_id AND d.granularity = {DAILY}
+        AND d.ts = h.ts / {DAILY} * {DAILY}
+    WHERE h.granularity = {HOURLY} AND d.rv_span IS NULL
+    """)
+    keys = {(coin_id, day) for coin_id, day in cur.fetchall()}
+    roll_up(cur, keys, stamp)
+    return len(keys)
+
+def cleanup_intraday(cur, epoch):
+    # Drops raw hourly bars only; their daily rollups stay
+    cur.execute(f"""
+    DELETE FROM prices
+    WHERE coin_id IN (SELECT coin_id FROM coins)
+    AND granularity = {HOURLY} AND ts < ?
+    """, (bar_ts(epoch - INTRADAY_RETENTION_DAYS * DAILY),))
+    return cur.rowcount
+
+
+# =====================================================
+# READS
+# =====================================================
+def load_intraday(coins, start_ts):
+    # {coin: {"YYYY-MM-DD HH:MM": close}} from the hourly tier
+    series = {coin: {} for coin in coins}
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        for chunk in universe.chunks(list(coins)):
+            cur.execute(f"""
+            SELECT c.coin_name, strftime('%Y-%m-%d %H:%M', p.ts, 'unixepoch') AS time, p.price
+            FROM coins c
+            JOIN prices p ON p.coin_id = c.coin_id
+            WHERE c.coin_name IN ({",".join("?" * len(chunk))})
+            AND p.granularity = {HOURLY} AND p.ts >= ?
+            ORDER BY p.ts
+            """, (*chunk, start_ts))
+            for r in cur.fetchall():
+                series[r["coin_name"]][r["time"]] = r["price"]
+    finally:
+        conn.close()
+    return series
+
+def realized_volatility(coins, start_ts):
+    # Annualized % volatility from the daily rollups' squared hourly
+    # returns (one row per coin and day, not per hour). Dividing by the
+    # hours covered (not the return count) keeps missed polls from
+    # inflating it.
+    out = {}
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        for chunk in universe.chunks(list(coins)):
+            cur.execute(f"""
+            SELECT c.coin_name, SUM(p.rv) AS sum_sq, SUM(p.rv_span) AS span
+            FROM coins c
+            JOIN prices p ON p.coin_id = c.coin_id
+            WHERE c.coin_name IN ({",".join("?" * len(chunk))})
+            AND p.granularity = {DAILY} AND p.ts >= ?
+            GROUP BY c.coin_name
+            """, (*chunk, bar_ts(start_ts)))
+            for r in cur.fetchall():
+                hours = (r["span"] or 0) / HOURLY
+                if hours >= MIN_REALIZED_HOURS:
+                    out[r["coin_name"]] = float(np.sqrt(r["sum_sq"] / hours * HOURS_PER_YEAR) * 100)
+    finally:
+        conn.close()
+    return out
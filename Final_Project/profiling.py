@@ -0,0 +1,181 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+import tracemalloc
+import uuid
+from threading import Lock
+
+from db import DB_DIR
+from bounded_cache import cache_stats
+
+try:
+    import resource
+except ImportError:   # not available on Windows
+    resource = None
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+PROFILE_DIR = os.path.join(DB_DIR, "profiles")
+PROFILE_SAMPLE_RATE = float(os.environ.get("CVARA_PROFILE_SAMPLE_RATE", 0))
+PROFILE_KEEP = 200   # newest artifacts kept on disk
+
+TRACEMALLOC_FRAMES = 10
+MEMORY_GROUPS = ("lineno", "filename", "traceback")
+PROFILE_SORTS = ("cumulative", "tottime", "calls")
+PROFILE_ID_RE = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+
+# cProfile can only have one active profiler per process (3.12+ hooks
+# sys.monitoring), so concurrent requests skip instead of waiting.
+_active = Lock()
+
+
+# =====================================================
+# CAPTURE
+# =====================================================
+def should_sample():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start():
+    if not _active.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except Exception:
+        _active.release()
+        return None
+    return {"profiler": profiler, "started": time.perf_counter()}
+
+
+def abort(session):
+    session["profiler"].disable()
+    _active.release()
+
+
+def finish(session, meta):
+    # Stops the profiler and writes <id>.prof (pstats, opens in snakeviz)
+    # plus <id>.json with the route and parameters that produced it
+    session["profiler"].disable()
+    _active.release()
+
+    profile_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    meta = {
+        **meta,
+        "id": profile_id,
+        "duration_ms": round((time.perf_counter() - session["started"]) * 1000, 2),
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    }
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    session["profiler"].dump_stats(artifact_path(profile_id))
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+        json.dump(meta, f)
+
+    prune()
+    return meta
+
+
+def prune():
+    ids = list_ids()
+    for profile_id in ids[PROFILE_KEEP:]:
+        for ext in ("prof", "json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f"{profile_id}.{ext}"))
+            except OSError:
+                pass
+
+
+# =====================================================
+# ARTIFACTS
+# =====================================================
+def artifact_path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+
+
+def valid_id(profile_id):
+    return bool(PROFILE_ID_RE.match(profile_id or ""))
+
+
+def list_ids():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = [name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith(".json")]
+    return sorted(ids, reverse=True)
+
+
+def load_meta(profile_id):
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_profiles(limit=50):
+    return [meta for meta in map(load_meta, list_ids()[:limit]) if meta]
+
+
+def render_text(profile_id, sort="cumulative", limit=40):
+    if sort not in PROFILE_SORTS:
+        sort = "cumulative"
+    out = io.StringIO()
+    stats = pstats.Stats(artifact_path(profile_id), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+# =====================================================
+# MEMORY (tracemalloc)
+# =====================================================
+# Tracing costs memory and CPU, so it is off unless CVARA_TRACEMALLOC=1 or
+# an admin starts it through /api/admin/memory?trace=on.
+if os.environ.get("CVARA_TRACEMALLOC") == "1":
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def set_tracing(enabled):
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def memory_report(limit=20, group_by="lineno"):
+    if group_by not in MEMORY_GROUPS:
+        group_by = "lineno"
+
+    report = {
+        "tracing": tracemalloc.is_tracing(),
+        # ru_maxrss is KiB on Linux
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        "caches": cache_stats(),
+        "top": []
+    }
+    if not report["tracing"]:
+        return report
+
+    current, peak = tracemalloc.get_traced_memory()
+    report["traced_kb"] = round(current / 1024, 1)
+    report["traced_peak_kb"] = round(peak / 1024, 1)
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    for stat in snapshot.statistics(group_by)[:limit]:
+        report["top"].append({
+            "site": stat.traceback.format()[-1].strip() if group_by == "traceback" else str(stat.traceback[0]),
+            "traceback": stat.traceback.format() if group_by == "traceback" else None,
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count
+        })
+    return report
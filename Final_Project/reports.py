@@ -0,0 +1,344 @@
+import hashlib
+import json
+import os
+import queue
+import time
+from datetime import datetime, UTC
+from threading import Event, Lock, Thread, get_ident
+
+import pandas as pd
+
+from db import get_db, DB_DIR
+import shared_cache
+import universe
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+REPORT_DIR = os.path.join(DB_DIR, "reports")
+REPORT_WINDOWS = [7, 30, 90, 365]
+REPORT_FORMATS = ["pdf", "csv"]
+REPORT_WORKERS = 2
+REPORT_JOB_TTL = 24 * 3600
+REPORT_HEARTBEAT = 30       # seconds between heartbeats of a running job
+REPORT_STALE_AFTER = 300    # queued/running jobs silent this long are re-queued
+
+REPORT_COLUMNS = [
+    "days", "coin_symbol", "coin_name", "volatility",
+    "beta", "sharpe", "var", "risk"
+]
+
+
+# =====================================================
+# JOB QUEUE
+# =====================================================
+# Jobs are keyed by the content hash of what goes into the report, so the
+# job id doubles as the artifact name and identical requests share one file.
+# Job records live in shared_cache, so any worker process can answer a
+# status poll for a job queued on another one. The queue itself is per
+# process: a job whose heartbeat stops (its process died or restarted)
+# is queued again by the next submit or status poll.
+job_queue = queue.Queue()
+workers_started = False
+workers_lock = Lock()
+
+
+def covering_run(cur, days, coins):
+    # {"run_id", "computed_at", "scope"} of the newest run of a window that
+    # holds every coin asked for, or None. A complete universe run always
+    # does; a page run (the default view) only when all of them are on it,
+    # so more coins than a page only ever get a universe run.
+    if len(coins) > universe.PAGE_SIZE:
+        cur.execute("""
+        SELECT run_id, computed_at, scope FROM risk_runs
+        WHERE days=? AND scope='universe'
+        ORDER BY run_id DESC LIMIT 1
+        """, (days,))
+    else:
+        placeholders = ",".join("?" * len(coins))
+        cur.execute(f"""
+        SELECT run_id, computed_at, scope FROM risk_runs r
+        WHERE days=? AND (scope='universe' OR (
+            scope='page'
+            AND run_id > coalesce(
+                (SELECT MAX(run_id) FROM risk_runs WHERE days=r.days AND scope='universe'), 0
+            )
+            AND (
+                SELECT COUNT(*) FROM risk_metrics_snapshot s
+                JOIN coins c ON c.coin_id = s.coin_id
+                WHERE s.days = r.days AND s.run_id = r.run_id AND c.coin_name IN ({placeholders})
+            ) = (SELECT COUNT(*) FROM coins WHERE coin_name IN ({placeholders}))
+        ))
+        ORDER BY run_id DESC LIMIT 1
+        """, (days, *coins, *coins))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def latest_runs(windows, coins):
+    # {days: {"run_id", "computed_at"}} of each window's newest run that
+    # covers the coins; a report never mixes in a run that lacks some
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        out = {}
+        for days in windows:
+            run = covering_run(cur, days, coins)
+            if run:
+                out[days] = {"run_id": run["run_id"], "computed_at": run["computed_at"]}
+        return out
+    finally:
+        conn.close()
+
+
+def report_key(snapshots, coins, windows, fmt):
+    blob = json.dumps({
+        "snapshots": {str(k): v for k, v in sorted(snapshots.items())},
+        "coins": sorted(coins),
+        "windows": sorted(windows),
+        "format": fmt
+    }, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+def artifact_path(job_id, fmt):
+    return os.path.join(REPORT_DIR, f"{job_id}.{fmt}")
+
+
+def start_workers():
+    global workers_started
+    with workers_lock:
+        if workers_started:
+            return
+        workers_started = True
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        for _ in range(REPORT_WORKERS):
+            Thread(target=worker_loop, daemon=True).start()
+
+
+def stale(job):
+    return (
+        job["status"] in ("queued", "running")
+        and time.time() - job.get("heartbeat", 0) > REPORT_STALE_AFTER
+    )
+
+
+def enqueue(key, job):
+    job["status"], job["heartbeat"] = "queued", time.time()
+    shared_cache.set(key, job, REPORT_JOB_TTL)
+    start_workers()
+    job_queue.put(job["job_id"])
+    return job
+
+
+def submit_report(coins, windows=None, fmt="pdf"):
+    windows = sorted(set(windows or REPORT_WINDOWS))
+    coins = sorted(set(coins))
+    snapshots = latest_runs(windows, coins)
+    job_id = report_key(snapshots, coins, windows, fmt)
+    path = artifact_path(job_id, fmt)
+
+    key = f"report:{job_id}"
+    previous = shared_cache.get(key)
+    if previous and previous["status"] != "failed" and not stale(previous):
+        return previous
+
+    job = {
+        "job_id": job_id,
+        "format": fmt,
+        "coins": coins,
+        "windows": windows,
+        "snapshots": {str(k): v for k, v in snapshots.items()},
+        "status": "queued",
+        "error": None,
+        "submitted_at": datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S"),
+        "finished_at": None,
+        "heartbeat": time.time()
+    }
+    if os.path.exists(path):
+        job["status"] = "done"
+        job["finished_at"] = job["submitted_at"]
+        shared_cache.set(key, job, REPORT_JOB_TTL)
+        return job
+
+    if not previous and not shared_cache.add(key, job, REPORT_JOB_TTL):
+        # Another worker queued the same report a moment ago
+        return shared_cache.get(key)
+    return enqueue(key, job)
+
+
+def job_status(job_id):
+    if len(job_id) != 32 or any(c not in "0123456789abcdef" for c in job_id):
+        return None
+    key = f"report:{job_id}"
+    job = shared_cache.get(key)
+    if job and stale(job):
+        return enqueue(key, job)
+    if job:
+        return job
+    # Artifacts outlive the job records (restarts, expired entries)
+    for fmt in REPORT_FORMATS:
+        if os.path.exists(artifact_path(job_id, fmt)):
+            return {"job_id": job_id, "format": fmt, "status": "done", "error": None}
+    return None
+
+
+def worker_loop():
+    while True:
+        job_id = job_queue.get()
+        key = f"report:{job_id}"
+        job = shared_cache.get(key)
+        if not job or job["status"] != "queued":
+            job_queue.task_done()
+            continue
+        job["status"], job["heartbeat"] = "running", time.time()
+        shared_cache.set(key, job, REPORT_JOB_TTL)
+
+        finished = Event()
+        beat = Thread(target=heartbeat, args=(key, job, finished), daemon=True)
+        beat.start()
+        try:
+            build_report(job)
+            job["status"], job["error"] = "done", None
+        except Exception as e:
+            job["status"], job["error"] = "failed", str(e)
+        finished.set()
+        beat.join()
+
+        job["finished_at"] = datetime.now(UTC).strftime("%Y-%m-%d %H:%M:%S")
+        shared_cache.set(key, job, REPORT_JOB_TTL)
+        job_queue.task_done()
+
+
+def heartbeat(key, job, finished):
+    while not finished.wait(REPORT_HEARTBEAT):
+        shared_cache.set(key, dict(job, heartbeat=time.time()), REPORT_JOB_TTL)
+
+
+# =====================================================
+# REPORT DATA
+# =====================================================
+def load_report_frame(snapshots, coins):
+    # Only the requested coins are read, not the whole snapshot universe
+    conn = get_db()
+    frames = []
+    try:
+        for days, run in snapshots.items():
+            for chunk in (universe.chunks(coins) if coins else [None]):
+                coin_filter = f"AND c.coin_name IN ({','.join('?' * len(chunk))})" if chunk else ""
+                q = f"""
+                SELECT c.coin_name, c.symbol, r.volatility, r.sharpe, r.beta, r.var, k.risk
+                FROM risk_metrics_snapshot r
+                JOIN coins c ON r.coin_id = c.coin_id
+                LEFT JOIN risk_classification_snapshot k
+                    ON k.days = r.days AND k.run_id = r.run_id AND k.coin_id = r.coin_id
+                WHERE r.days=? AND r.run_id=? {coin_filter}
+                """
+                df = pd.read_sql(q, conn, params=(int(days), run["run_id"], *(chunk or [])))
+                df["days"] = int(days)
+                frames.append(df)
+    finally:
+        conn.close()
+
+    if not frames:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+
+    df = pd.concat(frames, ignore_index=True)
+
+    df["coin_symbol"] = df["symbol"].fillna(df["coin_name"].str.upper())
+    df["coin_name"] = df["coin_name"].str.title()
+    # Tiers come from the classification stage (classification.py); runs
+    # saved before it existed have none
+    df["risk"] = df["risk"].fillna("Unclassified")
+    for col in ["volatility", "beta", "sharpe", "var"]:
+        df[col] = df[col].round(2)
+
+    return df[REPORT_COLUMNS].sort_values(["days", "coin_symbol"]).reset_index(drop=True)
+
+
+def build_report(job):
+    snapshots = {int(k): v for k, v in job["snapshots"].items()}
+    if not snapshots:
+        raise ValueError("No risk snapshot available. Run /api/risk-metrics-batch first.")
+
+    df = load_report_frame(snapshots, job["coins"])
+    path = artifact_path(job["job_id"], job["format"])
+    # A re-queued job may still be building elsewhere: own temp file each
+    tmp_path = path + f".{os.getpid()}.{get_ident()}.tmp"
+
+    if job["format"] == "csv":
+        df.to_csv(tmp_path, index=False)
+    else:
+        build_pdf(df, snapshots, tmp_path)
+
+    # Publish atomically so a poller never downloads a half-written file
+    os.replace(tmp_path, path)
+
+
+def build_pdf(df, snapshots, path):
+    # reportlab is only needed by the workers, keep it off the import path
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib import colors
+    from reportlab.platypus import (
+        SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+    )
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.graphics.charts.barcharts import VerticalBarChart
+
+    styles = getSampleStyleSheet()
+    story = [
+        Paragraph("Crypto Volatility &amp; Risk Report", styles["Title"]),
+        Paragraph(
+            f"Generated: {datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S')} UTC",
+            styles["Normal"]
+        ),
+        Spacer(1, 12)
+    ]
+
+    table_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#071a2f")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("FONTSIZE", (0, 0), (-1, -1), 8)
+    ])
+    cols = ["coin_symbol", "coin_name", "volatility", "beta", "sharpe", "var", "risk"]
+
+    # ---------- one section per window ----------
+    for days in sorted(snapshots):
+        part = df[df["days"] == days]
+        story.append(Paragraph(f"{days}-Day Window", styles["Heading2"]))
+        story.append(Paragraph(f"Snapshot: {snapshots[days]['computed_at']}", styles["Normal"]))
+
+        if part.empty:
+            story.append(Paragraph("No data", styles["Normal"]))
+            continue
+
+        chart = Drawing(450, 180)
+        bars = VerticalBarChart()
+        bars.x, bars.y, bars.width, bars.height = 40, 30, 380, 130
+        bars.data = [part["volatility"].tolist()]
+        bars.categoryAxis.categoryNames = part["coin_symbol"].tolist()
+        bars.valueAxis.valueMin = 0
+        bars.bars[0].fillColor = colors.HexColor("#00ffad")
+        chart.add(bars)
+        story.append(chart)
+
+        table = Table([cols] + part[cols].values.tolist())
+        table.setStyle(table_style)
+        story.append(table)
+        story.append(Spacer(1, 18))
+
+    # ---------- one page per coin ----------
+    coin_cols = ["days", "volatility", "beta", "sharpe", "var", "risk"]
+    for symbol, part in df.groupby("coin_symbol"):
+        story.append(PageBreak())
+        story.append(Paragraph(
+            f"{part['coin_name'].iloc[0]} ({symbol})", styles["Heading2"]
+        ))
+        table = Table([coin_cols] + part[coin_cols].values.tolist())
+        table.setStyle(table_style)
+        story.append(table)
+
+    SimpleDocTemplate(path, pagesize=A4).build(story)
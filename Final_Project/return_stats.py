@@ -0,0 +1,100 @@
+import math
+import time
+
+from db import get_db, DAILY, bar_ts
+import universe
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Per-coin return statistics computed inside SQLite: LAG() turns each
+# coin's daily closes into returns, window ranks place the VaR quantile and
+# plain aggregates (count, sums, sums of squares and cross products with
+# the market's return on the same day, found by a window over each day)
+# summarize them. One row per coin comes back instead of every price.
+# Windows partition by the integer coin_id: sorting on names costs more.
+MARKET = "bitcoin"
+VAR_QUANTILE = 0.05
+
+RETURN_STATS = """
+WITH windowed AS (
+    SELECT p.coin_id, p.ts,
+           p.price / LAG(p.price) OVER (PARTITION BY p.coin_id ORDER BY p.ts) - 1 AS r
+    FROM coins c
+    JOIN prices p ON p.coin_id = c.coin_id
+    WHERE c.coin_name IN ({placeholders})
+    AND p.granularity = {daily} AND p.ts >= ?
+),
+ranked AS (
+    SELECT coin_id, r,
+           ROW_NUMBER() OVER w - 1 AS k,
+           CAST((COUNT(*) OVER w - 1) * {quantile} AS INTEGER) AS q,
+           MAX(CASE WHEN coin_id = (SELECT coin_id FROM coins WHERE coin_name = ?) THEN r END)
+               OVER (PARTITION BY ts) AS m
+    FROM windowed
+    WHERE r IS NOT NULL
+    WINDOW w AS (PARTITION BY coin_id ORDER BY r ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+)
+SELECT
+    (SELECT coin_name FROM coins WHERE coin_id = ranked.coin_id) AS coin_name,
+    COUNT(*) AS n,
+    SUM(r) AS sum_r,
+    SUM(r * r) AS sum_rr,
+    MAX(CASE WHEN k = q THEN r END) AS q_low,
+    MAX(CASE WHEN k = q + 1 THEN r END) AS q_high,
+    COUNT(m) AS pairs,
+    SUM(CASE WHEN m IS NOT NULL THEN r END) AS pair_r,
+    SUM(m) AS sum_m,
+    SUM(m * m) AS sum_mm,
+    SUM(r * m) AS sum_rm
+FROM ranked
+GROUP BY coin_id
+"""
+
+
+def summarize_row(r):
+    # Sample std (ddof=1), market beta as sample covariance over the
+    # market's population variance on shared days, VaR as the linearly
+    # interpolated 5th percentile: the same numbers pandas/numpy gave
+    n = r["n"]
+    mean = r["sum_r"] / n
+    std = math.sqrt(max(r["sum_rr"] - n * mean * mean, 0) / (n - 1))
+
+    h = (n - 1) * VAR_QUANTILE
+    high = r["q_high"] if r["q_high"] is not None else r["q_low"]
+    quantile = r["q_low"] + (h - math.floor(h)) * (high - r["q_low"])
+
+    beta = 0
+    pairs = r["pairs"]
+    if pairs > 1:
+        market_var = (r["sum_mm"] - r["sum_m"] ** 2 / pairs) / pairs
+        if market_var > 0:
+            covariance = (r["sum_rm"] - r["pair_r"] * r["sum_m"] / pairs) / (pairs - 1)
+            beta = covariance / market_var
+
+    return {"n": n, "mean": mean, "std": std, "beta": beta, "var": abs(quantile)}
+
+
+def summarize(coins, days, market=MARKET):
+    # {coin: {"n", "mean", "std", "beta", "var"}} over the last `days`
+    # daily bars (the window ends with today's), for coins with at least
+    # two returns in it; the market is always summarized too
+    coins = list(dict.fromkeys([market, *coins]))
+    start = bar_ts(time.time()) - (days - 1) * DAILY
+    out = {}
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        # The market rides along in every chunk so each one can join it
+        for chunk in universe.chunks(coins[1:] or coins):
+            chunk = list(dict.fromkeys([market, *chunk]))
+            cur.execute(RETURN_STATS.format(
+                placeholders=",".join("?" * len(chunk)), daily=DAILY, quantile=VAR_QUANTILE
+            ), (*chunk, start, market))
+            for r in cur.fetchall():
+                if r["n"] > 1:
+                    out[r["coin_name"]] = summarize_row(r)
+    finally:
+        conn.close()
+    return out
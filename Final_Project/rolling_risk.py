@@ -0,0 +1,307 @@
+import json
+import math
+import os
+import time
+import warnings
+from threading import Lock
+
+import numpy as np
+
+import price_cube
+import shared_cache
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Rolling ROLLING_WINDOW-day volatility, VaR and beta of every coin on
+# every day of the price cube, computed in one vectorized pass: cumulative
+# sums over the days x coins return matrix give each window's count, mean,
+# variance and covariance with the market; VaR sorts strided window views a
+# block of days at a time. Results are float32 (metric, day, coin) arrays in
+# CUBE_DIR/rolling-<version>.f32, laid out like the cube, plus
+# rolling.json (shape, coins, VaR backtest per coin).
+ROLLING_WINDOW = 30
+MIN_OBS = 20                # fewer returns in a window -> no value
+VAR_LEVEL = 0.05
+MARKET = "bitcoin"
+METRICS = ("volatility", "var", "beta")
+DAY_BLOCK = 128             # windows sorted at once for VaR (bounds memory)
+PAGE_SIZE = 20              # coins per /api/risk-history page
+ROLLING_LOOP_INTERVAL = 60  # seconds between checks for a new cube day (app.rolling_loop)
+REFRESH_WAIT = 120          # seconds the loop waits for another worker's rebuild
+RETRY_AFTER = 10            # Retry-After while the first build is running
+INDEX_PATH = os.path.join(price_cube.CUBE_DIR, "rolling.json")
+
+_state = {"mtime": None, "checked": 0.0, "rolling": None}
+_state_lock = Lock()
+
+
+# =====================================================
+# ENGINE
+# =====================================================
+def window_sums(a, window):
+    # Sum over the `window` rows ending at each row (fewer at the top)
+    c = np.cumsum(a, axis=0)
+    out = c.copy()
+    out[window:] -= c[:-window]
+    return out
+
+def rolling_var(returns, counts, window):
+    # VaR (positive %, np.percentile's linear interpolation) of each full
+    # window, DAY_BLOCK window ends at a time; NaNs sort last
+    days, coins = returns.shape
+    out = np.full((days, coins), np.nan)
+    views = np.lib.stride_tricks.sliding_window_view(returns, window, axis=0)
+    for a in range(0, len(views), DAY_BLOCK):
+        block = np.sort(views[a:a + DAY_BLOCK], axis=-1)
+        n = counts[window - 1 + a:window - 1 + a + len(block)]
+        h = (np.maximum(n, 1) - 1) * VAR_LEVEL
+        lo = np.floor(h).astype(np.int64)
+        hi = np.minimum(lo + 1, np.maximum(n, 1) - 1).astype(np.int64)
+        low = np.take_along_axis(block, lo[..., None], axis=-1)[..., 0]
+        high = np.take_along_axis(block, hi[..., None], axis=-1)[..., 0]
+        out[window - 1 + a:window - 1 + a + len(block)] = np.abs(low + (h - lo) * (high - low)) * 100
+    return out
+
+def compute(prices, market_slot=None, window=ROLLING_WINDOW):
+    # prices: days x coins closes (NaN = no bar) -> {metric: days x coins},
+    # the value on day t covering the returns of days t - window + 1 .. t.
+    # Same estimators as compute_risk_payload: sample std, sample covariance
+    # over the market's population variance on shared days.
+    returns = np.full(prices.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns[1:] = prices[1:] / prices[:-1] - 1
+    valid = ~np.isnan(returns)
+    x = np.where(valid, returns, 0.0)
+
+    n = window_sums(valid.astype(np.float64), window)
+    s1 = window_sums(x, window)
+    s2 = window_sums(x * x, window)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = np.maximum(s2 - s1 * s1 / n, 0) / (n - 1)
+        volatility = np.sqrt(variance) * np.sqrt(365) * 100
+
+        beta = np.full(prices.shape, np.nan)
+        if market_slot is not None:
+            pair = valid & valid[:, [market_slot]]
+            xp = np.where(pair, x, 0.0)
+            mp = np.where(pair, x[:, [market_slot]], 0.0)
+            k = window_sums(pair.astype(np.float64), window)
+            sx, sm = window_sums(xp, window), window_sums(mp, window)
+            covariance = (window_sums(xp * mp, window) - sx * sm / k) / (k - 1)
+            market_var = (window_sums(mp * mp, window) - sm * sm / k) / k
+            beta = np.where((k > 1) & (market_var > 0), covariance / market_var, 0.0)
+            beta[k < MIN_OBS] = np.nan
+
+    var = rolling_var(returns, n, window) if len(returns) >= window else np.full(prices.shape, np.nan)
+    enough = n >= MIN_OBS
+    enough[:window - 1] = False
+    return {
+        "returns": returns,
+        "volatility": np.where(enough, volatility, np.nan),
+        "var": np.where(enough, var, np.nan),
+        "beta": np.where(enough, beta, np.nan)
+    }
+
+
+# =====================================================
+# VAR BACKTEST
+# =====================================================
+def log_likelihood(hits, misses, p):
+    # hits * ln p + misses * ln(1 - p), with 0 * ln 0 = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (
+            np.where(hits > 0, hits * np.log(p), 0.0)
+            + np.where(misses > 0, misses * np.log1p(-p), 0.0)
+        )
+
+def chi2_sf(lr, dof):
+    # Survival function of chi-square with 1 or 2 degrees of freedom
+    lr = max(float(lr), 0.0)
+    return math.erfc(math.sqrt(lr / 2)) if dof == 1 else math.exp(-lr / 2)
+
+def backtest(var, returns):
+    # Day t's VaR against day t + 1's return, per coin. Kupiec's POF test
+    # checks the breach rate against VAR_LEVEL, Christoffersen's test that
+    # breaches don't cluster (independence), and both together give
+    # conditional coverage. Returns arrays per coin.
+    forecast, realized = var[:-1] / 100, returns[1:]
+    valid = ~np.isnan(forecast) & ~np.isnan(realized)
+    breach = valid & (realized < -forecast)
+
+    obs = valid.sum(axis=0).astype(np.float64)
+    hits = breach.sum(axis=0).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = hits / obs
+        lr_pof = -2 * (log_likelihood(hits, obs - hits, VAR_LEVEL) - log_likelihood(hits, obs - hits, rate))
+
+        # Transitions between consecutive days that both have a forecast
+        pairs = valid[:-1] & valid[1:]
+        prev, curr = breach[:-1], breach[1:]
+        n00 = (pairs & ~prev & ~curr).sum(axis=0).astype(np.float64)
+        n01 = (pairs & ~prev & curr).sum(axis=0).astype(np.float64)
+        n10 = (pairs & prev & ~curr).sum(axis=0).astype(np.float64)
+        n11 = (pairs & prev & curr).sum(axis=0).astype(np.float64)
+        pi0 = n01 / (n00 + n01)
+        pi1 = n11 / (n10 + n11)
+        pi = (n01 + n11) / (n00 + n01 + n10 + n11)
+        lr_ind = -2 * (
+            log_likelihood(n01 + n11, n00 + n10, pi)
+            - log_likelihood(n01, n00, pi0)
+            - log_likelihood(n11, n10, pi1)
+        )
+    return {"observations": obs, "breaches": hits, "rate": rate, "pof": lr_pof, "ind": lr_ind}
+
+def backtest_summary(tests, i):
+    obs = int(tests["observations"][i])
+    if obs < MIN_OBS:
+        return None
+    pof = float(np.nan_to_num(tests["pof"][i]))
+    ind = float(np.nan_to_num(tests["ind"][i]))
+    return {
+        "observations": obs,
+        "breaches": int(tests["breaches"][i]),
+        "expected": round(obs * VAR_LEVEL, 2),
+        "breach_rate": round(float(tests["rate"][i]), 4),
+        "kupiec": {"lr": round(pof, 4), "p_value": round(chi2_sf(pof, 1), 4)},
+        "christoffersen": {"lr": round(ind, 4), "p_value": round(chi2_sf(ind, 1), 4)},
+        "conditional_coverage": {"lr": round(pof + ind, 4), "p_value": round(chi2_sf(pof + ind, 2), 4)}
+    }
+
+
+# =====================================================
+# STORAGE
+# =====================================================
+def read_index():
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def open_series(index, mode="r"):
+    return np.memmap(
+        os.path.join(price_cube.CUBE_DIR, index["file"]), dtype=np.float32, mode=mode,
+        shape=(len(METRICS), index["days"], len(index["coins"]))
+    )
+
+def current():
+    # This process's mapping, reopened when rolling.json changes
+    now = time.monotonic()
+    with _state_lock:
+        if now - _state["checked"] < price_cube.RELOAD_CHECK:
+            return _state["rolling"]
+        _state["checked"] = now
+        try:
+            mtime = os.stat(INDEX_PATH).st_mtime_ns
+        except FileNotFoundError:
+            _state.update(mtime=None, rolling=None)
+            return None
+        if mtime != _state["mtime"]:
+            index = read_index()
+            rolling = None
+            if index and index["days"] and index["coins"]:
+                rolling = {
+                    "index": index,
+                    "data": open_series(index),
+                    "slots": {coin: i for i, coin in enumerate(index["coins"])}
+                }
+            _state.update(mtime=mtime, rolling=rolling)
+        return _state["rolling"]
+
+def rebuild():
+    # Whole history from the price cube into a new file; readers switch
+    # over when rolling.json is replaced. The cube's index is read from disk,
+    # not this process's mapping, so a sync just before is always seen.
+    source = price_cube.read_index()
+    if not source or not source["days"]:
+        return None
+    coins = list(source["coins"])
+    prices = np.array(price_cube.open_cube(source)[:, :len(coins)], dtype=np.float64)
+    market = coins.index(MARKET) if MARKET in coins else None
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        series = compute(prices, market)
+        tests = backtest(series["var"], series["returns"])
+
+    version = int(time.time() * 1000)
+    index = {
+        "version": version,
+        "file": f"rolling-{version}.f32",
+        "computed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(version / 1000)),
+        "cube_version": source["version"],
+        "start": source["start"],
+        "days": len(prices),
+        "coins": coins,
+        "window": ROLLING_WINDOW,
+        "var_level": VAR_LEVEL,
+        "backtest": {coin: backtest_summary(tests, i) for i, coin in enumerate(coins)}
+    }
+    data = open_series(index, "w+")
+    for m, metric in enumerate(METRICS):
+        data[m] = series[metric]
+    data.flush()
+    del data
+
+    old = read_index()
+    tmp = INDEX_PATH + f".{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, INDEX_PATH)
+    if old and old["file"] != index["file"]:
+        try:
+            os.remove(os.path.join(price_cube.CUBE_DIR, old["file"]))
+        except OSError:
+            pass
+    return index
+
+def stale():
+    # No series yet, or the cube was rebuilt / gained a day since
+    cube, rolling = price_cube.current(), current()
+    if cube is None:
+        return False
+    if rolling is None:
+        return True
+    index = rolling["index"]
+    return index["cube_version"] != cube["index"]["version"] or index["days"] != cube["index"]["days"]
+
+def refresh(wait=REFRESH_WAIT):
+    # Called by the background loop, never on a request: one worker
+    # rebuilds, the others reuse its file, and readers keep the previous
+    # build until rolling.json is replaced
+    if not stale():
+        return current()
+    with shared_cache.lock("rolling-risk", ttl=300, wait=wait):
+        _state["checked"] = 0.0
+        if stale():
+            rebuild()
+            _state["checked"] = 0.0
+    return current()
+
+
+# =====================================================
+# READS
+# =====================================================
+def series(coins, days):
+    # (dates, {coin: {metric: values}}) over the last `days` days; NaN
+    # becomes None so the payload stays valid JSON
+    rolling = current()
+    if rolling is None:
+        return [], {}
+    index, data = rolling["index"], rolling["data"]
+    first = max(index["days"] - days, 0)
+    dates = price_cube.day_labels(index["start"], first, index["days"] - first).tolist()
+    out = {}
+    for coin in coins:
+        slot = rolling["slots"].get(coin)
+        if slot is None:
+            continue
+        values = np.round(data[:, first:, slot].astype(np.float64), 4).tolist()
+        out[coin] = {
+            metric: [None if v != v else v for v in values[m]]
+            for m, metric in enumerate(METRICS)
+        }
+    return dates, out
@@ -0,0 +1,180 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from threading import Lock, local
+from weakref import WeakValueDictionary
+
+from db import DB_DIR
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Separate file from cvara.db so cache churn never competes with the
+# application's write lock.
+CACHE_DB_PATH = os.environ.get("CVARA_CACHE_DB", os.path.join(DB_DIR, "shared_cache.db"))
+LOCK_POLL_SECONDS = 0.05
+
+_local = local()
+_owner = {}
+# Lock names can come from requests (risk_cache_key digests a client's
+# coin list): an entry lives only while some thread holds or waits on it
+_named_locks = WeakValueDictionary()
+_named_locks_guard = Lock()
+
+
+# =====================================================
+# CONNECTION
+# =====================================================
+def owner_id():
+    # Unique per process (checked by pid, so forked workers differ):
+    # leases are owned by a worker, not by a thread
+    pid = os.getpid()
+    if pid not in _owner:
+        _owner[pid] = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}"
+    return _owner[pid]
+
+
+def get_cache_db():
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    os.makedirs(os.path.dirname(CACHE_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA busy_timeout = 5000;")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        expires_at REAL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT,
+        expires_at REAL
+    )
+    """)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+# =====================================================
+# KEY / VALUE
+# =====================================================
+def get(key, default=None):
+    row = get_cache_db().execute(
+        "SELECT value, expires_at FROM cache WHERE key=?", (key,)
+    ).fetchone()
+    if row is None or (row[1] is not None and row[1] < time.time()):
+        return default
+    return json.loads(row[0])
+
+
+def get_prefix(prefix):
+    # Every live entry whose key starts with prefix, as {key: value}
+    rows = get_cache_db().execute(
+        "SELECT key, value FROM cache WHERE key >= ? AND key < ? "
+        "AND (expires_at IS NULL OR expires_at >= ?)",
+        (prefix, prefix + "\uffff", time.time())
+    ).fetchall()
+    return {key: json.loads(value) for key, value in rows}
+
+
+def set(key, value, ttl=None):
+    expires_at = time.time() + ttl if ttl else None
+    get_cache_db().execute("""
+    INSERT INTO cache (key, value, expires_at) VALUES (?,?,?)
+    ON CONFLICT(key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at
+    """, (key, json.dumps(value, default=float), expires_at))
+
+
+def add(key, value, ttl=None):
+    # Set only if absent (or expired); True means this process won the key
+    now = time.time()
+    expires_at = now + ttl if ttl else None
+    cur = get_cache_db().execute("""
+    INSERT INTO cache (key, value, expires_at) VALUES (?,?,?)
+    ON CONFLICT(key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at
+    WHERE cache.expires_at IS NOT NULL AND cache.expires_at < ?
+    """, (key, json.dumps(value, default=float), expires_at, now))
+    return cur.rowcount == 1
+
+
+def delete(key):
+    get_cache_db().execute("DELETE FROM cache WHERE key=?", (key,))
+
+
+def purge_expired():
+    get_cache_db().execute(
+        "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+        (time.time(),)
+    )
+
+
+# =====================================================
+# CROSS-PROCESS LEASES
+# =====================================================
+# A lease is a lock with an expiry, so a crashed worker can't hold it
+# forever. Used both for leader election (ingestion) and single flight.
+def acquire_lease(name, ttl):
+    now = time.time()
+    cur = get_cache_db().execute("""
+    INSERT INTO leases (name, owner, expires_at) VALUES (?,?,?)
+    ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+    WHERE leases.expires_at < ? OR leases.owner = excluded.owner
+    """, (name, owner_id(), now + ttl, now))
+    return cur.rowcount == 1
+
+
+def release_lease(name):
+    get_cache_db().execute(
+        "DELETE FROM leases WHERE name=? AND owner=?", (name, owner_id())
+    )
+
+
+def lease_owner(name):
+    row = get_cache_db().execute(
+        "SELECT owner, expires_at FROM leases WHERE name=?", (name,)
+    ).fetchone()
+    if row is None or row[1] < time.time():
+        return None
+    return row[0]
+
+
+def named_lock(name):
+    with _named_locks_guard:
+        thread_lock = _named_locks.get(name)
+        if thread_lock is None:
+            thread_lock = _named_locks[name] = Lock()
+        return thread_lock
+
+
+@contextmanager
+def lock(name, ttl=60, wait=30):
+    # Leases are per process, so threads of this worker queue up on a
+    # local lock first and only one of them competes for the lease.
+    thread_lock = named_lock(name)
+    if not thread_lock.acquire(timeout=wait):
+        raise TimeoutError(f"could not acquire shared lock {name!r}")
+    try:
+        deadline = time.monotonic() + wait
+        while not acquire_lease(name, ttl):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"could not acquire shared lock {name!r}")
+            time.sleep(LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            release_lease(name)
+    finally:
+        thread_lock.release()
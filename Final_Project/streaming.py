@@ -0,0 +1,115 @@
+import json
+import os
+import queue
+from collections import deque
+from threading import Lock
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 5000
+REPLAY_EVENTS = 50          # events kept for Last-Event-ID reconnects
+SUBSCRIBER_QUEUE_SIZE = 20  # slow clients are dropped once this fills up
+# Each open stream holds a worker thread for its whole life. Keep this
+# below the worker's thread count so plain API requests still get one.
+MAX_SUBSCRIBERS = int(os.environ.get("CVARA_MAX_STREAMS", 8))
+STREAM_RETRY_AFTER = 30     # seconds a turned-away client waits before retrying
+
+
+# =====================================================
+# IN-MEMORY BROADCASTER
+# =====================================================
+# Fan-out of server events to every connected SSE client. Publishing costs
+# one queue put per subscriber; the upstream poll behind an event happens
+# once no matter how many tabs are open.
+class Broadcaster:
+    def __init__(self, replay=REPLAY_EVENTS, max_subscribers=MAX_SUBSCRIBERS):
+        self.lock = Lock()
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.events = deque(maxlen=replay)
+        self.last_id = 0
+
+    def publish(self, event, data, event_id=None):
+        with self.lock:
+            if event_id is None:
+                event_id = self.last_id + 1
+            elif event_id <= self.last_id:
+                return None   # already published (e.g. by the ingestion leader sync)
+            self.last_id = event_id
+            item = (self.last_id, event, json.dumps(data))
+            self.events.append(item)
+            dead = []
+            for q in self.subscribers:
+                try:
+                    q.put_nowait(item)
+                except queue.Full:
+                    dead.append(q)
+            for q in dead:
+                self.subscribers.discard(q)
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(None)
+            return self.last_id
+
+    def subscribe(self, last_event_id=None):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            backlog = self.backlog(last_event_id)
+            self.subscribers.add(q)
+        return q, backlog
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def backlog(self, last_event_id):
+        if not self.events:
+            return []
+        try:
+            last_event_id = int(last_event_id)
+        except (TypeError, ValueError):
+            last_event_id = None
+
+        oldest = self.events[0][0]
+        if last_event_id is None or last_event_id < oldest or last_event_id > self.last_id:
+            # New client or gap we can't fill: events are full snapshots,
+            # so the latest one is enough to resync.
+            return [self.events[-1]]
+        return [e for e in self.events if e[0] > last_event_id]
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def full(self):
+        return self.subscriber_count() >= self.max_subscribers
+
+
+def format_event(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+def event_stream(broadcaster, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+    q, backlog = broadcaster.subscribe(last_event_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for item in backlog:
+            yield format_event(*item)
+        while True:
+            try:
+                item = q.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+                continue
+            if item is None:
+                # dropped for falling behind; the browser reconnects with
+                # Last-Event-ID and gets resynced from the replay buffer
+                return
+            yield format_event(*item)
+    finally:
+        broadcaster.unsubscribe(q)
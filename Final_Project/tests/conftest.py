@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Scratch database, shared cache and cube, set before any project module
+# reads them at import; upstream points at a closed port so nothing leaves
+# the machine
+SCRATCH_DIR = tempfile.mkdtemp(prefix="cvara-tests-")
+os.environ.update({
+    "CVARA_DB_DIR": SCRATCH_DIR,
+    "CVARA_DB_PATH": os.path.join(SCRATCH_DIR, "cvara.db"),
+    "CVARA_CACHE_DB": os.path.join(SCRATCH_DIR, "shared_cache.db"),
+    "CVARA_CUBE_DIR": os.path.join(SCRATCH_DIR, "cube"),
+    "COINGECKO_BASE_URL": "http://127.0.0.1:1/api/v3",
+    "CVARA_ADMIN_TOKEN": "test-admin"
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    # Empty schema in its own file, a writer thread connected to it and an
+    # empty shared cache; returns the db module
+    import db
+    import db_writer
+    import shared_cache
+
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "cvara.db"))
+    db.create_tables()
+    writer = db_writer.DBWriter()
+    monkeypatch.setattr(db_writer, "db_writer", writer)
+    if "app" in sys.modules:
+        monkeypatch.setattr(sys.modules["app"], "db_writer", writer)
+
+    conn = shared_cache.get_cache_db()
+    conn.execute("DELETE FROM cache")
+    conn.execute("DELETE FROM leases")
+    return db
+
+
+@pytest.fixture
+def write(fresh_db):
+    # db_writer.write against the fresh database
+    import db_writer
+    return db_writer.db_writer.write
+
+
+@pytest.fixture
+def cube_dir(tmp_path, monkeypatch):
+    # Price cube and rolling history files under tmp_path, no cached mapping
+    import price_cube
+    import rolling_risk
+
+    path = str(tmp_path / "cube")
+    os.makedirs(path)
+    monkeypatch.setattr(price_cube, "CUBE_DIR", path)
+    monkeypatch.setattr(price_cube, "INDEX_PATH", os.path.join(path, "index.json"))
+    monkeypatch.setattr(rolling_risk, "INDEX_PATH", os.path.join(path, "rolling.json"))
+    monkeypatch.setattr(price_cube, "_state", {"mtime": None, "checked": 0.0, "cube": None})
+    monkeypatch.setattr(rolling_risk, "_state", {"mtime": None, "checked": 0.0, "rolling": None})
+    monkeypatch.setattr(price_cube, "RELOAD_CHECK", 0.0)
+    return path
+
+
+@pytest.fixture
+def client(fresh_db, monkeypatch):
+    # Flask test client; schema is ready, so no startup threads are started
+    import app
+
+    monkeypatch.setattr(app, "db_initialized", True)
+    monkeypatch.setattr(app, "ADMIN_TOKEN", "test-admin")
+    return app.app.test_client()
@@ -0,0 +1,81 @@
+import gc
+import threading
+
+import numpy as np
+import pytest
+
+import bounded_cache
+import shared_cache
+from bounded_cache import BoundedCache
+
+
+def test_least_recently_used_entry_goes_first():
+    cache = BoundedCache("test-lru", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1          # b is now the oldest
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_bytes_bound_evicts_and_rejects_oversized_values():
+    cache = BoundedCache("test-bytes", max_bytes=3000)
+    cache.set("a", np.zeros(150))       # 1200 bytes each
+    cache.set("b", np.zeros(150))
+    cache.set("c", np.zeros(150))
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 2400
+
+    assert cache.set("b", np.zeros(1000)) is False
+    assert cache.get("b") is None       # the old value is dropped, not served stale
+    assert cache.stats()["bytes"] == 1200
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bounded_cache.time, "monotonic", lambda: now[0])
+    cache = BoundedCache("test-ttl", ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_caches_are_reported():
+    BoundedCache("test-report", max_entries=7)
+    stats = {s["name"]: s for s in bounded_cache.cache_stats()}
+    assert stats["test-report"]["max_entries"] == 7
+
+
+def test_named_locks_are_shared_then_released():
+    lock = shared_cache.named_lock("test-lock")
+    assert shared_cache.named_lock("test-lock") is lock
+    del lock
+    gc.collect()
+    assert "test-lock" not in shared_cache._named_locks
+
+
+def test_lock_is_exclusive_across_threads(fresh_db):
+    inside, release = threading.Event(), threading.Event()
+
+    def hold():
+        with shared_cache.lock("test-held", ttl=60, wait=1):
+            inside.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    inside.wait(5)
+    with pytest.raises(TimeoutError):
+        with shared_cache.lock("test-held", ttl=60, wait=0.1):
+            pass
+    assert shared_cache.lease_owner("test-held") == shared_cache.owner_id()
+
+    release.set()
+    holder.join()
+    assert shared_cache.lease_owner("test-held") is None
+    with shared_cache.lock("test-held", ttl=60, wait=1):
+        pass
@@ -0,0 +1,164 @@
+import time
+
+import numpy as np
+import pytest
+
+import app
+import classification
+import db
+import mil4_dash
+import universe
+from db import DAILY, bar_ts
+
+COINS = [coin for coin, _, _ in universe.DEFAULT_COINS]
+VOLS = [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 75.0, 90.0, 120.0, None]
+
+
+def test_fixed_thresholds_ignore_the_run():
+    assert classification.thresholds([1, 2, 3], "fixed") == classification.FIXED_THRESHOLDS
+
+
+def test_quantile_thresholds_rank_the_run():
+    high, medium = classification.thresholds(VOLS, "quantile")
+    values = [v for v in VOLS if v is not None]
+    assert high == pytest.approx(np.quantile(values, 0.66))
+    assert medium == pytest.approx(np.quantile(values, 0.33))
+    assert classification.thresholds([None], "quantile") is None
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        classification.thresholds(VOLS, "median")
+
+
+def test_tier_matches_the_sql_case():
+    cuts = classification.FIXED_THRESHOLDS
+    assert [classification.tier(v, cuts) for v in (None, 34.99, 35, 69.99, 70)] == [
+        None, "Low", "Medium", "Medium", "High"
+    ]
+
+
+def save_run(write, scope):
+    def run(cur):
+        run_id = app.start_risk_run(cur, 30, "2026-01-01 00:00:00", scope)
+        app.save_risk_metrics_snapshots(cur, [
+            {"coin_name": c, "volatility": v, "sharpe": 0, "beta": 0, "var": 0} for c, v in zip(COINS, VOLS)
+        ], 30, run_id, "2026-01-01 00:00:00")
+        return run_id
+    return write(run)
+
+
+def tiers(run_id):
+    conn = db.get_db()
+    try:
+        return {
+            r["coin_name"]: (r["risk"], r["policy"]) for r in conn.execute("""
+            SELECT c.coin_name, k.risk, k.policy FROM risk_classification_snapshot k
+            JOIN coins c ON c.coin_id = k.coin_id WHERE k.run_id=?
+            """, (run_id,))
+        }
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def seeded(write):
+    write(universe.seed_defaults)
+    return write
+
+
+def test_quantile_policy_on_a_universe_run(seeded):
+    run_id = save_run(seeded, "universe")
+    assert seeded(classification.classify_run, 30, run_id, "quantile") == len(COINS)
+    high, medium = classification.thresholds(VOLS, "quantile")
+    expected = {c: (classification.tier(v, (high, medium)), "quantile") for c, v in zip(COINS, VOLS)}
+    assert tiers(run_id) == expected
+    assert tiers(run_id)["chainlink"] == (None, "quantile")
+
+
+@pytest.mark.parametrize("scope", ["page", "partial"])
+def test_partial_runs_get_fixed_thresholds(seeded, scope):
+    run_id = save_run(seeded, scope)
+    seeded(classification.classify_run, 30, run_id, "quantile")
+    cuts = classification.FIXED_THRESHOLDS
+    assert tiers(run_id) == {c: (classification.tier(v, cuts), "fixed") for c, v in zip(COINS, VOLS)}
+
+
+def test_rerun_replaces_tiers(seeded):
+    run_id = save_run(seeded, "universe")
+    seeded(classification.classify_run, 30, run_id, "fixed")
+    seeded(classification.classify_run, 30, run_id, "quantile")
+    assert {policy for _, policy in tiers(run_id).values()} == {"quantile"}
+    assert len(tiers(run_id)) == len(COINS)
+
+
+def test_publish_classifies_over_the_whole_run(seeded, monkeypatch):
+    monkeypatch.setattr(classification.classify_run, "__defaults__", ("quantile",))
+    run_id = save_run(seeded, "partial")
+    seeded(app.publish_risk_run, 30, run_id)
+    assert {policy for _, policy in tiers(run_id).values()} == {"quantile"}
+
+
+# =====================================================
+# MILESTONE 4 DASHBOARD
+# =====================================================
+class Reply:
+    def __init__(self, resp):
+        self.status_code = resp.status_code
+        self.headers = resp.headers
+        self.body = resp.get_json(silent=True)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+@pytest.fixture
+def dash_api(client, seeded, monkeypatch):
+    # The dashboard's HTTP calls go to the test client; records the URLs
+    calls = []
+
+    def get(url, params=None, headers=None, timeout=None):
+        path = url.replace("http://127.0.0.1:5000", "")
+        calls.append((path, params["coins"]))
+        return Reply(client.get(path, query_string=params, headers=headers))
+
+    monkeypatch.setattr(mil4_dash.requests, "get", get)
+    mil4_dash._fetch_cache.clear()
+    return calls
+
+
+def put_closes(write, coins, days=60):
+    ids = write(lambda cur: universe.coin_ids(cur, coins))
+    rng = np.random.default_rng(5)
+    today = bar_ts(time.time())
+    rows = []
+    for coin in coins:
+        closes = 100 * np.cumprod(1 + rng.normal(0, 0.04, days))
+        rows += [(ids[coin], DAILY, today - (days - 1 - i) * DAILY, float(p), 1) for i, p in enumerate(closes)]
+    write(lambda cur: cur.executemany(
+        "INSERT INTO prices (coin_id, granularity, ts, price, updated_at) VALUES (?,?,?,?,?)", rows
+    ))
+
+
+def test_dashboard_falls_back_to_live_metrics_without_a_run(dash_api, seeded):
+    put_closes(seeded, COINS[:3])
+    df = mil4_dash.fetch_data(30, ["ethereum", "bitcoin", "not-a-coin"])
+
+    assert [path for path, _ in dash_api] == ["/api/risk-metrics-latest", "/api/risk-metrics"]
+    assert all(coins == "bitcoin,ethereum" for _, coins in dash_api)
+    assert sorted(df["coin_name"]) == ["bitcoin", "ethereum"]
+    cuts = classification.FIXED_THRESHOLDS
+    assert list(df["risk"]) == [classification.tier(v, cuts) for v in df["volatility"]]
+
+
+def test_dashboard_reads_a_covering_run(dash_api, seeded):
+    run_id = save_run(seeded, "partial")
+    seeded(app.publish_risk_run, 30, run_id)
+    df = mil4_dash.fetch_data(30, ["bitcoin", "gone-coin"])
+    assert [path for path, _ in dash_api] == ["/api/risk-metrics-latest"]
+    assert df.to_dict("records")[0]["coin_name"] == "bitcoin"
+    assert mil4_dash.fetch_data(30, ["gone-coin"]).empty
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+import compaction
+import db
+import universe
+from db import DAILY, HOURLY
+
+CUTOFF = "2026-03-01 00:00:00"
+
+
+def stamp(hours):
+    # fetched_at `hours` after 2026-02-27 00:00 UTC
+    return (datetime(2026, 2, 27, tzinfo=UTC) + timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+@pytest.fixture
+def polls(write):
+    # Two coins polled every 20 minutes for two days before the cutoff and
+    # a few hours after; some volumes missing
+    write(universe.seed_defaults)
+    ids = write(lambda cur: universe.coin_ids(cur, ["bitcoin", "ethereum"]))
+    rows = []
+    for i in range(0, 3 * 56):
+        hours = i / 3
+        for coin, base in (("bitcoin", 100.0), ("ethereum", 10.0)):
+            price = base + (i * 7 % 13) - 6
+            volume = None if i % 5 == 0 else 1000.0 + i
+            rows.append((ids[coin], stamp(hours), price, i / 10, volume))
+    write(lambda cur: cur.executemany(
+        "INSERT INTO market_snapshot (coin_id, fetched_at, price, change_24h, volume) VALUES (?,?,?,?,?)", rows
+    ))
+    return ids, rows
+
+
+def expected_buckets(rows, granularity):
+    out = {}
+    for coin_id, fetched_at, price, change, volume in rows:
+        if fetched_at >= CUTOFF:
+            continue
+        ts = int(datetime.strptime(fetched_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=UTC).timestamp())
+        out.setdefault((coin_id, ts // granularity * granularity), []).append((fetched_at, price, change, volume))
+    return {
+        key: {
+            "min_price": min(p for _, p, _, _ in b), "max_price": max(p for _, p, _, _ in b),
+            "last_price": b[-1][1], "last_change_24h": b[-1][2], "last_at": b[-1][0],
+            "samples": len(b), "volume_samples": sum(v is not None for *_, v in b),
+            "mean_volume": pytest.approx(
+                sum(v for *_, v in b if v is not None) / sum(v is not None for *_, v in b)
+            )
+        }
+        for key, b in out.items()
+    }
+
+
+def rollups(granularity):
+    conn = db.get_db()
+    try:
+        return {
+            (r["coin_id"], r["ts"]): {k: r[k] for k in (
+                "min_price", "max_price", "last_price", "last_change_24h", "last_at",
+                "samples", "volume_samples", "mean_volume"
+            )}
+            for r in conn.execute("SELECT * FROM market_snapshot_rollup WHERE granularity=?", (granularity,))
+        }
+    finally:
+        conn.close()
+
+
+def column(sql):
+    conn = db.get_db()
+    try:
+        return [r[0] for r in conn.execute(sql)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("limit", [compaction.COMPACTION_CHUNK, 7])
+def test_compaction_merges_buckets_split_across_chunks(write, polls, limit):
+    _, rows = polls
+    removed = 0
+    while True:
+        n = write(compaction.compact_snapshots, CUTOFF, limit)
+        if not n:
+            break
+        removed += n
+
+    old = sum(r[1] < CUTOFF for r in rows)
+    assert removed == old
+    assert column("SELECT COUNT(*) FROM market_snapshot")[0] == len(rows) - old
+    assert rollups(HOURLY) == expected_buckets(rows, HOURLY)
+    assert rollups(DAILY) == expected_buckets(rows, DAILY)
+
+
+def test_later_run_merges_into_existing_bucket(write, polls):
+    _, rows = polls
+    # First run only reaches the middle of an hour; the rest comes later
+    first = stamp(10 + 1 / 3)
+    write(compaction.compact_snapshots, first)
+    write(compaction.compact_snapshots, CUTOFF)
+    assert rollups(HOURLY) == expected_buckets(rows, HOURLY)
+    assert rollups(DAILY) == expected_buckets(rows, DAILY)
+
+
+def test_prune_hourly_rollups_keeps_daily(write, polls):
+    write(compaction.compact_snapshots, CUTOFF)
+    epoch = datetime(2026, 3, 1, tzinfo=UTC).timestamp() + compaction.SNAPSHOT_HOURLY_DAYS * DAILY
+    assert write(compaction.prune_hourly_rollups, epoch) == len(expected_buckets(polls[1], HOURLY))
+    assert rollups(DAILY) == expected_buckets(polls[1], DAILY)
+
+
+def add_run(write, coin_ids, days, computed_at, scope):
+    def run(cur):
+        cur.execute("INSERT INTO risk_runs (days, computed_at, scope) VALUES (?,?,?)", (days, computed_at, scope))
+        run_id = cur.lastrowid
+        cur.executemany(
+            "INSERT INTO risk_metrics_snapshot (coin_id, days, run_id, computed_at, volatility) VALUES (?,?,?,?,?)",
+            [(coin_id, days, run_id, computed_at, 50.0) for coin_id in coin_ids]
+        )
+        return run_id
+    return write(run)
+
+
+def test_prune_runs_keeps_the_newest_run_of_each_scope(write):
+    write(universe.seed_defaults)
+    coin_ids = list(write(lambda cur: universe.coin_ids(cur, ["bitcoin", "ethereum", "solana"])).values())
+    old, new = "2026-01-01 00:00:00", "2026-02-20 00:00:00"
+    stale_universe = add_run(write, coin_ids, 30, old, "universe")
+    kept_universe = add_run(write, coin_ids, 30, old, "universe")
+    kept_page = add_run(write, coin_ids, 30, old, "page")
+    other_window = add_run(write, coin_ids, 7, old, "universe")
+    recent = add_run(write, coin_ids, 30, new, "partial")
+
+    removed = 0
+    while True:
+        n = write(compaction.prune_runs, "risk_metrics_snapshot", "2026-02-01 00:00:00", 2)
+        if not n:
+            break
+        removed += n
+    assert removed == len(coin_ids)
+    assert write(compaction.prune_risk_runs, "2026-02-01 00:00:00") == 1
+
+    kept = {kept_universe, kept_page, other_window, recent}
+    assert set(column("SELECT run_id FROM risk_metrics_snapshot")) == kept
+    assert set(column("SELECT run_id FROM risk_runs")) == kept
+    assert stale_universe not in kept
@@ -0,0 +1,96 @@
+import multiprocessing
+import sqlite3
+
+import db
+from db import DAILY, HOURLY, bar_ts, day_ts
+
+
+def legacy_db(path):
+    # coins + the rowid price_history table from before integer time keys
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+    CREATE TABLE coins (coin_id INTEGER PRIMARY KEY AUTOINCREMENT, coin_name TEXT UNIQUE, symbol TEXT);
+    CREATE TABLE price_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, coin_id INTEGER, date TEXT, price REAL
+    );
+    INSERT INTO coins (coin_name, symbol) VALUES ('bitcoin', 'BTC');
+    INSERT INTO price_history (coin_id, date, price) VALUES
+        (1, '2026-01-01', 100.0),
+        (1, '2026-01-02', 101.0),
+        (1, '2026-01-02', 999.0),
+        (1, '2026-01-02 13:00:00', 102.5),
+        (1, 'garbage', 1.0),
+        (NULL, '2026-01-03', 1.0);
+    """)
+    conn.commit()
+    conn.close()
+
+
+def test_bar_and_day_keys():
+    assert bar_ts(86399) == 0
+    assert bar_ts(86400) == DAILY
+    assert bar_ts(7199.9, HOURLY) == HOURLY
+    assert day_ts("2026-01-02") == day_ts("2026-01-02 23:59:59") == 1767312000
+
+
+def test_prices_is_clustered_without_rowid(fresh_db):
+    conn = db.get_db()
+    try:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name='prices'").fetchone()[0]
+        pk = [r["name"] for r in conn.execute("PRAGMA table_info(prices)") if r["pk"]]
+    finally:
+        conn.close()
+    assert "WITHOUT ROWID" in sql
+    assert pk == ["coin_id", "granularity", "ts"]
+
+
+def test_create_tables_is_idempotent(fresh_db):
+    db.create_tables()
+    db.create_tables()
+
+
+def test_legacy_price_history_is_migrated_into_bars(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    legacy_db(path)
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.create_tables()
+
+    conn = db.get_db()
+    try:
+        bars = [tuple(r) for r in conn.execute("SELECT granularity, ts, price FROM prices ORDER BY granularity, ts")]
+        view = [tuple(r) for r in conn.execute("SELECT date, price FROM price_history ORDER BY date")]
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name='price_history'").fetchone()[0]
+    finally:
+        conn.close()
+    day = day_ts("2026-01-02")
+    # First row stored for a bar wins; unparseable dates and orphans are dropped
+    assert bars == [
+        (HOURLY, day + 13 * HOURLY, 102.5),
+        (DAILY, day - DAILY, 100.0),
+        (DAILY, day, 101.0)
+    ]
+    assert kind == "view"
+    assert view == [("2026-01-01", 100.0), ("2026-01-02", 101.0)]
+
+
+def migrate(path):
+    db.DB_PATH = path
+    db.create_tables()
+
+
+def test_concurrent_workers_migrate_a_legacy_file_once(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    legacy_db(path)
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=migrate, args=(path,)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+    assert [worker.exitcode for worker in workers] == [0] * 8
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 3
+    finally:
+        conn.close()
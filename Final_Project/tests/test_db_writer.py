@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+import db
+from db_writer import DBWriter
+
+
+@pytest.fixture
+def writer(fresh_db):
+    writer = DBWriter()
+    writer.write(lambda cur: cur.execute("CREATE TABLE t (v INTEGER UNIQUE)"))
+    return writer
+
+
+def values():
+    conn = db.get_db()
+    try:
+        return sorted(r[0] for r in conn.execute("SELECT v FROM t"))
+    finally:
+        conn.close()
+
+
+def insert(cur, v):
+    cur.execute("INSERT INTO t (v) VALUES (?)", (v,))
+    return v
+
+
+def test_a_failing_job_is_rolled_back_alone(writer):
+    # Queued together, so they share one transaction
+    futures = [writer.submit(insert, v) for v in (1, 2, 1, 3)]
+    assert [f.result() for f in (futures[0], futures[1], futures[3])] == [1, 2, 3]
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[2].result()
+    assert values() == [1, 2, 3]
+
+
+def test_failed_job_keeps_none_of_its_writes(writer):
+    def half(cur):
+        insert(cur, 10)
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        writer.write(half)
+    assert values() == []
+
+
+def test_writer_recovers_when_a_job_ends_the_transaction(writer):
+    # The job's COMMIT takes the batch's savepoint with it: the batch
+    # fails and the writer starts clean for the next one
+    def rogue(cur):
+        insert(cur, 1)
+        cur.execute("COMMIT")
+        raise ValueError("boom")
+
+    with pytest.raises(Exception):
+        writer.write(rogue)
+    assert writer.write(insert, 2) == 2
+    assert 2 in values()
+
+
+def test_writer_survives_a_closed_connection(writer):
+    def close_it(cur):
+        cur.connection.close()
+
+    with pytest.raises(Exception):
+        writer.write(close_it)
+    assert writer.write(insert, 5) == 5
+    assert values() == [5]
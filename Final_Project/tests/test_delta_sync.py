@@ -0,0 +1,67 @@
+import time
+
+import app
+import price_tiers
+import universe
+from db import DAILY, bar_ts
+
+
+def record(coin, rank, price):
+    return {
+        "id": coin, "name": coin.title(), "symbol": coin[:3], "current_price": price,
+        "price_change_percentage_24h": 1.234, "total_volume": 2400.0,
+        "market_cap": 1e9, "market_cap_rank": rank
+    }
+
+
+def ingest(write, records):
+    return write(
+        app.store_market_rows, records, time.time(), "2026-01-01 00:00:00", "2000-01-01", False
+    )
+
+
+def test_market_changes_since_returns_only_newer_snapshots(write):
+    first = ingest(write, [record("bitcoin", 1, 100.0), record("ethereum", 2, 10.0), record("solana", 3, 1.0)])
+    second = ingest(write, [record("bitcoin", 1, 101.0)])
+    assert second > first
+
+    rows, version = app.market_changes_since(first)
+    assert version == second
+    assert [(row["id"], row["current_price"]) for row in rows] == [("bitcoin", 101.0)]
+    assert rows[0]["price_change_percentage_24h"] == 1.23
+
+
+def test_market_changes_since_current_version_is_empty(write):
+    version = ingest(write, [record("bitcoin", 1, 100.0)])
+    assert app.market_changes_since(version) == ([], version)
+
+
+def test_market_changes_since_zero_is_full_page_in_rank_order(write):
+    ingest(write, [record("solana", 3, 1.0), record("bitcoin", 1, 100.0), record("ethereum", 2, 10.0)])
+    ingest(write, [record("bitcoin", 1, 102.0)])
+
+    rows, _ = app.market_changes_since(0)
+    assert [(row["id"], row["current_price"]) for row in rows] == [
+        ("bitcoin", 102.0), ("ethereum", 10.0), ("solana", 1.0)
+    ]
+
+
+def test_history_changes_since_returns_bars_updated_after_version(write):
+    write(universe.seed_defaults)
+    coin_id = write(lambda cur: universe.coin_ids(cur, ["bitcoin"]))["bitcoin"]
+    today = bar_ts(time.time())
+    # Daily points at 00:00 UTC close the previous day
+    old = [[(today - 2 * DAILY) * 1000, 100.0], [(today - DAILY) * 1000, 101.0]]
+    new = [[today * 1000, 102.0]]
+    write(price_tiers.store_points, coin_id, old, None, 1000)
+    write(price_tiers.store_points, coin_id, old + new, None, 2000)
+
+    changes, version = app.history_changes_since(["bitcoin"], 1000)
+    assert version == 2000
+    assert [price for _, price in changes["bitcoin"]] == [102.0]
+
+    changes, _ = app.history_changes_since(["bitcoin"], 0)
+    assert [price for _, price in changes["bitcoin"]] == [100.0, 101.0, 102.0]
+
+    changes, _ = app.history_changes_since(["bitcoin"], 2000)
+    assert changes == {"bitcoin": []}
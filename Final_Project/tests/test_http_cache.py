@@ -0,0 +1,96 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask
+
+import http_cache
+
+
+@pytest.fixture
+def cache_client():
+    app = Flask(__name__)
+    state = {"version": 1, "payload": {"rows": list(range(5))}}
+
+    @app.route("/versioned")
+    def versioned():
+        return http_cache.json_response(
+            state["payload"], version=state["version"], last_modified="2026-01-02 03:04:05"
+        )
+
+    @app.route("/hashed")
+    def hashed():
+        return http_cache.json_response(state["payload"])
+
+    return app.test_client(), state
+
+
+def test_response_carries_weak_etag_and_last_modified(cache_client):
+    client, _ = cache_client
+    r = client.get("/versioned")
+    assert r.status_code == 200
+    assert r.headers["ETag"].startswith('W/"')
+    assert r.headers["Last-Modified"] == "Fri, 02 Jan 2026 03:04:05 GMT"
+    assert r.headers["Cache-Control"] == "no-cache"
+    assert r.get_json() == {"rows": [0, 1, 2, 3, 4]}
+
+
+def test_matching_etag_is_304_until_version_changes(cache_client):
+    client, state = cache_client
+    etag = client.get("/versioned").headers["ETag"]
+
+    r = client.get("/versioned", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.data == b""
+    assert r.headers["ETag"] == etag
+
+    state["version"] = 2
+    r = client.get("/versioned", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+
+def test_etag_depends_on_query_string(cache_client):
+    client, _ = cache_client
+    etag = client.get("/versioned?days=30").headers["ETag"]
+    assert client.get("/versioned?days=90", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_if_modified_since(cache_client):
+    client, _ = cache_client
+    assert client.get(
+        "/versioned", headers={"If-Modified-Since": "Fri, 02 Jan 2026 03:04:05 GMT"}
+    ).status_code == 304
+    assert client.get(
+        "/versioned", headers={"If-Modified-Since": "Thu, 01 Jan 2026 00:00:00 GMT"}
+    ).status_code == 200
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(cache_client):
+    client, _ = cache_client
+    r = client.get("/versioned", headers={
+        "If-None-Match": 'W/"stale"',
+        "If-Modified-Since": "Fri, 02 Jan 2026 03:04:05 GMT"
+    })
+    assert r.status_code == 200
+
+
+def test_unversioned_payload_is_tagged_by_content(cache_client):
+    client, state = cache_client
+    etag = client.get("/hashed").headers["ETag"]
+    assert client.get("/hashed", headers={"If-None-Match": etag}).status_code == 304
+
+    state["payload"] = {"rows": [9]}
+    assert client.get("/hashed", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_large_body_is_compressed_small_body_is_not(cache_client):
+    client, state = cache_client
+    r = client.get("/versioned", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in r.headers
+
+    state["payload"] = {"rows": list(range(2000))}
+    r = client.get("/versioned", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["Vary"]
+    assert json.loads(gzip.decompress(r.data)) == state["payload"]
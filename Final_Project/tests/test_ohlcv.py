@@ -0,0 +1,98 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+import ohlcv
+import universe
+from db import DAILY, HOURLY, bar_ts
+
+
+def random_bars(days, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, days)))
+    open_ = np.r_[100.0, close[:-1]] * np.exp(rng.normal(0, 0.005, days))
+    high = np.maximum(open_, close) * np.exp(rng.uniform(0, 0.03, days))
+    low = np.minimum(open_, close) * np.exp(-rng.uniform(0, 0.03, days))
+    return open_, high, low, close
+
+
+def reference(open_, high, low, close):
+    # The textbook estimators, one coin, plain loops
+    n = len(close)
+    hl = [math.log(h / l) for h, l in zip(high, low)]
+    co = [math.log(c / o) for c, o in zip(close, open_)]
+    parkinson = sum(x * x for x in hl) / n / (4 * math.log(2))
+    garman_klass = sum(0.5 * a * a - (2 * math.log(2) - 1) * b * b for a, b in zip(hl, co)) / n
+    overnight = [math.log(open_[i] / close[i - 1]) for i in range(1, n)]
+    rs = sum(
+        math.log(h / c) * math.log(h / o) + math.log(l / c) * math.log(l / o)
+        for o, h, l, c in zip(open_, high, low, close)
+    ) / n
+    k = 0.34 / (1.34 + (n + 1) / (n - 1))
+    yang_zhang = np.var(overnight, ddof=1) + k * np.var(co, ddof=1) + (1 - k) * rs
+    return {
+        name: math.sqrt(max(v, 0) * 365) * 100
+        for name, v in zip(ohlcv.ESTIMATORS, (parkinson, garman_klass, yang_zhang))
+    }
+
+
+def test_range_volatility_matches_textbook_estimators():
+    bars = random_bars(60)
+    vols = ohlcv.range_volatility({f: np.array([b]) for f, b in zip(ohlcv.FIELDS, bars)})
+    for name, value in reference(*bars).items():
+        assert vols[name][0] == pytest.approx(value, rel=1e-9)
+
+
+def test_constant_range_parkinson():
+    days = 10
+    high, low = np.full(days, math.exp(0.01)), np.full(days, math.exp(-0.01))
+    flat = np.ones(days)
+    vols = ohlcv.range_volatility({"open": flat[None], "high": high[None], "low": low[None], "close": flat[None]})
+    assert vols["parkinson"][0] == pytest.approx(math.sqrt(0.02 ** 2 / (4 * math.log(2)) * 365) * 100)
+
+
+def test_missing_days_are_skipped_and_short_windows_dropped():
+    bars = [np.array([b, b]) for b in random_bars(30)]
+    for b in bars:
+        b[0, ::3] = np.nan
+        b[1, ohlcv.MIN_BARS - 1:] = np.nan
+    vols = ohlcv.range_volatility(dict(zip(ohlcv.FIELDS, bars)))
+    kept = [b[0][~np.isnan(b[0])] for b in bars]
+    assert vols["parkinson"][0] == pytest.approx(reference(*kept)["parkinson"])
+    assert all(np.isnan(vols[name][1]) for name in ohlcv.ESTIMATORS)
+
+
+def test_candles_group_by_close_day_and_drop_the_first():
+    day = 1767225600    # 2026-01-01 00:00 UTC
+    candles = [
+        [(day + 4 * HOURLY) * 1000, 1, 2, 0.5, 1.5],                  # first day, cut
+        [(day + DAILY) * 1000, 1.5, 3, 1, 2],                          # 00:00 close ends it
+        [(day + DAILY + 4 * HOURLY) * 1000, 2, 2.5, 1.8, 2.2],
+        [(day + DAILY + 8 * HOURLY) * 1000, 2.2, 4, 2, 3],
+        [(day + 2 * DAILY) * 1000, 3, 3.5, 0.9, 2.5],                  # ends the second
+    ]
+    assert ohlcv.candles_to_daily(candles) == [(day + DAILY, 2, 4, 0.9, 2.5, None)]
+    assert ohlcv.candles_to_daily([]) == []
+
+
+def test_estimate_leaves_out_todays_partial_bar(write):
+    write(universe.seed_defaults)
+    coin_id = write(lambda cur: universe.coin_ids(cur, ["bitcoin"]))["bitcoin"]
+    today = bar_ts(time.time())
+    open_, high, low, close = random_bars(30)
+    bars = [
+        (today - (30 - i) * DAILY, open_[i], high[i], low[i], close[i], None) for i in range(30)
+    ]
+    write(ohlcv.store_bars, coin_id, bars, "test", 1)
+    before = ohlcv.estimate(["bitcoin", "ethereum"], 30)
+
+    # A few hours into today: a tiny range that would drag every estimate down
+    write(ohlcv.store_bars, coin_id, [(today, close[-1], close[-1] * 1.0001, close[-1], close[-1], None)], "test", 2)
+    after = ohlcv.estimate(["bitcoin", "ethereum"], 30)
+
+    assert list(after) == ["bitcoin"]
+    assert after == before
+    for name, value in reference(open_, high, low, close).items():
+        assert after["bitcoin"][name] == pytest.approx(value)
@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+import pytest
+
+import db
+import price_cube
+import universe
+from db import DAILY, bar_ts
+
+TODAY = bar_ts(time.time())
+
+
+@pytest.fixture
+def ids(write, cube_dir):
+    write(universe.seed_defaults)
+    return write(lambda cur: universe.coin_ids(cur, [coin for coin, _, _ in universe.DEFAULT_COINS]))
+
+
+def put_bars(write, ids, coin, closes, first_day, stamp):
+    # Daily closes from first_day on; None leaves a gap
+    write(lambda cur: cur.executemany(
+        "INSERT OR REPLACE INTO prices (coin_id, granularity, ts, price, updated_at) VALUES (?,?,?,?,?)",
+        [(ids[coin], DAILY, first_day + i * DAILY, p, stamp) for i, p in enumerate(closes) if p is not None]
+    ))
+
+
+def daily_tier(coin):
+    conn = db.get_db()
+    try:
+        return [tuple(r) for r in conn.execute("""
+        SELECT h.date, h.price FROM price_history h JOIN coins c ON c.coin_id = h.coin_id
+        WHERE c.coin_name = ? ORDER BY h.date
+        """, (coin,))]
+    finally:
+        conn.close()
+
+
+def test_rebuild_matches_the_daily_tier(write, ids):
+    rng = np.random.default_rng(3)
+    btc = (100 * np.cumprod(1 + rng.normal(0, 0.02, 40))).tolist()
+    eth = [None if i % 7 == 0 else 10.0 + i for i in range(30)]
+    put_bars(write, ids, "bitcoin", btc, TODAY - 39 * DAILY, 1)
+    put_bars(write, ids, "ethereum", eth, TODAY - 29 * DAILY, 1)
+    index = price_cube.rebuild()
+    assert index["days"] == 40 and index["coins"] == ["bitcoin", "ethereum"]
+
+    for coin in ("bitcoin", "ethereum"):
+        dates, closes = price_cube.series(coin, TODAY - 365 * DAILY, TODAY)
+        assert list(zip(dates.strftime("%Y-%m-%d"), closes.tolist())) == daily_tier(coin)
+    assert price_cube.series("solana", TODAY - DAILY, TODAY) is None
+
+
+def test_series_slices_by_day(write, ids):
+    put_bars(write, ids, "bitcoin", [1.0, 2.0, 3.0, 4.0, 5.0], TODAY - 4 * DAILY, 1)
+    price_cube.rebuild()
+    dates, closes = price_cube.series("bitcoin", TODAY - 3 * DAILY, TODAY - DAILY)
+    assert closes.tolist() == [2.0, 3.0, 4.0]
+    assert len(price_cube.series("bitcoin", TODAY, TODAY - DAILY)[1]) == 0
+
+
+def test_sync_updates_in_place_and_uses_spare_slots(write, ids):
+    stamp = int(time.time() * 1000)
+    put_bars(write, ids, "bitcoin", [1.0, 2.0, 3.0], TODAY - 3 * DAILY, stamp)
+    built = price_cube.rebuild()
+
+    put_bars(write, ids, "bitcoin", [3.5, 4.0], TODAY - DAILY, stamp + 1)
+    put_bars(write, ids, "solana", [7.0], TODAY, stamp + 1)
+    price_cube.sync()
+    index = price_cube.read_index()
+    assert index["file"] == built["file"]
+    assert index["coins"] == ["bitcoin", "solana"]
+    assert index["days"] == built["days"]
+    assert price_cube.series("bitcoin", TODAY - 3 * DAILY, TODAY)[1].tolist() == [1.0, 2.0, 3.5, 4.0]
+    assert price_cube.series("solana", TODAY - 3 * DAILY, TODAY)[1].tolist() == [7.0]
+
+
+def test_sync_rebuilds_for_bars_before_the_start(write, ids):
+    stamp = int(time.time() * 1000)
+    put_bars(write, ids, "bitcoin", [1.0, 2.0], TODAY - DAILY, stamp)
+    built = price_cube.rebuild()
+    time.sleep(0.002)
+
+    put_bars(write, ids, "bitcoin", [0.5], TODAY - 5 * DAILY, stamp + 1)
+    index = price_cube.sync()
+    assert index["file"] != built["file"]
+    assert index["start"] == TODAY - 5 * DAILY
+    assert price_cube.series("bitcoin", TODAY - 5 * DAILY, TODAY)[1].tolist() == [0.5, 1.0, 2.0]
@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+import pytest
+
+import db
+import price_tiers
+import universe
+from db import DAILY, HOURLY, bar_ts
+
+
+@pytest.fixture
+def coin_id(write):
+    write(universe.seed_defaults)
+    return write(lambda cur: universe.coin_ids(cur, ["bitcoin"]))["bitcoin"]
+
+
+def bars(coin_id, granularity):
+    conn = db.get_db()
+    try:
+        return [dict(r) for r in conn.execute(
+            "SELECT * FROM prices WHERE coin_id=? AND granularity=? ORDER BY ts", (coin_id, granularity)
+        )]
+    finally:
+        conn.close()
+
+
+def hourly_chart(day, prices, volumes):
+    return (
+        [[(day + i * HOURLY) * 1000, p] for i, p in enumerate(prices)],
+        [[(day + i * HOURLY) * 1000, v] for i, v in enumerate(volumes)]
+    )
+
+
+def test_daily_rollup_ohlc_vwap_and_realized_variance(write, coin_id):
+    day = bar_ts(time.time()) - 3 * DAILY
+    rng = np.random.default_rng(7)
+    prices = 100 * np.cumprod(1 + rng.normal(0, 0.01, 24))
+    volumes = rng.uniform(1e6, 2e6, 24)
+    chart, vols = hourly_chart(day, prices.tolist(), volumes.tolist())
+    write(price_tiers.store_points, coin_id, chart, vols, 1)
+
+    assert len(bars(coin_id, HOURLY)) == 24
+    [bar] = bars(coin_id, DAILY)
+    hourly_volume = volumes * HOURLY / DAILY
+    returns = prices[1:] / prices[:-1] - 1
+    assert bar["ts"] == day
+    assert bar["open"] == pytest.approx(prices[0])
+    assert bar["high"] == pytest.approx(prices.max())
+    assert bar["low"] == pytest.approx(prices.min())
+    assert bar["price"] == pytest.approx(prices[-1])
+    assert bar["volume"] == pytest.approx(hourly_volume.sum())
+    # One point per hour: the typical price is the point itself
+    assert bar["vwap"] == pytest.approx((prices * hourly_volume).sum() / hourly_volume.sum())
+    assert bar["rv"] == pytest.approx((returns ** 2).sum())
+    assert bar["rv_span"] == 23 * HOURLY
+
+
+def test_ticks_widen_the_hour_and_roll_up_the_day(write, coin_id):
+    epoch = bar_ts(time.time(), HOURLY) + 60
+    for price in (100.0, 104.0, 97.0, 101.0):
+        write(price_tiers.store_ticks, [(coin_id, price, 2400.0)], epoch, 1)
+        epoch += 60
+
+    [hour] = bars(coin_id, HOURLY)
+    assert (hour["open"], hour["high"], hour["low"], hour["price"]) == (100.0, 104.0, 97.0, 101.0)
+    assert hour["volume"] == pytest.approx(100.0)
+    [day] = bars(coin_id, DAILY)
+    assert (day["high"], day["low"], day["price"]) == (104.0, 97.0, 101.0)
+    assert day["vwap"] == pytest.approx((104.0 + 97.0 + 101.0) / 3)
+
+
+def test_unchanged_tick_keeps_updated_at(write, coin_id):
+    epoch = time.time()
+    write(price_tiers.store_ticks, [(coin_id, 100.0, 2400.0)], epoch, 1)
+    write(price_tiers.store_ticks, [(coin_id, 100.0, 2400.0)], epoch, 2)
+    assert [b["updated_at"] for b in bars(coin_id, HOURLY) + bars(coin_id, DAILY)] == [1, 1]
+
+
+def test_partial_backfill_never_replaces_a_stored_day(write, coin_id):
+    day = bar_ts(time.time()) - 5 * DAILY
+    chart, vols = hourly_chart(day, [100.0 + i for i in range(24)], [1.0] * 24)
+    write(price_tiers.store_points, coin_id, chart, vols, 1)
+    # A later backfill that starts at 18:00 of that day
+    chart, vols = hourly_chart(day + 18 * HOURLY, [50.0] * 12, [1.0] * 12)
+    write(price_tiers.store_points, coin_id, chart, vols, 2)
+
+    first, second = bars(coin_id, DAILY)
+    assert (first["open"], first["price"], first["updated_at"]) == (100.0, 123.0, 1)
+    assert second["ts"] == day + DAILY and second["price"] == 50.0
+
+
+def test_daily_series_becomes_daily_bars_only(write, coin_id):
+    day = bar_ts(time.time()) - 10 * DAILY
+    chart = [[(day + i * DAILY) * 1000, 100.0 + i] for i in range(1, 5)]
+    write(price_tiers.store_points, coin_id, chart, None, 1)
+    assert not bars(coin_id, HOURLY)
+    # Samples at 00:00 UTC close the day before
+    assert [(b["ts"], b["price"]) for b in bars(coin_id, DAILY)] == [
+        (day + i * DAILY, 101.0 + i) for i in range(4)
+    ]
+
+
+def test_realized_volatility_needs_a_day_of_hours(write, coin_id):
+    start = bar_ts(time.time()) - 4 * DAILY
+    prices = [100.0 * (1.01 if i % 2 else 1.0) for i in range(12)]
+    chart, vols = hourly_chart(start, prices, [1.0] * 12)
+    write(price_tiers.store_points, coin_id, chart, vols, 1)
+    assert price_tiers.realized_volatility(["bitcoin"], start) == {}
+
+    prices = [100.0 * (1.01 if i % 2 else 1.0) for i in range(49)]
+    chart, vols = hourly_chart(start + DAILY, prices, [1.0] * 49)
+    write(price_tiers.store_points, coin_id, chart, vols, 2)
+    rv = sum((b["rv"] or 0) for b in bars(coin_id, DAILY))
+    span = sum((b["rv_span"] or 0) for b in bars(coin_id, DAILY))
+    expected = np.sqrt(rv / (span / HOURLY) * price_tiers.HOURS_PER_YEAR) * 100
+    assert price_tiers.realized_volatility(["bitcoin"], start)["bitcoin"] == pytest.approx(expected)
+
+
+def test_cleanup_drops_old_hours_but_keeps_their_days(write, coin_id):
+    day = bar_ts(time.time()) - (price_tiers.INTRADAY_RETENTION_DAYS + 2) * DAILY
+    chart, vols = hourly_chart(day, [100.0] * 24, [1.0] * 24)
+    write(price_tiers.store_points, coin_id, chart, vols, 1)
+    assert write(price_tiers.cleanup_intraday, time.time()) == 24
+    assert not bars(coin_id, HOURLY)
+    assert len(bars(coin_id, DAILY)) == 1
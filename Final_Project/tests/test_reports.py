@@ -0,0 +1,72 @@
+import queue
+
+import pytest
+
+import reports
+import shared_cache
+import universe
+
+
+@pytest.fixture
+def jobs(write, tmp_path, monkeypatch):
+    # Jobs are queued but no worker picks them up
+    monkeypatch.setattr(reports, "REPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(reports, "start_workers", lambda: None)
+    monkeypatch.setattr(reports, "job_queue", queue.Queue())
+    write(universe.seed_defaults)
+    return reports.job_queue
+
+
+def age(job_id, seconds):
+    key = f"report:{job_id}"
+    job = shared_cache.get(key)
+    job["heartbeat"] -= seconds
+    shared_cache.set(key, job)
+
+
+def queued(q):
+    return [q.get_nowait() for _ in range(q.qsize())]
+
+
+def test_same_report_is_queued_once(jobs):
+    first = reports.submit_report(["bitcoin", "ethereum"], [30], "csv")
+    again = reports.submit_report(["ethereum", "bitcoin"], [30], "csv")
+    assert again["job_id"] == first["job_id"]
+    assert queued(jobs) == [first["job_id"]]
+
+
+def test_silent_job_is_requeued(jobs):
+    job_id = reports.submit_report(["bitcoin"], [30], "csv")["job_id"]
+    queued(jobs)
+
+    age(job_id, reports.REPORT_STALE_AFTER - 5)
+    assert reports.job_status(job_id)["status"] == "queued"
+    assert queued(jobs) == []
+
+    age(job_id, 10)
+    assert reports.job_status(job_id)["status"] == "queued"
+    assert queued(jobs) == [job_id]
+    assert not reports.stale(shared_cache.get(f"report:{job_id}"))
+
+
+def test_stale_running_job_is_resubmitted(jobs):
+    job_id = reports.submit_report(["bitcoin"], [30], "csv")["job_id"]
+    queued(jobs)
+    key = f"report:{job_id}"
+    job = shared_cache.get(key)
+    job["status"] = "running"
+    shared_cache.set(key, job)
+    age(job_id, reports.REPORT_STALE_AFTER + 1)
+
+    assert reports.submit_report(["bitcoin"], [30], "csv")["status"] == "queued"
+    assert queued(jobs) == [job_id]
+
+
+def test_finished_jobs_are_never_stale():
+    assert not reports.stale({"status": "done", "heartbeat": 0})
+    assert not reports.stale({"status": "failed", "heartbeat": 0})
+
+
+def test_unknown_or_malformed_ids(jobs):
+    assert reports.job_status("0" * 32) is None
+    assert reports.job_status("../etc/passwd") is None
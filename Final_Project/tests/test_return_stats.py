@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import return_stats
+import universe
+from db import DAILY, bar_ts
+
+TODAY = bar_ts(time.time())
+COINS = ["bitcoin", "ethereum", "solana", "cardano"]
+
+
+@pytest.fixture
+def closes(write):
+    # 120 days of closes ending today; ethereum has gaps, cardano starts late
+    write(universe.seed_defaults)
+    ids = write(lambda cur: universe.coin_ids(cur, COINS))
+    rng = np.random.default_rng(11)
+    days = pd.to_datetime(TODAY - np.arange(119, -1, -1) * DAILY, unit="s")
+    frame = pd.DataFrame(
+        100 * np.cumprod(1 + rng.normal(0, 0.03, (120, len(COINS))), axis=0), index=days, columns=COINS
+    )
+    frame.loc[frame.index[::9], "ethereum"] = np.nan
+    frame.loc[frame.index[:100], "cardano"] = np.nan
+    rows = [
+        (ids[coin], DAILY, int(day.timestamp()), price, 1)
+        for coin in COINS for day, price in frame[coin].dropna().items()
+    ]
+    write(lambda cur: cur.executemany(
+        "INSERT INTO prices (coin_id, granularity, ts, price, updated_at) VALUES (?,?,?,?,?)", rows
+    ))
+    return frame
+
+
+def reference(frame, coin, days):
+    # What the pandas version computed: returns between the coin's stored
+    # closes inside the window, beta over the days both have a return
+    window = frame[frame.index >= frame.index[-1] - pd.Timedelta(days=days - 1)]
+    r = window[coin].dropna().pct_change().dropna()
+    m = window["bitcoin"].dropna().pct_change().dropna()
+    both = pd.concat([r, m], axis=1, join="inner").to_numpy()
+    beta = np.cov(both[:, 0], both[:, 1])[0, 1] / np.var(both[:, 1])
+    return {
+        "n": len(r), "mean": r.mean(), "std": r.std(ddof=1),
+        "beta": beta, "var": abs(np.percentile(r, 5))
+    }
+
+
+@pytest.mark.parametrize("days", [7, 30, 90, 365])
+def test_summarize_matches_pandas(closes, days):
+    stats = return_stats.summarize(COINS[1:], days)
+    expected = {coin: reference(closes, coin, days) for coin in COINS}
+    assert set(stats) == {coin for coin in COINS if expected[coin]["n"] > 1}
+    for coin, s in stats.items():
+        assert s["n"] == expected[coin]["n"]
+        for key in ("mean", "std", "beta", "var"):
+            assert s[key] == pytest.approx(expected[coin][key], rel=1e-9, abs=1e-12), (coin, key)
+
+
+def test_market_beta_keeps_the_sample_over_population_ratio(closes):
+    # Sample covariance over population variance, as before: n / (n - 1)
+    s = return_stats.summarize([], 90)["bitcoin"]
+    assert s["beta"] == pytest.approx(s["n"] / (s["n"] - 1))
+
+
+def test_chunks_each_join_the_market(closes, monkeypatch):
+    whole = return_stats.summarize(COINS[1:], 90)
+    monkeypatch.setattr(universe, "QUERY_CHUNK", 1)
+    assert return_stats.summarize(COINS[1:], 90) == whole
@@ -0,0 +1,115 @@
+import pytest
+
+import app
+import db
+import reports
+import universe
+
+COINS = [coin for coin, _, _ in universe.DEFAULT_COINS]
+
+
+def row(coin, volatility):
+    return {"coin_name": coin, "volatility": volatility, "sharpe": 1.0, "beta": 1.0, "var": 2.0}
+
+
+def page_run(write, coins, volatility, days=30, computed_at="2026-01-01 00:00:00"):
+    # What the default view saves: a page run of its own, tiered at once
+    return write(app.store_risk_snapshot, [row(c, volatility) for c in coins], days, None, computed_at, True)
+
+
+def universe_run(write, volatility, days=30, computed_at="2026-01-01 00:00:00", publish=True):
+    # What the batch saves: one partial run filled page by page, then published
+    run_id = write(app.start_risk_run, days, computed_at, "partial")
+    for coins in (COINS[:5], COINS[5:]):
+        write(app.store_risk_snapshot, [row(c, volatility) for c in coins], days, run_id, computed_at)
+    if publish:
+        write(app.publish_risk_run, days, run_id)
+    return run_id
+
+
+@pytest.fixture
+def seeded(write):
+    write(universe.seed_defaults)
+    return write
+
+
+def covering(days, coins):
+    conn = db.get_db()
+    try:
+        return reports.covering_run(conn.cursor(), days, coins)
+    finally:
+        conn.close()
+
+
+def latest(client, query=""):
+    r = client.get(f"/api/risk-metrics-latest?days=30{query}")
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def test_no_run_yet_is_empty(client, seeded):
+    assert latest(client) == {"table": [], "computed_at": None}
+
+
+def test_unpublished_batch_is_never_served(client, seeded):
+    universe_run(seeded, 80.0, publish=False)
+    assert latest(client)["computed_at"] is None
+
+
+def test_published_universe_run_serves_every_page(client, seeded):
+    universe_run(seeded, 80.0)
+    body = latest(client, "&per_page=4&page=3")
+    assert [r["coin_name"] for r in body["table"]] == COINS[8:]
+    assert {r["risk"] for r in body["table"]} == {"High"}
+
+
+def test_newest_covering_run_wins(client, seeded):
+    universe_run(seeded, 80.0)
+    page = page_run(seeded, COINS[:5], 20.0)
+
+    def vols(query):
+        return {r["coin_name"]: r["volatility"] for r in latest(client, query)["table"]}
+
+    # The newer page run holds these coins...
+    assert vols("&coins=bitcoin,ethereum") == {"bitcoin": 20.0, "ethereum": 20.0}
+    assert covering(30, COINS[:5])["run_id"] == page
+    # ...but not these: the whole list comes from the universe run, never mixed
+    assert vols("&coins=bitcoin,tron") == {"bitcoin": 80.0, "tron": 80.0}
+    assert set(vols("").values()) == {80.0}
+
+    # A newer universe run supersedes the page run
+    universe_run(seeded, 50.0, computed_at="2026-01-02 00:00:00")
+    assert vols("&coins=bitcoin,ethereum") == {"bitcoin": 50.0, "ethereum": 50.0}
+
+
+def test_page_run_tiers_come_from_its_classification(client, seeded):
+    page_run(seeded, COINS, 40.0)
+    assert {r["risk"] for r in latest(client)["table"]} == {"Medium"}
+
+
+def test_late_publish_never_replaces_a_newer_run(client, seeded):
+    older = seeded(app.start_risk_run, 30, "2026-01-01 00:00:00", "partial")
+    seeded(app.store_risk_snapshot, [row(c, 90.0) for c in COINS], 30, older, "2026-01-01 00:00:00")
+    universe_run(seeded, 10.0, computed_at="2026-01-02 00:00:00")
+    seeded(app.publish_risk_run, 30, older)
+
+    assert covering(30, COINS)["computed_at"] == "2026-01-02 00:00:00"
+    assert {r["volatility"] for r in latest(client)["table"]} == {10.0}
+
+
+def test_etag_revalidates_until_a_new_run(client, seeded):
+    universe_run(seeded, 80.0)
+    first = client.get("/api/risk-metrics-latest?days=30")
+    etag = first.headers["ETag"]
+    assert client.get("/api/risk-metrics-latest?days=30", headers={"If-None-Match": etag}).status_code == 304
+
+    universe_run(seeded, 60.0, computed_at="2026-01-02 00:00:00")
+    r = client.get("/api/risk-metrics-latest?days=30", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert {row["volatility"] for row in r.get_json()["table"]} == {60.0}
+
+
+def test_windows_are_independent(client, seeded):
+    universe_run(seeded, 80.0, days=7)
+    assert latest(client)["computed_at"] is None
+    assert client.get("/api/risk-metrics-latest?days=7").get_json()["table"]
@@ -0,0 +1,171 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_cube
+import rolling_risk
+import universe
+from db import DAILY, bar_ts
+
+W = rolling_risk.ROLLING_WINDOW
+ADMIN_HEADERS = {"X-Admin-Token": "test-admin"}
+
+
+def random_prices(days=150, coins=3, seed=2):
+    rng = np.random.default_rng(seed)
+    prices = 100 * np.cumprod(1 + rng.normal(0, 0.03, (days, coins)), axis=0)
+    prices[40:45, 1] = np.nan           # a gap
+    prices[:70, 2] = np.nan             # listed late
+    return prices
+
+
+def test_rolling_metrics_match_pandas():
+    prices = random_prices()
+    out = rolling_risk.compute(prices, market_slot=0)
+    returns = pd.DataFrame(prices).pct_change(fill_method=None)
+
+    for coin in range(prices.shape[1]):
+        r, m = returns[coin], returns[0]
+        for t in range(len(prices)):
+            window = r.iloc[max(t - W + 1, 0):t + 1]
+            valid = window.dropna()
+            if t < W - 1 or len(valid) < rolling_risk.MIN_OBS:
+                assert np.isnan(out["volatility"][t, coin])
+                continue
+            assert out["volatility"][t, coin] == pytest.approx(valid.std(ddof=1) * math.sqrt(365) * 100)
+            assert out["var"][t, coin] == pytest.approx(abs(np.percentile(valid, 5)) * 100)
+            both = pd.concat([window, m.iloc[max(t - W + 1, 0):t + 1]], axis=1).dropna().to_numpy()
+            beta = np.cov(both[:, 0], both[:, 1])[0, 1] / np.var(both[:, 1])
+            assert out["beta"][t, coin] == pytest.approx(beta)
+
+
+def test_var_blocks_do_not_change_results(monkeypatch):
+    prices = random_prices()
+    whole = rolling_risk.compute(prices, 0)["var"]
+    monkeypatch.setattr(rolling_risk, "DAY_BLOCK", 7)
+    np.testing.assert_array_equal(rolling_risk.compute(prices, 0)["var"], whole)
+
+
+def test_chi2_survival_function():
+    assert rolling_risk.chi2_sf(3.841459, 1) == pytest.approx(0.05, abs=1e-6)
+    assert rolling_risk.chi2_sf(5.991465, 2) == pytest.approx(0.05, abs=1e-6)
+    assert rolling_risk.chi2_sf(-1, 1) == 1.0
+
+
+def kupiec(n, x, p):
+    rate = x / n
+    return -2 * (
+        (n - x) * math.log(1 - p) + x * math.log(p)
+        - (n - x) * math.log(1 - rate) - (x * math.log(rate) if x else 0)
+    )
+
+
+def christoffersen(hits):
+    n = {(a, b): 0 for a in (0, 1) for b in (0, 1)}
+    for a, b in zip(hits, hits[1:]):
+        n[a, b] += 1
+    pi0 = n[0, 1] / (n[0, 0] + n[0, 1])
+    pi1 = n[1, 1] / (n[1, 0] + n[1, 1])
+    pi = (n[0, 1] + n[1, 1]) / sum(n.values())
+
+    def ll(k, m, p):
+        return (k * math.log(p) if k else 0) + (m * math.log(1 - p) if m else 0)
+    return -2 * (ll(n[0, 1] + n[1, 1], n[0, 0] + n[1, 0], pi) - ll(n[0, 1], n[0, 0], pi0) - ll(n[1, 1], n[1, 0], pi1))
+
+
+def test_backtest_statistics_match_the_formulas():
+    # VaR of 5 % every day; breaches on chosen days, two of them back to back
+    days = 101
+    breach_days = {10, 11, 30, 55, 56, 57, 80}
+    var = np.full((days, 1), 5.0)
+    returns = np.full((days, 1), 0.01)
+    for d in breach_days:
+        returns[d, 0] = -0.08
+    returns[0, 0] = np.nan
+
+    tests = rolling_risk.backtest(var, returns)
+    hits = [1 if d in breach_days else 0 for d in range(1, days)]
+    p = rolling_risk.VAR_LEVEL
+    assert tests["observations"][0] == 100 and tests["breaches"][0] == 7
+    assert tests["pof"][0] == pytest.approx(kupiec(100, 7, p))
+    assert tests["ind"][0] == pytest.approx(christoffersen(hits))
+
+    summary = rolling_risk.backtest_summary(tests, 0)
+    lr = kupiec(100, 7, p) + christoffersen(hits)
+    assert summary["expected"] == 5.0
+    assert summary["conditional_coverage"]["p_value"] == pytest.approx(math.exp(-lr / 2), abs=1e-4)
+
+
+def test_backtest_needs_enough_forecasts():
+    var = np.full((10, 1), 5.0)
+    returns = np.full((10, 1), 0.01)
+    assert rolling_risk.backtest_summary(rolling_risk.backtest(var, returns), 0) is None
+
+
+# =====================================================
+# ENDPOINTS
+# =====================================================
+@pytest.fixture
+def history(write, cube_dir):
+    # 200 days of closes for the default coins, in the cube
+    write(universe.seed_defaults)
+    coins = [coin for coin, _, _ in universe.DEFAULT_COINS]
+    ids = write(lambda cur: universe.coin_ids(cur, coins))
+    prices = random_prices(200, len(coins))
+    today = bar_ts(time.time())
+    rows = [
+        (ids[coin], DAILY, today - (199 - t) * DAILY, float(prices[t, i]), 1)
+        for i, coin in enumerate(coins) for t in range(200) if not np.isnan(prices[t, i])
+    ]
+    write(lambda cur: cur.executemany(
+        "INSERT INTO prices (coin_id, granularity, ts, price, updated_at) VALUES (?,?,?,?,?)", rows
+    ))
+    price_cube.rebuild()
+    return coins
+
+
+def test_risk_history_never_builds_on_the_request(client, history, monkeypatch):
+    monkeypatch.setattr(rolling_risk, "rebuild", lambda: pytest.fail("rebuilt on a request"))
+    r = client.get("/api/risk-history")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == str(rolling_risk.RETRY_AFTER)
+
+
+def test_risk_history_serves_the_last_build(client, history, monkeypatch):
+    rolling_risk.refresh()
+    r = client.get("/api/risk-history?coins=bitcoin,ethereum&days=10")
+    assert r.status_code == 200
+    body = r.get_json()
+    assert len(body["dates"]) == 10
+    assert set(body["series"]) == {"bitcoin", "ethereum"}
+    assert body["backtest"]["bitcoin"]["observations"] > rolling_risk.MIN_OBS
+
+    # A newer cube day: requests keep the old build until the loop rebuilds
+    monkeypatch.setattr(rolling_risk, "rebuild", lambda: pytest.fail("rebuilt on a request"))
+    monkeypatch.setattr(rolling_risk, "stale", lambda: True)
+    etag = r.headers["ETag"]
+    again = client.get("/api/risk-history?coins=bitcoin,ethereum&days=10", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+
+
+def test_rolling_loop_rebuilds_when_the_cube_changes(history):
+    first = rolling_risk.refresh()["index"]
+    assert rolling_risk.refresh()["index"]["version"] == first["version"]
+    time.sleep(0.002)
+    price_cube.rebuild()
+    assert rolling_risk.refresh()["index"]["version"] != first["version"]
+
+
+def test_batch_is_an_admin_post(client, history):
+    assert client.get("/api/risk-metrics-batch").status_code == 405
+    assert client.post("/api/risk-metrics-batch").status_code == 403
+    assert client.post("/api/risk-metrics-batch", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    r = client.post("/api/risk-metrics-batch", headers=ADMIN_HEADERS)
+    assert r.status_code == 200
+    slots = r.get_json()["slots"]
+    assert {slots[d]["rows"] for d in ("7", "30", "90", "365")} == {len(history)}
+    assert slots["rolling"] == {"days": 0}
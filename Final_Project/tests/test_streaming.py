@@ -0,0 +1,60 @@
+import app
+import streaming
+from streaming import Broadcaster
+
+
+def test_replay_after_last_event_id():
+    b = Broadcaster(replay=3)
+    for i in range(1, 6):
+        b.publish("market", {"n": i})
+    _, backlog = b.subscribe("3")
+    assert [e[0] for e in backlog] == [4, 5]
+    # Unknown or too old: the latest snapshot resyncs the client
+    assert [e[0] for e in b.subscribe("1")[1]] == [5]
+    assert [e[0] for e in b.subscribe(None)[1]] == [5]
+
+
+def test_explicit_ids_are_published_once():
+    b = Broadcaster()
+    assert b.publish("market", {}, event_id=10) == 10
+    assert b.publish("market", {}, event_id=10) is None
+    assert b.publish("market", {}, event_id=9) is None
+    assert b.publish("market", {}) == 11
+
+
+def test_slow_subscriber_is_dropped(monkeypatch):
+    monkeypatch.setattr(streaming, "SUBSCRIBER_QUEUE_SIZE", 2)
+    b = Broadcaster()
+    q, _ = b.subscribe()
+    for i in range(3):
+        b.publish("market", {"n": i})
+    assert b.subscriber_count() == 0
+    items = [q.get_nowait() for _ in range(q.qsize())]
+    assert items[-1] is None
+
+
+def test_event_stream_unsubscribes_on_close():
+    b = Broadcaster()
+    b.publish("market", {"n": 1})
+    stream = streaming.event_stream(b, heartbeat=0.01)
+    assert next(stream) == f"retry: {streaming.RETRY_MS}\n\n"
+    assert next(stream) == 'id: 1\nevent: market\ndata: {"n": 1}\n\n'
+    assert next(stream) == ": heartbeat\n\n"
+    assert b.subscriber_count() == 1
+    stream.close()
+    assert b.subscriber_count() == 0
+
+
+def test_streams_past_the_cap_get_503(client, monkeypatch):
+    b = Broadcaster(max_subscribers=2)
+    monkeypatch.setattr(app, "market_broadcaster", b)
+    held = [b.subscribe()[0] for _ in range(2)]
+    r = client.get("/api/stream/market")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == str(streaming.STREAM_RETRY_AFTER)
+
+    b.unsubscribe(held[0])
+    r = client.get("/api/stream/market")
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+    r.close()
@@ -0,0 +1,73 @@
+import app
+import universe
+
+
+def market(n):
+    return [
+        {"id": f"coin-{i:03d}", "symbol": f"c{i:03d}", "name": f"Coin {i:03d}",
+         "market_cap_rank": i, "market_cap": 1e9 / i}
+        for i in range(1, n + 1)
+    ]
+
+
+def test_seed_defaults_only_fills_an_empty_universe(write):
+    assert write(universe.seed_defaults)
+    assert universe.page_ids(1, 3) == ["bitcoin", "ethereum", "solana"]
+    assert not write(universe.seed_defaults)
+    assert universe.size() == len(universe.DEFAULT_COINS)
+
+
+def test_pages_walk_the_universe_in_rank_order(write):
+    write(universe.upsert, market(25), 1)
+    pages = list(universe.pages(per_page=10))
+    assert [len(ids) for ids in pages] == [10, 10, 5]
+    assert pages[0][0] == "coin-001" and pages[-1][-1] == "coin-025"
+    assert universe.page(3, 10)[0] == {"id": "coin-021", "symbol": "C021", "name": "Coin 021", "rank": 21}
+
+
+def test_retire_untracks_coins_missing_from_a_complete_refresh(write):
+    write(universe.upsert, market(5), 1)
+    write(universe.upsert, market(3), 2)
+    assert write(universe.retire, 2) == 2
+    assert universe.size() == 3
+    assert universe.known(["coin-001", "coin-004", "nope"]) == {"coin-001"}
+
+
+def test_lookup_chunks_long_id_lists(write, monkeypatch):
+    monkeypatch.setattr(universe, "QUERY_CHUNK", 7)
+    write(universe.upsert, market(30), 1)
+    ids = [f"coin-{i:03d}" for i in range(1, 31)]
+    assert set(universe.lookup(ids)) == set(ids)
+
+
+def test_search_matches_id_symbol_or_name_prefix(write):
+    write(universe.seed_defaults)
+    assert [c["id"] for c in universe.search("bit")] == ["bitcoin"]
+    assert [c["id"] for c in universe.search("eth")] == ["ethereum"]
+    assert [c["id"] for c in universe.search("Chain")] == ["chainlink"]
+    assert len(universe.search("", limit=4)) == 4
+
+
+def test_parse_page_clamps_bad_values():
+    assert universe.parse_page({}) == (1, universe.PAGE_SIZE)
+    assert universe.parse_page({"page": "0", "per_page": "9999"}) == (1, universe.MAX_PAGE_SIZE)
+    assert universe.parse_page({"page": "x", "per_page": "y"}, 20) == (1, 20)
+
+
+def test_parse_coin_ids_splits_tracked_from_unknown(write):
+    write(universe.seed_defaults)
+    assert app.parse_coin_ids(" Bitcoin,ethereum,bitcoin,,nope ") == (["bitcoin", "ethereum"], ["nope"])
+
+
+def test_coins_endpoint_rejects_unknown_and_oversized_lists(client, write):
+    write(universe.seed_defaults)
+    r = client.get("/api/history?coins=bitcoin,nope")
+    assert r.status_code == 400
+    assert r.get_json()["invalid"] == ["nope"]
+
+    too_many = ",".join(f"c{i}" for i in range(universe.MAX_PAGE_SIZE + 1))
+    assert client.get(f"/api/history?coins={too_many}").status_code == 400
+
+    r = client.get("/api/coins?per_page=2&page=2")
+    assert [c["id"] for c in r.get_json()["coins"]] == ["solana", "cardano"]
+    assert r.get_json()["total"] == len(universe.DEFAULT_COINS)
@@ -0,0 +1,115 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import upstream
+from upstream import CircuitBreaker, Deadline, DeadlineExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Only upstream's view of time moves
+    clock = Clock()
+    monkeypatch.setattr(upstream, "time", SimpleNamespace(monotonic=clock, perf_counter=time.perf_counter))
+    return clock
+
+
+def test_breaker_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure("boom")
+    assert breaker.state == "closed"
+
+    assert breaker.allow()
+    breaker.record_failure("boom")
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.snapshot()["total_rejected"] == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure("boom")
+    breaker.record_success()
+    breaker.record_failure("boom")
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_one_probe_and_success_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure("boom")
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure("boom")
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure("still down")
+    assert breaker.state == "open"
+    assert breaker.snapshot()["retry_in"] == 30
+    assert breaker.snapshot()["last_error"] == "still down"
+
+
+def test_open_circuit_fails_fast_without_a_request(clock, monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    breaker.record_failure("boom")
+    monkeypatch.setattr(upstream, "coingecko_breaker", breaker)
+    monkeypatch.setattr(upstream.requests, "get", lambda *a, **k: pytest.fail("request sent"))
+    with pytest.raises(upstream.CircuitOpenError):
+        upstream.coingecko_get("/ping")
+
+
+def test_server_errors_count_as_failures_client_errors_do_not(clock, monkeypatch):
+    class Reply:
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    monkeypatch.setattr(upstream, "coingecko_breaker", breaker)
+    statuses = iter([404, 429, 503])
+    monkeypatch.setattr(upstream.requests, "get", lambda *a, **k: Reply(next(statuses)))
+
+    upstream.coingecko_get("/coins/unknown/market_chart")
+    assert breaker.failures == 0
+    upstream.coingecko_get("/coins/markets")
+    upstream.coingecko_get("/coins/markets")
+    assert breaker.state == "open"
+
+
+def test_deadline_caps_timeouts_and_expires(clock):
+    deadline = Deadline(10)
+    assert deadline.timeout(15) == 10
+    clock.now += 7
+    assert deadline.timeout(15) == pytest.approx(3)
+    assert deadline.timeout(1) == 1
+    clock.now += 3
+    assert deadline.expired()
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(5)
+
+
+def test_endpoint_label_hides_coin_ids():
+    assert upstream.endpoint_label("/coins/bitcoin/market_chart") == "/coins/{id}/market_chart"
+    assert upstream.endpoint_label("/coins/markets") == "/coins/markets"
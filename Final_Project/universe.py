@@ -0,0 +1,238 @@
+import os
+from datetime import datetime, UTC
+
+from db import get_db, DAILY, day_ts
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# The coin universe is the top UNIVERSE_SIZE coins by market cap, kept in
+# the coins table (tracked=1, market_cap_rank) and refreshed by every
+# market ingestion (paginated /coins/markets). Everything that used to loop
+# over a hard-coded list pages through it instead.
+UNIVERSE_SIZE = int(os.environ.get("CVARA_UNIVERSE_SIZE", 100))
+MARKETS_PAGE_SIZE = 250     # CoinGecko's per_page maximum
+PAGE_SIZE = 100             # default page for API responses
+MAX_PAGE_SIZE = 250
+SEARCH_LIMIT = 20           # dropdown suggestions per keystroke
+QUERY_CHUNK = 500           # ids per IN (...) list, below SQLite's variable limit
+
+# Tracked until the first ingestion replaces them (fresh DB / upstream down)
+DEFAULT_COINS = [
+    ("bitcoin", "BTC", "Bitcoin"),
+    ("ethereum", "ETH", "Ethereum"),
+    ("solana", "SOL", "Solana"),
+    ("cardano", "ADA", "Cardano"),
+    ("dogecoin", "DOGE", "Dogecoin"),
+    ("ripple", "XRP", "XRP"),
+    ("litecoin", "LTC", "Litecoin"),
+    ("polkadot", "DOT", "Polkadot"),
+    ("tron", "TRX", "TRON"),
+    ("chainlink", "LINK", "Chainlink")
+]
+DEFAULT_SELECTION = ["bitcoin", "ethereum", "solana", "cardano", "dogecoin"]
+SYMBOLS = {coin: symbol for coin, symbol, _ in DEFAULT_COINS}
+
+UPSERT_COIN = """
+INSERT INTO coins (coin_name, symbol, name, market_cap_rank, market_cap, tracked, updated_at)
+VALUES (?,?,?,?,?,1,?)
+ON CONFLICT (coin_name) DO UPDATE SET
+    symbol = excluded.symbol,
+    name = excluded.name,
+    market_cap_rank = excluded.market_cap_rank,
+    market_cap = excluded.market_cap,
+    tracked = 1,
+    updated_at = excluded.updated_at
+"""
+
+
+def chunks(items, size=QUERY_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def parse_page(args, default_size=PAGE_SIZE):
+    try:
+        page = max(int(args.get("page", 1)), 1)
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        per_page = min(max(int(args.get("per_page", default_size)), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        per_page = default_size
+    return page, per_page
+
+
+def row_dict(r):
+    return {
+        "id": r["coin_name"],
+        "symbol": r["symbol"] or r["coin_name"][:3].upper(),
+        "name": r["name"] or r["coin_name"].title(),
+        "rank": r["market_cap_rank"]
+    }
+
+
+# =====================================================
+# WRITES (run on the db_writer thread)
+# =====================================================
+def seed_defaults(cur):
+    # Empty universe (fresh or pre-universe DB): track the default coins so
+    # validation, dashboards and the history seed work before CoinGecko
+    # has answered once. Also fixes their legacy 3-letter symbols.
+    cur.execute("SELECT 1 FROM coins WHERE tracked=1 LIMIT 1")
+    if cur.fetchone():
+        return False
+    cur.executemany(UPSERT_COIN, [
+        (coin, symbol, name, rank, None, 0)
+        for rank, (coin, symbol, name) in enumerate(DEFAULT_COINS, start=1)
+    ])
+    return True
+
+
+def upsert(cur, records, stamp):
+    # records are market rows in rank order; returns {coin: coin_id}
+    cur.executemany(UPSERT_COIN, [
+        (rec["id"], rec["symbol"].upper(), rec["name"], rec["market_cap_rank"],
+         rec.get("market_cap"), stamp)
+        for rec in records
+    ])
+    return coin_ids(cur, [rec["id"] for rec in records])
+
+
+def retire(cur, stamp):
+    # After a complete refresh, coins not seen in it left the top N
+    cur.execute("UPDATE coins SET tracked=0 WHERE tracked=1 AND updated_at < ?", (stamp,))
+    return cur.rowcount
+
+
+def coin_ids(cur, coins):
+    ids = {}
+    for chunk in chunks(list(coins)):
+        cur.execute(
+            f"SELECT coin_id, coin_name FROM coins WHERE coin_name IN ({','.join('?' * len(chunk))})",
+            chunk
+        )
+        ids.update({r[1]: r[0] for r in cur.fetchall()})
+    return ids
+
+
+# =====================================================
+# READS
+# =====================================================
+def query(sql, params=()):
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def size():
+    return query("SELECT COUNT(*) FROM coins WHERE tracked=1")[0][0]
+
+
+def page(number=1, per_page=PAGE_SIZE):
+    rows = query("""
+    SELECT coin_name, symbol, name, market_cap_rank FROM coins
+    WHERE tracked=1
+    ORDER BY market_cap_rank
+    LIMIT ? OFFSET ?
+    """, (per_page, (number - 1) * per_page))
+    return [row_dict(r) for r in rows]
+
+
+def page_ids(number=1, per_page=PAGE_SIZE):
+    return [coin["id"] for coin in page(number, per_page)]
+
+
+def pages(per_page=PAGE_SIZE):
+    # Whole universe, one page of ids at a time (batch jobs)
+    number = 1
+    while True:
+        ids = page_ids(number, per_page)
+        if not ids:
+            return
+        yield ids
+        number += 1
+
+
+def lookup(coins):
+    # {coin: {"id", "symbol", "name", "rank"}} for tracked coins, one query per chunk
+    out = {}
+    for chunk in chunks(list(coins)):
+        rows = query(f"""
+        SELECT coin_name, symbol, name, market_cap_rank FROM coins
+        WHERE tracked=1 AND coin_name IN ({','.join('?' * len(chunk))})
+        """, chunk)
+        out.update({r["coin_name"]: row_dict(r) for r in rows})
+    return out
+
+
+def known(coins):
+    return set(lookup(coins))
+
+
+def search(text, limit=SEARCH_LIMIT):
+    # Prefix match on id, symbol or name; each branch is an index range scan
+    text = (text or "").strip()
+    if not text:
+        return page(1, limit)
+    low, sym = text.lower(), text.upper()
+    rows = query("""
+    SELECT coin_name, symbol, name, market_cap_rank FROM coins
+    WHERE tracked=1 AND (
+        (coin_name >= ? AND coin_name < ?)
+        OR (symbol >= ? AND symbol < ?)
+        OR (name >= ? AND name < ?)
+    )
+    ORDER BY market_cap_rank
+    LIMIT ?
+    """, (low, low + "\uffff", sym, sym + "\uffff", text, text + "\uffff", limit))
+    return [row_dict(r) for r in rows]
+
+
+def missing_history(limit):
+    # Tracked coins with no history before today (ingestion writes today's
+    # row as soon as a coin enters the universe), best ranked first
+    today = day_ts(datetime.now(UTC).strftime("%Y-%m-%d"))
+    rows = query("""
+    SELECT c.coin_name FROM coins c
+    WHERE c.tracked=1
+    AND NOT EXISTS (
+        SELECT 1 FROM prices p
+        WHERE p.coin_id = c.coin_id AND p.granularity = ? AND p.ts < ?
+    )
+    ORDER BY c.market_cap_rank
+    LIMIT ?
+    """, (DAILY, today, limit))
+    return [r["coin_name"] for r in rows]
+
+
+# =====================================================
+# DASH DROPDOWNS
+# =====================================================
+# Options are loaded per keystroke (search_value) instead of listing the
+# whole universe; selected coins are always kept so Dash doesn't drop them.
+def option(coin):
+    return {"label": f"{coin['name']} ({coin['symbol']})", "value": coin["id"]}
+
+
+def default_options():
+    return [
+        {"label": f"{name} ({symbol})", "value": coin}
+        for coin, symbol, name in DEFAULT_COINS
+        if coin in DEFAULT_SELECTION
+    ]
+
+
+def dropdown_options(search_value, selected):
+    selected = list(selected or [])
+    found = lookup(selected) if selected else {}
+    options = [option(found[c]) for c in selected if c in found]
+    for coin in search(search_value):
+        if coin["id"] not in found:
+            options.append(option(coin))
+    return options
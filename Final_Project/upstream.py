@@ -0,0 +1,174 @@
+import os
+import re
+import time
+from threading import Lock
+
+import requests
+
+import metrics
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Point at benchmarks/stub_upstream.py for offline / load testing
+COINGECKO_BASE_URL = os.environ.get("COINGECKO_BASE_URL", "https://api.coingecko.com/api/v3").rstrip("/")
+API_KEY = "CG-j36Jb6fjM7XXadA6CDJPLLAU"
+
+BREAKER_FAILURE_THRESHOLD = 5   # consecutive failures before opening
+BREAKER_RESET_SECONDS = 30      # open -> half-open after this long
+BREAKER_HALF_OPEN_PROBES = 1    # concurrent trial requests while half-open
+
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+# =====================================================
+# CIRCUIT BREAKER
+# =====================================================
+# closed    -> requests flow, consecutive failures are counted
+# open      -> requests fail fast until BREAKER_RESET_SECONDS have passed
+# half_open -> a single probe goes through; success closes, failure reopens
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds=BREAKER_RESET_SECONDS, half_open_probes=BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self.lock = Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0
+        self.probes = 0
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.last_error = None
+        metrics.circuit_state.set(0, service=name)
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    self.total_rejected += 1
+                    return False
+                self.transition("half_open")
+            if self.state == "half_open":
+                if self.probes >= self.half_open_probes:
+                    self.total_rejected += 1
+                    return False
+                self.probes += 1
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != "closed":
+                self.transition("closed")
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.total_failures += 1
+            self.last_error = str(error)
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.transition("open")
+
+    def transition(self, state):
+        if state != self.state:
+            print(f"Circuit {self.name}: {self.state} -> {state}")
+        self.state = state
+        self.probes = 0
+        metrics.circuit_state.set(CIRCUIT_STATE_VALUES[state], service=self.name)
+
+    def snapshot(self):
+        with self.lock:
+            retry_in = 0
+            if self.state == "open":
+                retry_in = max(self.reset_seconds - (time.monotonic() - self.opened_at), 0)
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "total_failures": self.total_failures,
+                "total_rejected": self.total_rejected,
+                "retry_in": round(retry_in, 1),
+                "last_error": self.last_error
+            }
+
+
+coingecko_breaker = CircuitBreaker("coingecko")
+
+
+# =====================================================
+# DEADLINE BUDGET
+# =====================================================
+# One budget per refresh operation; each call's timeout is capped by
+# whatever is left so the whole operation can't exceed it.
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap):
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline of {self.seconds}s exhausted")
+        return min(cap, remaining)
+
+
+# =====================================================
+# UPSTREAM CALLS
+# =====================================================
+def endpoint_label(path):
+    # /coins/bitcoin/market_chart -> /coins/{id}/market_chart, so metric
+    # label cardinality doesn't grow with the coin list
+    return re.sub(r"^/coins/[^/]+/", "/coins/{id}/", path)
+
+
+def coingecko_get(path, params=None, timeout=10, deadline=None):
+    endpoint = endpoint_label(path)
+    if deadline is not None:
+        timeout = deadline.timeout(timeout)
+
+    if not coingecko_breaker.allow():
+        metrics.upstream_requests.inc(service="coingecko", endpoint=endpoint, status="circuit_open")
+        raise CircuitOpenError("CoinGecko circuit is open")
+
+    start = time.perf_counter()
+    try:
+        r = requests.get(
+            f"{COINGECKO_BASE_URL}{path}",
+            params=params,
+            headers={"x-cg-demo-api-key": API_KEY},
+            timeout=timeout
+        )
+    except requests.RequestException as e:
+        coingecko_breaker.record_failure(e)
+        metrics.upstream_requests.inc(service="coingecko", endpoint=endpoint, status=type(e).__name__)
+        raise
+    finally:
+        metrics.upstream_latency.observe(time.perf_counter() - start, service="coingecko", endpoint=endpoint)
+
+    metrics.upstream_requests.inc(service="coingecko", endpoint=endpoint, status=r.status_code)
+
+    # Rate limiting and server errors mean upstream is unhealthy; a 4xx for
+    # a bad coin id does not.
+    if r.status_code == 429 or r.status_code >= 500:
+        coingecko_breaker.record_failure(f"HTTP {r.status_code}")
+    else:
+        coingecko_breaker.record_success()
+    return r
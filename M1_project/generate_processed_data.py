@@ -1,3 +1,4 @@
+import os
 import requests
 import pandas as pd
 import numpy as np
@@ -13,10 +14,13 @@ COINS = {
 
 DAYS = 180   # last 6 months
 
+# Override to replay against a local stand-in (Final_Project/benchmarks/stub_upstream.py)
+BINANCE_BASE_URL = os.environ.get("BINANCE_BASE_URL", "https://api.binance.com/api/v3").rstrip("/")
+
 rows = []
 
 for crypto, symbol in COINS.items():
-    url = "https://api.binance.com/api/v3/klines"
+    url = f"{BINANCE_BASE_URL}/klines"
     params = {
         "symbol": symbol,
         "interval": "1d",